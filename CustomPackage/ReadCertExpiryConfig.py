@@ -8,12 +8,27 @@
 ###########################################################################
 """ReadCertExpiryConfig"""
 
+import datetime
 import json
 import logging
+import os
 import globalSetting
 
 
 class ReadCertExpiryConfig:
+    @staticmethod
+    def get_numeric_setting(name, default, value_type=int,
+                            allow_zero=False):
+        """Return a positive numeric config value, or the default when the
+        value is missing or invalid."""
+        value = globalSetting.confData.get(name, default)
+        if isinstance(value, str) and value.isdigit():
+            value = int(value)
+        if isinstance(value, bool) or not isinstance(value, value_type) \
+                or value < 0 or (value == 0 and not allow_zero):
+            return default
+        return value
+
     @staticmethod
     def config_load_json():
         try:
@@ -112,6 +127,16 @@ class ReadCertExpiryConfig:
                     'Config parameter expired_cert_notify_only_once is'
                     ' missing or invalid. Proceeding with default value: yes.')
 
+            run_date = configurationData.get('run_date')
+            if run_date:
+                try:
+                    datetime.date.fromisoformat(run_date)
+                except (TypeError, ValueError):
+                    logging.info(
+                        'Config parameter run_date is invalid, expected'
+                        ' YYYY-MM-DD or empty for the current date.')
+                    missing_data.append('run_date')
+
             notification_duration = configurationData.get(
                 'notification_duration')
             if not notification_duration or not isinstance(
@@ -121,14 +146,181 @@ class ReadCertExpiryConfig:
                     ' or invalid. Proceeding with default value: True for'
                     ' all supported notification duration')
 
+            notification_thresholds = configurationData.get(
+                'notification_thresholds')
+            if not notification_thresholds or not isinstance(
+                    notification_thresholds, list) or not all(
+                    isinstance(threshold, int) and
+                    not isinstance(threshold, bool) and threshold >= 0
+                    for threshold in notification_thresholds):
+                logging.info(
+                    'Config parameter notification_thresholds is missing or'
+                    ' invalid. Proceeding with default value: '
+                    '[90, 60, 30, 7, 1]. Invalid thresholds are ignored.')
+
             max_retries = configurationData.get(
                 'max_retries')
-            if not max_retries or not isinstance(
-                    max_retries, str):
+            if max_retries is None or isinstance(max_retries, bool) or \
+                    not isinstance(max_retries, (int, str)):
                 logging.info(
                     'Config parameter max_retries is'
                     ' missing or invalid. Proceeding with default value: 3.')
 
+            for backoff_name, default_backoff in (
+                    ('retry_backoff_base', 5),
+                    ('retry_backoff_max', 300),
+                    ('retry_time_budget', 1800)):
+                backoff_value = configurationData.get(backoff_name)
+                if not backoff_value or not isinstance(
+                        backoff_value, (int, float)):
+                    logging.info(
+                        f'Config parameter {backoff_name} is missing or'
+                        ' invalid. Proceeding with default value: '
+                        f'{default_backoff}.')
+
+            max_concurrent_requests = configurationData.get(
+                'max_concurrent_requests')
+            if not max_concurrent_requests or not isinstance(
+                    max_concurrent_requests, int):
+                logging.info(
+                    'Config parameter max_concurrent_requests is'
+                    ' missing or invalid. Proceeding with default value: 4.')
+
+            http_pool_size = configurationData.get('http_pool_size')
+            if not http_pool_size or not isinstance(http_pool_size, int):
+                logging.info(
+                    'Config parameter http_pool_size is missing or invalid.'
+                    ' Proceeding with default value: max_concurrent_requests.')
+
+            for timeout_name, default_timeout in (('connect_timeout', 10),
+                                                  ('read_timeout', 60)):
+                timeout_value = configurationData.get(timeout_name)
+                if not timeout_value or not isinstance(
+                        timeout_value, (int, float)):
+                    logging.info(
+                        f'Config parameter {timeout_name} is missing or'
+                        ' invalid. Proceeding with default value: '
+                        f'{default_timeout}.')
+
+            incremental_sync = configurationData.get('incremental_sync')
+            if not isinstance(incremental_sync, bool):
+                logging.info(
+                    'Config parameter incremental_sync is missing or'
+                    ' invalid. Proceeding with default value: false.')
+            elif incremental_sync and not configurationData.get(
+                    'incremental_sync_param'):
+                logging.info(
+                    'Config parameter incremental_sync_param is missing.'
+                    ' Full sync will be performed on every run.')
+
+            full_sync_interval_days = configurationData.get(
+                'full_sync_interval_days')
+            if not full_sync_interval_days or not isinstance(
+                    full_sync_interval_days, int):
+                logging.info(
+                    'Config parameter full_sync_interval_days is missing or'
+                    ' invalid. Proceeding with default value: 7.')
+
+            bookmark_backend = configurationData.get('bookmark_backend')
+            if bookmark_backend not in ('csv', 'binary', 'sqlite'):
+                logging.info(
+                    'Config parameter bookmark_backend is missing or'
+                    ' invalid. Proceeding with default value: csv.')
+
+            for smtp_setting, default_value in (
+                    ('smtp_pool_size', 1),
+                    ('smtp_timeout', 30),
+                    ('smtp_max_messages_per_connection', 100),
+                    ('smtp_batch_size', 50),
+                    ('smtp_workers', 1)):
+                setting_value = configurationData.get(smtp_setting)
+                if not setting_value or not isinstance(
+                        setting_value, (int, float)):
+                    logging.info(
+                        f'Config parameter {smtp_setting} is missing or'
+                        ' invalid. Proceeding with default value: '
+                        f'{default_value}.')
+
+            smtp_max_messages_per_second = configurationData.get(
+                'smtp_max_messages_per_second')
+            if isinstance(smtp_max_messages_per_second, bool) or \
+                    not isinstance(smtp_max_messages_per_second,
+                                   (int, float)) or \
+                    smtp_max_messages_per_second < 0:
+                logging.info(
+                    'Config parameter smtp_max_messages_per_second is missing'
+                    ' or invalid. Proceeding with default value: 0'
+                    ' (unlimited).')
+
+            email_delivery_mode = configurationData.get(
+                'email_delivery_mode')
+            if email_delivery_mode not in ('per_cert', 'digest'):
+                logging.info(
+                    'Config parameter email_delivery_mode is missing or'
+                    ' invalid. Proceeding with default value: per_cert.')
+
+            inventory_snapshot = configurationData.get('inventory_snapshot')
+            if not isinstance(inventory_snapshot, bool):
+                logging.info(
+                    'Config parameter inventory_snapshot is missing or'
+                    ' invalid. Proceeding with default value: true.')
+
+            inventory_snapshot_directory = configurationData.get(
+                'inventory_snapshot_directory')
+            if not inventory_snapshot_directory or not isinstance(
+                    inventory_snapshot_directory, str):
+                logging.info(
+                    'Config parameter inventory_snapshot_directory is missing'
+                    ' or invalid. Proceeding with default value: snapshots.')
+
+            inventory_snapshot_retention = configurationData.get(
+                'inventory_snapshot_retention')
+            if not inventory_snapshot_retention or isinstance(
+                    inventory_snapshot_retention, bool) or not isinstance(
+                    inventory_snapshot_retention, int):
+                logging.info(
+                    'Config parameter inventory_snapshot_retention is missing'
+                    ' or invalid. Proceeding with default value: 7.')
+
+            inventory_snapshot_compression = configurationData.get(
+                'inventory_snapshot_compression')
+            if inventory_snapshot_compression not in (
+                    'zstd', 'lz4', 'uncompressed'):
+                logging.info(
+                    'Config parameter inventory_snapshot_compression is'
+                    ' missing or invalid. Proceeding with default value:'
+                    ' zstd.')
+
+            replay_snapshot = configurationData.get('replay_snapshot')
+            if replay_snapshot and (not isinstance(replay_snapshot, str) or
+                                    not os.path.isfile(os.path.join(
+                                        replay_snapshot, 'manifest.json'))):
+                logging.info(
+                    'Config parameter replay_snapshot is invalid, expected'
+                    ' the directory of a complete inventory snapshot or'
+                    ' empty to fetch from the SSLAPI.')
+                missing_data.append('replay_snapshot')
+
+            execution_mode = configurationData.get('execution_mode')
+            if execution_mode not in ('sync', 'async'):
+                logging.info(
+                    'Config parameter execution_mode is missing or invalid.'
+                    ' Proceeding with default value: sync.')
+
+            run_report_path = configurationData.get('run_report_path')
+            if not isinstance(run_report_path, str):
+                logging.info(
+                    'Config parameter run_report_path is missing or invalid.'
+                    ' Proceeding with default value: run_report.json.')
+
+            metrics_textfile_path = configurationData.get(
+                'metrics_textfile_path')
+            if not isinstance(metrics_textfile_path, str):
+                logging.info(
+                    'Config parameter metrics_textfile_path is missing or'
+                    ' invalid. Proceeding with default value:'
+                    ' cert_expiry_notification.prom.')
+
             if missing_data:
                 logging.error('Mandatory config parameters either missing '
                               'in the config file or not having expected '
@@ -1,15 +1,36 @@
-from .get_certificate_data import GetCertificateData
-from .bookmark_handler import BookmarkHandler
-from .ReadCertExpiryConfig import ReadCertExpiryConfig
-from .email_handler import EmailHandler
+import importlib
 from .ServerResponseHandler import ServerResponseHandler
-from CertExpiryLogger import CertExpiryLogger
-from .MessageDirectory import MessageDictionary
 
-GetCertificateData = GetCertificateData()
-BookmarkHandler = BookmarkHandler()
-config_reader = ReadCertExpiryConfig()
-EmailHandler = EmailHandler()
+# The handler singletons are created on first access (PEP 562), so
+# importing the package neither loads numpy and requests nor opens the
+# log file. ServerResponseHandler shares its name with its module, which
+# would shadow a lazy singleton once the module is imported, and stays
+# eager; it only needs logging.
+_SINGLETONS = {
+    "GetCertificateData": (".get_certificate_data", "GetCertificateData"),
+    "BookmarkHandler": (".bookmark_handler", "BookmarkHandler"),
+    "config_reader": (".ReadCertExpiryConfig", "ReadCertExpiryConfig"),
+    "EmailHandler": (".email_handler", "EmailHandler"),
+    "cert_expiry_logger": ("CertExpiryLogger", "CertExpiryLogger"),
+    "messageHandler": (".MessageDirectory", "MessageDictionary"),
+    "SyncWatermark": (".sync_watermark", "SyncWatermark"),
+    "RunClock": (".run_clock", "RunClock"),
+    "AsyncCertExpiryEngine": (".async_engine", "AsyncCertExpiryEngine"),
+    "RunMetrics": (".run_metrics", "RunMetrics"),
+}
+
 ServerResponseHandler = ServerResponseHandler()
-cert_expiry_logger = CertExpiryLogger()
-messageHandler = MessageDictionary()
+
+
+def __getattr__(name):
+    if name not in _SINGLETONS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, class_name = _SINGLETONS[name]
+    module = importlib.import_module(module_name, __name__)
+    singleton = getattr(module, class_name)()
+    globals()[name] = singleton
+    return singleton
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_SINGLETONS))
@@ -0,0 +1,231 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: async_certificate_fetcher
+# Description: asyncio counterpart of GetCertificateData for the async
+#              execution mode. Pages every configured endpoint at once
+#              with aiohttp on the running event loop. Each endpoint has
+#              its own semaphore of max_concurrent_requests and keeps at
+#              most twice as many pages ahead of the consumer; pages are
+#              handed over in page order with the same retry, delta sync,
+#              snapshot and statistics handling as the sync path.
+#
+###########################################################################
+"""AsyncCertificateFetcher Class"""
+
+import asyncio
+import logging
+import time
+import globalSetting
+from CustomPackage.get_certificate_data import GetCertificateData
+from CustomPackage.inventory_snapshot import InventorySnapshot
+from CustomPackage.ReadCertExpiryConfig import ReadCertExpiryConfig
+from CustomPackage.retry_scheduler import RetryScheduler
+from CustomPackage.run_metrics import RunMetrics
+from CustomPackage.sync_watermark import SyncWatermark
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+SUCCESS_STATUS_CODES = (200, 202)
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+
+class PageConsumerError(Exception):
+    """Wraps an exception of the page consumer, so it is not handled as a
+    failed page."""
+
+
+class AsyncCertificateFetcher:
+    def __init__(self):
+        self.max_concurrent_requests = \
+            ReadCertExpiryConfig.get_numeric_setting(
+                'max_concurrent_requests', 4)
+        self.scheduler = GetCertificateData.new_retry_scheduler()
+        self.snapshot = InventorySnapshot.from_config()
+
+    async def fetch_all(self, page_consumer):
+        """Fetch every configured endpoint concurrently, awaiting
+        page_consumer(certs) for each page. Sets the endpoint and retry
+        statistics of GetCertificateData like the sync path does."""
+        cert_endpoints = list(
+            globalSetting.confData['cert_endpoints'].items())
+        GetCertificateData.endpoint_statistics = {}
+        headers = {"Authorization": "SSLAPI api_key=\""
+                   f"{globalSetting.confData['api_key']}\""}
+        timeout = aiohttp.ClientTimeout(
+            connect=ReadCertExpiryConfig.get_numeric_setting(
+                'connect_timeout', 10, (int, float)),
+            sock_read=ReadCertExpiryConfig.get_numeric_setting(
+                'read_timeout', 60, (int, float)))
+        connector = aiohttp.TCPConnector(
+            limit_per_host=ReadCertExpiryConfig.get_numeric_setting(
+                'http_pool_size', self.max_concurrent_requests))
+
+        async with aiohttp.ClientSession(
+                headers=headers, timeout=timeout,
+                connector=connector) as session:
+            endpoint_tasks = [asyncio.create_task(self.fetch_endpoint(
+                session, endpoint, url, page_consumer))
+                for endpoint, url in cert_endpoints]
+            try:
+                results = await asyncio.gather(*endpoint_tasks)
+            except BaseException:
+                # The other endpoints are stopped before the session
+                # closes, their pages would otherwise fail on the closed
+                # session and be reported as failed pages.
+                for task in endpoint_tasks:
+                    task.cancel()
+                await asyncio.gather(*endpoint_tasks, return_exceptions=True)
+                raise
+
+        for (endpoint, _), statistics in zip(cert_endpoints, results):
+            GetCertificateData.endpoint_statistics[endpoint] = statistics
+        if self.snapshot is not None:
+            await asyncio.to_thread(
+                self.snapshot.write, GetCertificateData.endpoint_statistics)
+
+        GetCertificateData.retry_statistics = self.scheduler.statistics()
+        logging.info(
+            "SSLAPI retries: "
+            f"{GetCertificateData.retry_statistics['retry_attempts']} "
+            "attempts, "
+            f"{GetCertificateData.retry_statistics['backoff_seconds']}s "
+            "total backoff")
+
+    async def fetch_endpoint(self, session, endpoint, url, page_consumer):
+        delta_params = SyncWatermark.get_delta_params(endpoint, url)
+        statistics = GetCertificateData.new_endpoint_statistics(
+            endpoint, url, delta_params)
+        start_time = time.monotonic()
+        logging.info(
+            f"Fetching the certificates from endpoint {statistics['url']}")
+
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        window = self.max_concurrent_requests * 2
+        tasks = {}
+        failed_pages = {}
+
+        def schedule(total_pages):
+            for page in range(next_page, min(next_page + window,
+                                             total_pages)):
+                if page not in tasks:
+                    tasks[page] = asyncio.create_task(self.fetch_page(
+                        session, semaphore, statistics, url, page,
+                        delta_params))
+
+        # Page 0 seeds the page count, every later response may still move
+        # it when the inventory changes during the run.
+        next_page = 0
+        total_pages = 1
+        try:
+            while next_page < total_pages:
+                schedule(total_pages)
+                page_data, reason = await tasks.pop(next_page)
+                if page_data is None:
+                    failed_pages[next_page] = reason
+                    next_page += 1
+                    continue
+
+                reported_pages = max(
+                    page_data.get("totalPages") or total_pages,
+                    next_page + 1)
+                if next_page and reported_pages != total_pages:
+                    logging.info(
+                        f"Total pages for {statistics['url']} changed from "
+                        f"{total_pages} to {reported_pages} at page "
+                        f"{next_page}")
+                for page in [page for page in tasks
+                             if page >= reported_pages]:
+                    tasks.pop(page).cancel()
+                total_pages = reported_pages
+                statistics["total_pages"] = total_pages
+
+                certs = page_data.get("certs", [])
+                GetCertificateData.track_max_cert_id(
+                    statistics, certs, delta_params)
+                if self.snapshot is not None:
+                    self.snapshot.add_page(endpoint, certs)
+                try:
+                    await page_consumer(certs)
+                except Exception as e:
+                    raise PageConsumerError() from e
+                statistics["certificates"] += len(certs)
+                statistics["pages_fetched"] += 1
+                logging.info(
+                    f"Fetched page {next_page} from {statistics['url']}")
+                next_page += 1
+        except PageConsumerError as e:
+            # An ingest failure fails the run as in the sync execution
+            # mode, the bookmark is not committed.
+            raise e.__cause__
+        except Exception as e:
+            reason = ("Exception while processing response from "
+                      f"{statistics['url']} for page number {next_page}."
+                      f" Exception during processing : {e}")
+            failed_pages.setdefault(next_page, reason)
+            logging.error(reason)
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+        # The internal email of failed pages is sent with the sync sender.
+        return await asyncio.to_thread(
+            GetCertificateData.finish_endpoint_statistics,
+            statistics, failed_pages, start_time)
+
+    async def fetch_page(self, session, semaphore, statistics, url, page,
+                         delta_params):
+        """Fetch one page, retrying with the delays of the retry scheduler.
+        Returns (page_data, reason); page_data is None when the page could
+        not be fetched."""
+        truncated_url = statistics["url"]
+        params = {"pageNumber": page}
+        if delta_params:
+            params.update(delta_params)
+        attempt = 0
+        while True:
+            retry_after = None
+            async with semaphore, RunMetrics.phase(
+                    "fetch_page", endpoint=statistics["endpoint"]):
+                try:
+                    async with session.get(url, params=params) as response:
+                        if response.status in SUCCESS_STATUS_CODES:
+                            page_data = await response.json(
+                                content_type=None)
+                            if attempt:
+                                logging.info(
+                                    f"Retry Succeeded for ({truncated_url})"
+                                    f", Page {page}, Retry: {attempt}")
+                            return page_data, None
+                        reason = ("HTTP response code is "
+                                  f"{response.status} {response.reason}")
+                        logging.info(reason)
+                        if response.status not in RETRY_STATUS_CODES:
+                            logging.error(
+                                'Unexpected HTTP response from '
+                                f'({truncated_url}), Response received is '
+                                f'{response.status}')
+                            return None, reason
+                        retry_after = RetryScheduler.parse_retry_after(
+                            response.headers.get("Retry-After"))
+                except (aiohttp.ClientError, asyncio.TimeoutError,
+                        ValueError) as e:
+                    reason = ("Exception while processing response from "
+                              f"{truncated_url} for page number {page}. "
+                              f"Exception during processing : {e}")
+
+            delay = self.scheduler.next_delay(attempt, retry_after)
+            if delay is None:
+                logging.error(f"Max retries reached for ({truncated_url}),"
+                              f" Page {page}, page will not be processed in"
+                              " this run")
+                return None, reason
+            logging.info(f"Retrying request for ({truncated_url}), Page "
+                         f"{page}, Retry: {attempt + 1} in {delay:.1f}s")
+            statistics["retries"] += 1
+            await asyncio.sleep(delay)
+            attempt += 1
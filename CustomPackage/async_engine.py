@@ -0,0 +1,238 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: async_engine
+# Description: Optional async execution mode of the job, selected with the
+#       --async command line flag or the execution_mode config parameter.
+#       The certificates of both endpoints are fetched, ingested into the
+#       bookmark and notified on a single event loop:
+#   a)The emails of the certificates already bookmarked are queued before
+#       the first page is requested.
+#   b)Fetched pages are normalized in chunks on a worker thread, the new
+#       certificates due for an email are queued as soon as their chunk is
+#       normalized.
+#   c)smtp_workers sending tasks drain the queue over aiosmtplib while the
+#       later pages are still arriving.
+#       Requires aiohttp and aiosmtplib; without them the job runs in the
+#       default sync execution mode.
+#
+###########################################################################
+"""AsyncCertExpiryEngine Class"""
+
+import asyncio
+import functools
+import importlib.util
+import logging
+import globalSetting
+from cert_expiry_utility import CertExpiryUtility
+from CustomPackage.bookmark_handler import BookmarkHandler, \
+    INGEST_CHUNK_SIZE
+from CustomPackage.email_handler import EmailHandler
+from CustomPackage.email_template import EmailTemplateRegistry, \
+    NOTIFICATION_TEMPLATE, DIGEST_TEMPLATE
+from CustomPackage.ReadCertExpiryConfig import ReadCertExpiryConfig
+from CustomPackage.run_metrics import RunMetrics
+
+_STOP = object()
+
+
+class AsyncCertExpiryEngine:
+    @staticmethod
+    def is_selected(execution_mode=None):
+        """Return True when the run should use the async execution mode."""
+        if not execution_mode:
+            execution_mode = globalSetting.confData.get(
+                'execution_mode', 'sync')
+        if execution_mode != 'async':
+            return False
+        # aiohttp and aiosmtplib are only imported by an async run.
+        if importlib.util.find_spec('aiohttp') is None or \
+                importlib.util.find_spec('aiosmtplib') is None:
+            logging.info("aiohttp and aiosmtplib are required for the async"
+                         " execution mode. Proceeding with the sync"
+                         " execution mode.")
+            return False
+        if globalSetting.confData.get('replay_snapshot'):
+            logging.info("Inventory snapshot replay runs in the sync "
+                         "execution mode.")
+            return False
+        logging.info("Running in the async execution mode.")
+        return True
+
+    def run(self, bookmark, notify=True):
+        """Fetch, ingest and, when notify is set, send the expiry emails.
+        Returns the cert_infos whose email was accepted by the SMTP
+        server."""
+        return asyncio.run(self.run_async(bookmark, notify))
+
+    async def run_async(self, bookmark, notify):
+        from CustomPackage.async_smtp_sender import AsyncSMTPSender, \
+            AsyncRateLimiter
+
+        delivered = []
+        outbox = asyncio.Queue()
+        digest_certs = [] if notify and \
+            AsyncCertExpiryEngine.use_digest() else None
+        notification_template = EmailTemplateRegistry.get(
+            NOTIFICATION_TEMPLATE) if notify else None
+
+        def queue_emails(cert_infos):
+            if digest_certs is not None:
+                digest_certs.extend(cert_infos)
+                return
+            for cert_info in cert_infos:
+                outbox.put_nowait((
+                    [cert_info], f"certificate ID: {cert_info['CID']}",
+                    functools.partial(
+                        EmailHandler.build_email_for_cert_expiry,
+                        cert_info, notification_template)))
+
+        smtp_sender = None
+        senders = []
+        if notify:
+            workers = ReadCertExpiryConfig.get_numeric_setting(
+                'smtp_workers', 1)
+            smtp_sender = AsyncSMTPSender(
+                globalSetting.confData['smtp_server'],
+                globalSetting.confData['smtp_port'],
+                pool_size=max(
+                    ReadCertExpiryConfig.get_numeric_setting(
+                        'smtp_pool_size', 1), workers),
+                timeout=ReadCertExpiryConfig.get_numeric_setting(
+                    'smtp_timeout', 30, (int, float)),
+                max_messages_per_connection=ReadCertExpiryConfig.
+                get_numeric_setting('smtp_max_messages_per_connection', 100))
+            rate_limiter = AsyncRateLimiter(
+                ReadCertExpiryConfig.get_numeric_setting(
+                    'smtp_max_messages_per_second', 0, (int, float)))
+            senders = [asyncio.create_task(self.send_emails(
+                outbox, smtp_sender, rate_limiter, delivered))
+                for _ in range(workers)]
+
+        try:
+            if notify and bookmark.exists():
+                queue_emails(CertExpiryUtility.get_due_certs(
+                    CertExpiryUtility.load_bookmark_data(bookmark)))
+            await self.fetch_and_ingest(
+                bookmark, queue_emails if notify else None)
+            if digest_certs:
+                self.queue_digest_emails(outbox, digest_certs)
+        except BaseException:
+            # Emails sent without being bookmarked would be sent again.
+            for sender in senders:
+                sender.cancel()
+            raise
+        finally:
+            for _ in senders:
+                outbox.put_nowait(_STOP)
+            await asyncio.gather(*senders, return_exceptions=True)
+            if smtp_sender is not None:
+                await smtp_sender.close()
+                AsyncCertExpiryEngine.log_smtp_statistics(
+                    smtp_sender.statistics())
+
+        for cert_info in delivered:
+            cert_info["Notified"] = "Y"
+        return delivered
+
+    @staticmethod
+    def use_digest():
+        if globalSetting.confData.get('email_delivery_mode') != 'digest':
+            return False
+        if globalSetting.digest_email_template_missing:
+            logging.error("Digest Email Template Missing. Sending one "
+                          "email per certificate.")
+            return False
+        return True
+
+    @staticmethod
+    def queue_digest_emails(outbox, cert_infos):
+        template = EmailTemplateRegistry.get(DIGEST_TEMPLATE)
+        groups = {}
+        for cert_info in cert_infos:
+            groups.setdefault(
+                (EmailHandler.get_receiver_email(cert_info),
+                 cert_info['Bucket']), []).append(cert_info)
+        for (receiver_email, bucket), group in groups.items():
+            outbox.put_nowait((
+                group,
+                f"digest to {receiver_email} for bucket {bucket} with "
+                f"certificate IDs: {[info['CID'] for info in group]}",
+                functools.partial(EmailHandler.build_digest_email,
+                                  receiver_email, bucket, group, template)))
+
+    async def fetch_and_ingest(self, bookmark, queue_emails=None):
+        """Fetch both endpoints and add their new certificates to the
+        bookmark, queueing the emails of the new certificates already due
+        chunk by chunk."""
+        from CustomPackage.async_certificate_fetcher import \
+            AsyncCertificateFetcher
+
+        existing_cids = bookmark.existing_cids()
+        new_certificates = []
+        error_certificates = []
+        pending = []
+        ingest_lock = asyncio.Lock()
+
+        async def ingest(chunk):
+            # One chunk at a time, so a CID served by both endpoints is
+            # only added once.
+            async with ingest_lock, RunMetrics.phase("normalize"):
+                new_rows, chunk_errors = await asyncio.to_thread(
+                    BookmarkHandler.normalize_certificates, chunk,
+                    existing_cids)
+                existing_cids.update(new_rows.values('CID'))
+                new_certificates.append(new_rows)
+                error_certificates.extend(chunk_errors)
+            if queue_emails is not None and len(new_rows):
+                queue_emails(CertExpiryUtility.get_due_certs(
+                    new_rows.to_cert_infos()))
+
+        async def consume_page(certs):
+            # Pages arriving while a chunk is being normalized are batched
+            # into the next chunk, so emails are queued without waiting for
+            # a full INGEST_CHUNK_SIZE.
+            pending.extend(certs)
+            if len(pending) >= INGEST_CHUNK_SIZE or \
+                    not ingest_lock.locked():
+                chunk = pending[:]
+                pending.clear()
+                await ingest(chunk)
+
+        await AsyncCertificateFetcher().fetch_all(consume_page)
+        if pending:
+            await ingest(pending[:])
+        await asyncio.to_thread(
+            BookmarkHandler.add_new_certificates,
+            new_certificates, error_certificates, bookmark)
+
+    @staticmethod
+    async def send_emails(outbox, smtp_sender, rate_limiter, delivered):
+        from CustomPackage.async_smtp_sender import aiosmtplib
+
+        while True:
+            item = await outbox.get()
+            if item is _STOP:
+                return
+            cert_infos, description, build_email = item
+            sender_email, receiver_email, message = build_email()
+            await rate_limiter.acquire()
+            try:
+                await smtp_sender.send(sender_email, receiver_email,
+                                       message)
+                logging.info(f"Email sent for {description}")
+                delivered.extend(cert_infos)
+            except (aiosmtplib.SMTPException, OSError) as e:
+                logging.error(
+                    "Exception during processing of send external email"
+                    f" for {description}. Exception : {e}")
+
+    @staticmethod
+    def log_smtp_statistics(statistics):
+        EmailHandler.record_smtp_metrics(statistics)
+        logging.info(
+            f"Async SMTP: {statistics['messages_sent']} sent, "
+            f"{statistics['messages_failed']} failed over "
+            f"{statistics['connections_opened']} connections "
+            f"({statistics['reconnects']} reconnects), average "
+            f"{statistics['average_send_ms']} ms per message")
@@ -0,0 +1,165 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: async_smtp_sender
+# Description: asyncio counterpart of SMTPSender for the async execution
+#              mode. Keeps up to pool_size aiosmtplib connections open for
+#              the run, recycles a connection after
+#              max_messages_per_connection messages, reconnects once when
+#              the server dropped a connection and records the same
+#              metrics as SMTPSender. AsyncRateLimiter caps the messages
+#              sent per second across every sending task.
+#
+###########################################################################
+"""AsyncSMTPSender Class"""
+
+import asyncio
+import logging
+import time
+
+try:
+    import aiosmtplib
+except ImportError:
+    aiosmtplib = None
+
+
+class AsyncRateLimiter:
+    def __init__(self, max_per_second):
+        self.max_per_second = max_per_second
+        self._tokens = float(max_per_second or 0)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until one message may be sent."""
+        if not self.max_per_second:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self._tokens + (now - self._updated) *
+                    self.max_per_second,
+                    float(self.max_per_second))
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep(
+                    (1 - self._tokens) / self.max_per_second)
+
+
+class AsyncSMTPSender:
+    def __init__(self, smtp_server, smtp_port, pool_size=1, timeout=30,
+                 max_messages_per_connection=100):
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.timeout = timeout
+        self.max_messages_per_connection = max_messages_per_connection
+        self._idle_connections = []
+        self._connection_slots = asyncio.Semaphore(pool_size)
+        self.connections_opened = 0
+        self.reconnects = 0
+        self.messages_sent = 0
+        self.messages_failed = 0
+        self.send_seconds = 0.0
+        self.max_send_seconds = 0.0
+
+    async def _open_connection(self):
+        # Like smtplib.SMTP in the sync path, no STARTTLS is negotiated.
+        connection = aiosmtplib.SMTP(
+            hostname=self.smtp_server, port=self.smtp_port,
+            timeout=self.timeout, start_tls=False)
+        await connection.connect()
+        connection.messages_sent = 0
+        self.connections_opened += 1
+        return connection
+
+    @staticmethod
+    async def _quit(connection):
+        try:
+            await connection.quit()
+        except (aiosmtplib.SMTPException, OSError):
+            connection.close()
+
+    async def _acquire_connection(self):
+        await self._connection_slots.acquire()
+        if self._idle_connections:
+            return self._idle_connections.pop()
+        try:
+            return await self._open_connection()
+        except BaseException:
+            self._connection_slots.release()
+            raise
+
+    async def _release_connection(self, connection):
+        if connection is not None:
+            if connection.messages_sent < self.max_messages_per_connection:
+                self._idle_connections.append(connection)
+            else:
+                await self._quit(connection)
+        self._connection_slots.release()
+
+    async def _send_on(self, connection, sender_email, receiver_email,
+                       message):
+        """Send one message on the given connection, reconnecting once if
+        the server dropped it. Returns the connection to keep using."""
+        start_time = time.perf_counter()
+        try:
+            try:
+                await connection.sendmail(
+                    sender_email, [receiver_email], message)
+            except (aiosmtplib.SMTPServerDisconnected, ConnectionError):
+                connection.close()
+                connection = await self._open_connection()
+                self.reconnects += 1
+                try:
+                    await connection.sendmail(
+                        sender_email, [receiver_email], message)
+                except BaseException:
+                    connection.close()
+                    raise
+        except aiosmtplib.SMTPException:
+            self.messages_failed += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start_time
+            self.send_seconds += elapsed
+            self.max_send_seconds = max(self.max_send_seconds, elapsed)
+            logging.debug(f"SMTP send to {receiver_email} took "
+                          f"{elapsed * 1000:.1f} ms")
+
+        connection.messages_sent += 1
+        self.messages_sent += 1
+        return connection
+
+    async def send(self, sender_email, receiver_email, message):
+        """Send one message. Raises aiosmtplib.SMTPException on failure."""
+        connection = await self._acquire_connection()
+        try:
+            connection = await self._send_on(
+                connection, sender_email, receiver_email, message)
+        except BaseException:
+            connection.close()
+            connection = None
+            raise
+        finally:
+            await self._release_connection(connection)
+
+    def statistics(self):
+        attempted = self.messages_sent + self.messages_failed
+        return {
+            "connections_opened": self.connections_opened,
+            "reconnects": self.reconnects,
+            "messages_sent": self.messages_sent,
+            "messages_failed": self.messages_failed,
+            "send_seconds": round(self.send_seconds, 3),
+            "average_send_ms": round(
+                self.send_seconds * 1000 / attempted, 3)
+            if attempted else 0.0,
+            "max_send_ms": round(self.max_send_seconds * 1000, 3),
+        }
+
+    async def close(self):
+        while self._idle_connections:
+            await self._quit(self._idle_connections.pop())
@@ -2,7 +2,8 @@
 #
 # Copyright (c) 2024 by Cisco Systems, Inc.
 # FileName: bookmark_handler
-# Description: Create and/or update the bookmark CSV file
+# Description: Create and/or update the bookmark through the configured
+#       bookmark store (CSV file or SQLite database)
 #       CID : Unique STO Certificate ID of the issued certificate
 #       Status : Current status of the certificate. Values can be
 #       {Active, Expired}
@@ -11,118 +12,185 @@
 """BookmarkHandler Class"""
 
 
-import os
+import itertools
 import logging
 import sys
-import pandas as pd
+import numpy as np
 from cert_expiry_utility import CertExpiryUtility
 from CustomPackage.email_handler import EmailHandler
+from CustomPackage.bookmark_records import BookmarkRecords, \
+    date_to_ordinal
+from CustomPackage.bookmark_store import get_bookmark_store
+from CustomPackage.bookmark_run_context import BookmarkRunContext
+from CustomPackage.run_metrics import RunMetrics
+
+INGEST_CHUNK_SIZE = 50000
 
 
 class BookmarkHandler:
-    def populate_bookmark(self, all_certificate_data):
-        bookmark_path = "bookmark.csv"
-        fieldnames = [
-            "CID",
-            "Status",
-            "ExpiryDate",
-            "Bucket",
-            "CN",
-            "SAN",
-            "Notified"]
+    def open_run_context(self):
+        try:
+            return BookmarkRunContext(
+                get_bookmark_store(),
+                CertExpiryUtility.get_schedule_signature())
+        except Exception as e:
+            logging.error(f"Error occurred while loading bookmark: {e}")
+            logging.info('Certificate Expiry Notification tool ended')
+            sys.exit()
 
+    def commit_run_context(self, bookmark_store):
         try:
-            if not os.path.exists(bookmark_path):
-                existing_data = pd.DataFrame(columns=fieldnames)
-            else:
-                existing_data = pd.read_csv(bookmark_path)
+            bookmark_store.commit()
+        except Exception as e:
+            logging.error(f"Error occurred while saving bookmark: {e}")
+            logging.info('Certificate Expiry Notification tool ended')
+            sys.exit()
+
+    @staticmethod
+    def normalize_certificates(certificates, existing_cids):
+        """Normalize a chunk of raw certificates into BookmarkRecords of
+        new bookmark rows in one columnar pass. Certificates already in
+        the bookmark are dropped. Expiry dates and subjects are
+        factorized, so each distinct value is parsed once. Returns the new
+        rows and the CIDs whose expiry date cannot be evaluated."""
+        certificates = [
+            cert for cert in certificates
+            if BookmarkHandler.get_cid(cert) not in existing_cids]
+        cids = [BookmarkHandler.get_cid(cert) for cert in certificates]
+
+        not_after_codes = {}
+        expiry_codes = np.fromiter(
+            (not_after_codes.setdefault(cert.get('notAfter'),
+                                        len(not_after_codes))
+             for cert in certificates), dtype=np.int64,
+            count=len(certificates))
+        expiry_ordinals = np.array(
+            [date_to_ordinal(str(not_after).split('T')[0])
+             for not_after in not_after_codes], dtype=np.int64)
+        buckets = CertExpiryUtility.get_buckets_for_expiry(
+            CertExpiryUtility.get_days_until_expiry_for_ordinals(
+                expiry_ordinals))[expiry_codes]
+        expiry_ordinals = expiry_ordinals[expiry_codes]
 
-            existing_data['CID'] = existing_data['CID'].astype(str)
+        # The first valid occurrence of a CID repeated in the payload wins.
+        valid = buckets != "Error"
+        seen_cids = set()
+        for index in np.flatnonzero(valid).tolist():
+            if cids[index] in seen_cids:
+                valid[index] = False
+            seen_cids.add(cids[index])
+        error_certificates = [
+            cid for cid, is_valid in zip(cids, valid.tolist())
+            if not is_valid and cid not in seen_cids]
 
-            existing_cids = set(existing_data['CID'])
+        indices = np.flatnonzero(valid).tolist()
+        subjects = [certificates[index].get('subject') for index in indices]
+        common_names = {
+            subject: CertExpiryUtility.get_cn_from_subject(subject)
+            for subject in set(subject for subject in subjects
+                               if isinstance(subject, str))}
+        new_certificates = BookmarkRecords.from_columns({
+            "CID": [cids[index] for index in indices],
+            "Status": [BookmarkHandler.get_text(
+                certificates[index].get('status')) for index in indices],
+            "ExpiryDate": expiry_ordinals[valid],
+            "Bucket": buckets[valid].tolist(),
+            "CN": [common_names[subject] if isinstance(subject, str)
+                   else "Unknown" for subject in subjects],
+            "SAN": [BookmarkHandler.get_san(certificates[index].get('sans'))
+                    for index in indices],
+            "Notified": "N",
+            "NextTransition": ""
+        })
+        return new_certificates, error_certificates
+
+    @staticmethod
+    def get_text(value):
+        """A raw certificate field as text, missing values as empty."""
+        return '' if value is None or value != value else str(value)
+
+    @staticmethod
+    def get_cid(cert):
+        return BookmarkHandler.get_text(cert.get('certId'))
+
+    @staticmethod
+    def get_san(san_entries):
+        return "[" + ";".join(san_entries) + "]" \
+            if isinstance(san_entries, list) and san_entries else ""
+
+    def populate_bookmark(self, all_certificate_data, bookmark_store=None):
+        try:
+            if bookmark_store is None:
+                bookmark_store = get_bookmark_store()
+            existing_cids = bookmark_store.existing_cids()
 
             new_certificates = []
             error_certificates = []
 
-            for cert in all_certificate_data:
-                cid = str(cert.get('certId', ''))
-                if cid not in existing_cids:
-                    not_after = cert.get('notAfter', '')
-                    expiry_date_str = not_after.split('T')[0]
-
-                    days_until_expiry = CertExpiryUtility.\
-                        get_days_until_expiry(expiry_date_str)
-
-                    if days_until_expiry is not None:
-                        bucket = CertExpiryUtility.get_bucket_for_expiry(
-                            days_until_expiry)
-
-                        if bucket != "Error":
-                            san_entries = cert.get('sans', [])
-                            san_str = "[" + ";".join(san_entries) + \
-                                "]" if san_entries else ""
-                            new_certificates.append({
-                                "CID": cid,
-                                "Status": cert.get("status", ""),
-                                "ExpiryDate": expiry_date_str,
-                                "Bucket": bucket,
-                                "CN": CertExpiryUtility.get_cn_from_subject
-                                (cert.get('subject', '')),
-                                "SAN": san_str,
-                                "Notified": "N"
-                            })
-                        else:
-                            logging.info(
-                                "Error while determining the bucket for "
-                                f"certificate : {cid}")
-                            error_certificates.append(cid)
-                    else:
-                        logging.error(
-                            "Error while calculating days remaining before"
-                            f" cert expiry for {cid}.")
-                        error_certificates.append(cid)
-
-            new_data = pd.DataFrame(new_certificates)
-
-            if not new_data.empty:
-                if existing_data.empty:
-                    existing_data = new_data
-                else:
-                    new_data = pd.DataFrame(
-                        new_certificates, columns=existing_data.columns)
-                    existing_data = pd.concat(
-                        [existing_data, new_data], ignore_index=True)
-                existing_data.sort_values(by=['ExpiryDate'], inplace=True)
-                existing_data.to_csv(bookmark_path, index=False)
-                logging.info("Bookmark updated with new certificates.")
-            else:
-                logging.info("No new certificates to add to the bookmark.")
-
-            if error_certificates:
-                logging.info(
-                    "Internal email triggered for notifying the processing"
-                    f" errors for CIDs : {error_certificates}")
-                EmailHandler.trigger_internal_email(
-                    f'Error while processing CIDs : {error_certificates}.')
+            # The certificates are normalized in chunks while the stream
+            # is still being fetched.
+            certificates = iter(all_certificate_data)
+            while True:
+                chunk = list(itertools.islice(
+                    certificates, INGEST_CHUNK_SIZE))
+                if not chunk:
+                    break
+                with RunMetrics.phase("normalize"):
+                    new_rows, chunk_errors = self.normalize_certificates(
+                        chunk, existing_cids)
+                existing_cids.update(new_rows.values('CID'))
+                new_certificates.append(new_rows)
+                error_certificates.extend(chunk_errors)
+
+            self.add_new_certificates(
+                new_certificates, error_certificates, bookmark_store)
 
         except Exception as e:
             logging.error(f"Error occurred while populating bookmark: {e}")
             logging.info('Certificate Expiry Notification tool ended')
             sys.exit()
 
-    def update_notified_cert_entry(self, certificates_sent_email):
-        bookmark_path = "bookmark.csv"
-        if not os.path.exists(bookmark_path):
-            logging.error(f"Bookmark file '{bookmark_path}' not found.")
+    @staticmethod
+    def add_new_certificates(new_certificates, error_certificates,
+                             bookmark_store):
+        """Insert the normalized records of new certificates in one go and
+        report the CIDs which could not be processed."""
+        for cid in error_certificates:
+            logging.error(
+                "Error while calculating days remaining before"
+                f" cert expiry for {cid}.")
+
+        new_certificates = BookmarkRecords.concat(new_certificates)
+        RunMetrics.increment("certificates_ingested", len(new_certificates))
+        RunMetrics.increment("certificate_errors", len(error_certificates))
+        if len(new_certificates):
+            bookmark_store.insert_rows(new_certificates)
+            logging.info("Bookmark updated with "
+                         f"{len(new_certificates)} new certificates.")
+        else:
+            logging.info("No new certificates to add to the bookmark.")
+
+        if error_certificates:
+            logging.info(
+                "Internal email triggered for notifying the processing"
+                f" errors for CIDs : {error_certificates}")
+            EmailHandler.trigger_internal_email(
+                f'Error while processing CIDs : {error_certificates}.')
+
+    def update_notified_cert_entry(self, certificates_sent_email,
+                                   bookmark_store=None):
+        if bookmark_store is None:
+            bookmark_store = get_bookmark_store()
+        if not bookmark_store.exists():
+            logging.error(f"Bookmark '{bookmark_store.path}' not found.")
             return
 
         try:
-            df = pd.read_csv(bookmark_path)
-            df.loc[df['CID'].astype(str).isin(
-                certificates_sent_email), 'Notified'] = 'Y'
-            df.to_csv(bookmark_path, index=False)
+            bookmark_store.mark_notified(certificates_sent_email)
 
-            self.log_bucket_for_certificates(certificates_sent_email, df)
+            self.log_bucket_for_certificates(
+                certificates_sent_email,
+                bookmark_store.load_bookmark(certificates_sent_email))
 
         except Exception as e:
             logging.error(
@@ -131,47 +199,53 @@ class BookmarkHandler:
             logging.info('Certificate Expiry Notification tool ended')
             sys.exit()
 
-    def move_certificates_to_new_bucket(self):
-        bookmark_path = "bookmark.csv"
-        if not os.path.exists(bookmark_path):
-            logging.error(f"Bookmark file '{bookmark_path}' not found.")
+    def get_bucket_changes(self, existing_data):
+        """Recompute the bucket of every row of the BookmarkRecords in one
+        vectorized pass. Returns the moved rows as (CID, previous bucket,
+        new bucket); rows whose expiry cannot be evaluated are logged and
+        skipped."""
+        days_until_expiry = CertExpiryUtility.\
+            get_days_until_expiry_for_ordinals(
+                existing_data.dates['ExpiryDate'])
+        new_buckets = CertExpiryUtility.get_buckets_for_expiry(
+            days_until_expiry)
+
+        error_mask = new_buckets == "Error"
+        for cid in existing_data.take(error_mask).values('CID'):
+            logging.error(
+                "Move Cert to New Bucket - Error while calculating "
+                f"days remaining before cert expiry for {cid}."
+                " Skipped ")
+
+        bucket_values = np.array(
+            BookmarkRecords.vocabularies['Bucket'].values, dtype=object)
+        moved_mask = ~error_mask & \
+            (new_buckets != bucket_values[existing_data.codes['Bucket']])
+        moved = existing_data.take(moved_mask)
+        return list(zip(moved.values('CID'), moved.values('Bucket'),
+                        new_buckets[moved_mask].tolist()))
+
+    def move_certificates_to_new_bucket(self, bookmark_store=None):
+        if bookmark_store is None:
+            bookmark_store = get_bookmark_store()
+        if not bookmark_store.exists():
+            logging.error(f"Bookmark '{bookmark_store.path}' not found.")
             return
-        existing_data = pd.read_csv(bookmark_path)
+        # Only the certificates due on the run date can change bucket.
+        existing_data = bookmark_store.load_due(
+            CertExpiryUtility.get_run_date())
 
         try:
-            existing_data['ExpiryDate'] = pd.to_datetime(
-                existing_data['ExpiryDate'])
-
-            for index, row in existing_data.iterrows():
-                expiry_date_str = row['ExpiryDate'].strftime("%Y-%m-%d")
-                days_until_expiry = CertExpiryUtility.get_days_until_expiry(
-                    expiry_date_str)
-
-                if days_until_expiry is None:
-                    logging.error(
-                        "Move Cert to New Bucket - Error while calculating "
-                        f"days remaining before cert expiry for {row['cid']}."
-                        " Skipped ")
-                    continue
-                else:
-                    new_bucket = CertExpiryUtility.get_bucket_for_expiry(
-                        days_until_expiry)
-
-                if new_bucket == "Error":
-                    logging.error(
-                        "Move Cert to New Bucket - Error while calculating "
-                        f"days remaining before cert expiry for {row['cid']}."
-                        " Skipped ")
-                    continue
-
-                if new_bucket != row["Bucket"]:
-                    logging.info(
-                        f"Certificate {row['CID']} moved from bucket "
-                        f"{row['Bucket']} to {new_bucket}")
-                    existing_data.loc[index, 'Bucket'] = new_bucket
-                    existing_data.loc[index, 'Notified'] = "N"
-
-            existing_data.to_csv(bookmark_path, index=False)
+            moved = self.get_bucket_changes(existing_data)
+
+            for cid, bucket, new_bucket in moved:
+                logging.info(
+                    f"Certificate {cid} moved from bucket "
+                    f"{bucket} to {new_bucket}")
+
+            bookmark_store.update_buckets(
+                (cid, new_bucket, "N") for cid, _, new_bucket in moved)
+            RunMetrics.increment("bucket_moves", len(moved))
 
         except Exception as e:
             logging.error(
@@ -180,10 +254,36 @@ class BookmarkHandler:
             logging.info('Certificate Expiry Notification tool ended')
             sys.exit()
 
-    def log_bucket_for_certificates(self, certificate_ids, df):
-        buckets = \
-            df[df['CID'].astype(str).isin(
-                certificate_ids)]['Bucket'].tolist()
+    def update_next_transitions(self, bookmark_store=None):
+        """Schedule the next processing date of every row due on the run
+        date."""
+        if bookmark_store is None:
+            bookmark_store = get_bookmark_store()
+        if not bookmark_store.exists():
+            return
+
+        try:
+            run_date = CertExpiryUtility.get_run_date()
+            due_data = bookmark_store.load_due(run_date)
+            next_transitions = CertExpiryUtility.get_next_transitions(
+                due_data, run_date)
+            changed = next_transitions != due_data.dates['NextTransition']
+            bookmark_store.update_transitions(zip(
+                due_data.take(changed).values('CID'),
+                BookmarkRecords.format_dates(next_transitions[changed])))
+            logging.info(
+                f"{len(due_data)} certificates processed for {run_date}, "
+                f"{int(changed.sum())} rescheduled.")
+
+        except Exception as e:
+            logging.error(
+                "Error while scheduling the next transition of certificates"
+                f" in bookmark. Exception : {e}")
+            logging.info('Certificate Expiry Notification tool ended')
+            sys.exit()
+
+    def log_bucket_for_certificates(self, certificate_ids, records):
+        buckets = records.select(certificate_ids).values('Bucket')
         logging.info('Updated bookmark to capture email notifications '
                      f'sent for CID: {", ".join(certificate_ids)} '
                      f'and bucket: {buckets}')
@@ -0,0 +1,420 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: bookmark_records
+# Description: Compact in-memory form of the bookmark, one array per
+#       column instead of a DataFrame of Python strings:
+#           CID : fixed width bytes, sorted through a lazily built index
+#                 for lookups by CID
+#           Status, Bucket, Notified : uint16 codes into process wide
+#                 vocabularies, so every distinct value is stored once
+#           ExpiryDate, NextTransition : int32 day ordinals, 0 for an
+#                 empty or unparsable date
+#           CN, SAN : UTF-8 bytes of the whole column with row offsets
+#       The records are read and written as bookmark CSV and as an
+#       uncompressed numpy archive (the binary bookmark backend).
+#
+###########################################################################
+"""BookmarkRecords Class"""
+
+import csv
+import datetime
+import functools
+import itertools
+import threading
+import numpy as np
+
+BOOKMARK_FIELDNAMES = [
+    "CID",
+    "Status",
+    "ExpiryDate",
+    "Bucket",
+    "CN",
+    "SAN",
+    "Notified",
+    "NextTransition"]
+
+CODED_FIELDS = ("Status", "Bucket", "Notified")
+DATE_FIELDS = ("ExpiryDate", "NextTransition")
+TEXT_FIELDS = ("CN", "SAN")
+
+NO_DATE = 0
+RECORDS_CHUNK_SIZE = 16384
+RECORDS_FORMAT_VERSION = 1
+
+
+@functools.lru_cache(maxsize=65536)
+def date_to_ordinal(value):
+    """Day ordinal of a YYYY-MM-DD date, NO_DATE if it is empty or cannot
+    be parsed."""
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d").toordinal()
+    except (TypeError, ValueError):
+        return NO_DATE
+
+
+@functools.lru_cache(maxsize=65536)
+def ordinal_to_date(ordinal):
+    if ordinal <= NO_DATE:
+        return ""
+    return datetime.date.fromordinal(ordinal).isoformat()
+
+
+class Vocabulary:
+    """Interned values of a coded column. Codes are never reassigned, so
+    records built at different times share them."""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+        self._lock = threading.Lock()
+
+    def add(self, value):
+        with self._lock:
+            code = self.codes.get(value)
+            if code is None:
+                if len(self.values) > np.iinfo(np.uint16).max:
+                    raise ValueError(f"Too many distinct values, cannot "
+                                     f"add {value!r}")
+                code = self.codes[value] = len(self.values)
+                self.values.append(value)
+            return code
+
+    def encode(self, values):
+        values = values if isinstance(values, list) else list(values)
+        for value in set(values).difference(self.codes):
+            self.add(value)
+        return np.fromiter(map(self.codes.__getitem__, values),
+                           dtype=np.uint16, count=len(values))
+
+    def decode(self, codes):
+        return [self.values[code] for code in codes.tolist()]
+
+    def mask(self, codes, values):
+        """Rows whose value is one of values."""
+        return np.isin(codes, [self.codes[value] for value in values
+                               if value in self.codes])
+
+
+class TextColumn:
+    """Strings of a column as one UTF-8 buffer and the offsets of every
+    row in it."""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @staticmethod
+    def encode(values):
+        encoded = [value.encode('utf-8') for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64,
+                              count=len(encoded)), out=offsets[1:])
+        return TextColumn(np.frombuffer(b"".join(encoded), dtype=np.uint8),
+                          offsets)
+
+    @staticmethod
+    def concat(columns):
+        offsets = [np.zeros(1, dtype=np.int64)]
+        size = 0
+        for column in columns:
+            offsets.append(column.offsets[1:] + size)
+            size += int(column.offsets[-1])
+        return TextColumn(
+            np.concatenate([column.data for column in columns]),
+            np.concatenate(offsets))
+
+    def take(self, indices):
+        starts = self.offsets[:-1][indices]
+        lengths = self.offsets[1:][indices] - starts
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # Position of every byte of the taken rows in self.data.
+        positions = np.arange(offsets[-1], dtype=np.int64) + \
+            np.repeat(starts - offsets[:-1], lengths)
+        return TextColumn(self.data[positions], offsets)
+
+    def decode(self, start=0, stop=None):
+        stop = len(self.offsets) - 1 if stop is None else stop
+        data = self.data[self.offsets[start]:self.offsets[stop]].tobytes()
+        bounds = (self.offsets[start:stop + 1] -
+                  self.offsets[start]).tolist()
+        return [data[begin:end].decode('utf-8')
+                for begin, end in zip(bounds, bounds[1:])]
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.offsets.nbytes
+
+
+class BookmarkRecords:
+    vocabularies = {field: Vocabulary() for field in CODED_FIELDS}
+
+    def __init__(self, cids, codes, dates, texts):
+        self.cids = cids
+        self.codes = codes
+        self.dates = dates
+        self.texts = texts
+        self._cid_index = None
+
+    @staticmethod
+    def empty():
+        return BookmarkRecords.from_columns(
+            {field: [] for field in BOOKMARK_FIELDNAMES})
+
+    @staticmethod
+    def encode_cids(cids):
+        cids = [cid.encode('utf-8') for cid in cids]
+        return np.array(cids, dtype=bytes) if cids else \
+            np.zeros(0, dtype="S1")
+
+    @staticmethod
+    def encode_dates(values):
+        return np.fromiter(map(date_to_ordinal, values), dtype=np.int32,
+                           count=len(values))
+
+    @staticmethod
+    def format_dates(ordinals):
+        return [ordinal_to_date(ordinal) for ordinal in ordinals.tolist()]
+
+    @staticmethod
+    def from_columns(columns):
+        """Build records from a dict of field to a sequence of strings.
+        Date fields may also be given as arrays of day ordinals and any
+        field but CID as a single value for every row."""
+        count = len(columns["CID"])
+        codes = {}
+        for field in CODED_FIELDS:
+            vocabulary = BookmarkRecords.vocabularies[field]
+            values = columns[field]
+            codes[field] = np.full(count, vocabulary.add(values),
+                                   dtype=np.uint16) \
+                if isinstance(values, str) else vocabulary.encode(values)
+        dates = {}
+        for field in DATE_FIELDS:
+            values = columns[field]
+            if isinstance(values, str):
+                dates[field] = np.full(count, date_to_ordinal(values),
+                                       dtype=np.int32)
+            elif isinstance(values, np.ndarray) and \
+                    values.dtype.kind in "iu":
+                dates[field] = values.astype(np.int32)
+            else:
+                dates[field] = BookmarkRecords.encode_dates(list(values))
+        texts = {}
+        for field in TEXT_FIELDS:
+            values = columns[field]
+            texts[field] = TextColumn.encode(
+                [values] * count if isinstance(values, str) else values)
+        return BookmarkRecords(BookmarkRecords.encode_cids(columns["CID"]),
+                               codes, dates, texts)
+
+    @staticmethod
+    def from_rows(rows, fieldnames=BOOKMARK_FIELDNAMES):
+        """Build records from rows of strings, converted a chunk at a time
+        so the rows are never all held as Python objects. Fields missing
+        from fieldnames are left empty."""
+        positions = {field: fieldnames.index(field)
+                     for field in BOOKMARK_FIELDNAMES
+                     if field in fieldnames}
+        rows = iter(rows)
+        parts = {field: [] for field in BOOKMARK_FIELDNAMES}
+        while True:
+            chunk = [row for row in itertools.islice(
+                rows, RECORDS_CHUNK_SIZE) if row]
+            if not chunk:
+                break
+            # Short rows are padded with empty fields.
+            columns = list(itertools.zip_longest(*chunk, fillvalue=""))
+            del chunk
+            records = BookmarkRecords.from_columns(
+                {field: list(columns[positions[field]])
+                 if field in positions else "" for field in
+                 BOOKMARK_FIELDNAMES})
+            for field in BOOKMARK_FIELDNAMES:
+                parts[field].append(records.column(field))
+        if not parts["CID"]:
+            return BookmarkRecords.empty()
+        return BookmarkRecords.from_parts(parts)
+
+    @staticmethod
+    def from_parts(parts):
+        """Join a dict of field to a list of column parts. Every list is
+        emptied once its column is joined, so parts no longer referenced
+        elsewhere are released before the next column is built."""
+        columns = {}
+        for field in BOOKMARK_FIELDNAMES:
+            columns[field] = TextColumn.concat(parts[field]) \
+                if field in TEXT_FIELDS else np.concatenate(parts[field])
+            parts[field].clear()
+        return BookmarkRecords(
+            columns["CID"],
+            {field: columns[field] for field in CODED_FIELDS},
+            {field: columns[field] for field in DATE_FIELDS},
+            {field: columns[field] for field in TEXT_FIELDS})
+
+    @staticmethod
+    def concat(records):
+        records = [part for part in records if len(part)]
+        if not records:
+            return BookmarkRecords.empty()
+        if len(records) == 1:
+            return records[0]
+        return BookmarkRecords.from_parts(
+            {field: [part.column(field) for part in records]
+             for field in BOOKMARK_FIELDNAMES})
+
+    def __len__(self):
+        return len(self.cids)
+
+    def column(self, field):
+        """The array, or TextColumn, holding field."""
+        if field == "CID":
+            return self.cids
+        if field in CODED_FIELDS:
+            return self.codes[field]
+        if field in DATE_FIELDS:
+            return self.dates[field]
+        return self.texts[field]
+
+    @property
+    def nbytes(self):
+        """Memory held by the columns."""
+        return self.cids.nbytes + \
+            sum(codes.nbytes for codes in self.codes.values()) + \
+            sum(dates.nbytes for dates in self.dates.values()) + \
+            sum(text.nbytes for text in self.texts.values())
+
+    def take(self, indices):
+        """Records of the given row indices or boolean mask."""
+        if isinstance(indices, np.ndarray) and indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        return BookmarkRecords(
+            self.cids[indices],
+            {field: codes[indices] for field, codes in self.codes.items()},
+            {field: dates[indices] for field, dates in self.dates.items()},
+            {field: text.take(indices)
+             for field, text in self.texts.items()})
+
+    def sorted(self):
+        """Records sorted by ExpiryDate then CID, as the bookmark is
+        kept."""
+        order = np.lexsort((self.cids, self.dates["ExpiryDate"]))
+        return self.take(order)
+
+    def due(self, as_of):
+        """Records whose NextTransition is empty or on or before the
+        YYYY-MM-DD date as_of."""
+        return self.take(
+            self.dates["NextTransition"] <= date_to_ordinal(as_of))
+
+    def locate(self, cids):
+        """Row index of every CID, -1 for a CID not in the records."""
+        if self._cid_index is None:
+            order = np.argsort(self.cids, kind="stable")
+            self._cid_index = (order, self.cids[order])
+        order, sorted_cids = self._cid_index
+        keys = BookmarkRecords.encode_cids(cids)
+        if not len(sorted_cids):
+            return np.full(len(keys), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(sorted_cids, keys),
+                               len(sorted_cids) - 1)
+        return np.where(sorted_cids[positions] == keys, order[positions],
+                        -1)
+
+    def select(self, cids):
+        """Records of the given CIDs, in bookmark order."""
+        indices = self.locate(cids)
+        return self.take(np.unique(indices[indices >= 0]))
+
+    def is_in(self, field, values):
+        """Mask of the rows whose coded field is one of values."""
+        return BookmarkRecords.vocabularies[field].mask(
+            self.codes[field], values)
+
+    def values(self, field, start=0, stop=None):
+        """The strings of a field for the rows start to stop."""
+        stop = len(self) if stop is None else stop
+        if field == "CID":
+            return [cid.decode('utf-8')
+                    for cid in self.cids[start:stop].tolist()]
+        if field in CODED_FIELDS:
+            return BookmarkRecords.vocabularies[field].decode(
+                self.codes[field][start:stop])
+        if field in DATE_FIELDS:
+            return BookmarkRecords.format_dates(
+                self.dates[field][start:stop])
+        return self.texts[field].decode(start, stop)
+
+    def assign(self, field, indices, values):
+        """Set a coded field (strings) or a date field (ordinals) of the
+        given rows."""
+        if field in CODED_FIELDS:
+            self.codes[field][indices] = \
+                BookmarkRecords.vocabularies[field].encode(values)
+        elif field in DATE_FIELDS:
+            self.dates[field][indices] = values
+        else:
+            raise ValueError(f"Bookmark field {field} cannot be updated")
+
+    def iter_rows(self):
+        """Rows as tuples of strings in BOOKMARK_FIELDNAMES order."""
+        for start in range(0, len(self), RECORDS_CHUNK_SIZE):
+            stop = min(start + RECORDS_CHUNK_SIZE, len(self))
+            yield from zip(*(self.values(field, start, stop)
+                             for field in BOOKMARK_FIELDNAMES))
+
+    def to_cert_infos(self):
+        """The records as a dict of CID to row dict."""
+        return {row[0]: dict(zip(BOOKMARK_FIELDNAMES, row))
+                for row in self.iter_rows()}
+
+    @staticmethod
+    def read_csv(file):
+        reader = csv.reader(file)
+        fieldnames = next(reader, None)
+        if fieldnames is None:
+            return BookmarkRecords.empty()
+        return BookmarkRecords.from_rows(reader, fieldnames)
+
+    def write_csv(self, file):
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(BOOKMARK_FIELDNAMES)
+        writer.writerows(self.iter_rows())
+
+    @staticmethod
+    def load(file):
+        """Read records written by save."""
+        with np.load(file, allow_pickle=False) as archive:
+            version = int(archive["version"])
+            if version != RECORDS_FORMAT_VERSION:
+                raise ValueError(f"Unsupported bookmark records format "
+                                 f"version {version}")
+            codes = {}
+            for field in CODED_FIELDS:
+                # Codes of the file are mapped to the codes of this
+                # process.
+                mapping = BookmarkRecords.vocabularies[field].encode(
+                    archive[f"{field}_values"].tolist())
+                codes[field] = mapping[archive[field]] if len(mapping) \
+                    else np.zeros(len(archive[field]), dtype=np.uint16)
+            return BookmarkRecords(
+                archive["CID"], codes,
+                {field: archive[field] for field in DATE_FIELDS},
+                {field: TextColumn(archive[f"{field}_data"],
+                                   archive[f"{field}_offsets"])
+                 for field in TEXT_FIELDS})
+
+    def save(self, file):
+        arrays = {"version": np.array(RECORDS_FORMAT_VERSION),
+                  "CID": self.cids}
+        for field in CODED_FIELDS:
+            vocabulary = BookmarkRecords.vocabularies[field]
+            arrays[field] = self.codes[field]
+            arrays[f"{field}_values"] = np.array(vocabulary.values,
+                                                 dtype=str)
+        arrays.update(self.dates)
+        for field, text in self.texts.items():
+            arrays[f"{field}_data"] = text.data
+            arrays[f"{field}_offsets"] = text.offsets
+        np.savez(file, **arrays)
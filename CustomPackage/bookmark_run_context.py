@@ -0,0 +1,103 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: bookmark_run_context
+# Description: In-memory view of the bookmark for one job run.
+#       The bookmark is loaded once, the insert, rebucket, select and
+#       mark-notified steps are applied to the in-memory records and the
+#       result is committed once at the end of the run: an atomic file
+#       replace for the CSV store, a single transaction for SQLite.
+#       The context exposes the same methods as the bookmark stores, so
+#       BookmarkHandler and CertExpiryUtility accept either.
+#
+###########################################################################
+"""BookmarkRunContext Class"""
+
+import logging
+from CustomPackage.bookmark_records import BookmarkRecords
+from CustomPackage.bookmark_store import apply_bucket_changes, \
+    apply_notified, apply_transition_changes
+
+
+class BookmarkRunContext:
+    def __init__(self, bookmark_store, schedule=None):
+        self.store = bookmark_store
+        self.path = bookmark_store.path
+        self.store_existed = bookmark_store.exists()
+        self.records = bookmark_store.load_bookmark()
+        self.new_rows = []
+        self.bucket_changes = {}
+        self.notified_cids = set()
+        self.transition_changes = {}
+        self.schedule = schedule
+        self.schedule_changed = schedule is not None and \
+            bookmark_store.load_schedule() != schedule
+        if self.schedule_changed and len(self.records):
+            # Dates computed with other settings may be too late.
+            logging.info("Notification schedule settings changed, every "
+                         "bookmark entry is processed in this run.")
+            self.update_transitions(
+                (cid, "") for cid in self.records.values("CID"))
+
+    def exists(self):
+        return self.store_existed or len(self.records) > 0
+
+    def load_bookmark(self, cids=None):
+        if cids is None:
+            return self.records
+        return self.records.select(cids)
+
+    def load_due(self, as_of):
+        return self.records.due(as_of)
+
+    def load_records(self, as_of=None):
+        records = self.records if as_of is None else self.load_due(as_of)
+        return records.to_cert_infos()
+
+    def existing_cids(self):
+        return set(self.records.values("CID"))
+
+    def insert_rows(self, rows):
+        if len(rows) == 0:
+            return
+        self.records = BookmarkRecords.concat(
+            [self.records, rows]).sorted()
+        self.new_rows.append(rows)
+
+    def update_buckets(self, changes):
+        changes = {cid: (bucket, notified)
+                   for cid, bucket, notified in changes}
+        if not changes:
+            return
+        apply_bucket_changes(
+            self.records, ((cid, bucket, notified) for cid, (bucket, notified)
+                           in changes.items()))
+        self.bucket_changes.update(changes)
+
+    def mark_notified(self, cids):
+        cids = set(cids)
+        apply_notified(self.records, cids)
+        self.notified_cids.update(cids)
+
+    def update_transitions(self, changes):
+        changes = dict(changes)
+        if not changes:
+            return
+        apply_transition_changes(self.records, changes.items())
+        self.transition_changes.update(changes)
+
+    def commit(self):
+        if self.new_rows or self.bucket_changes or \
+                self.notified_cids or self.transition_changes:
+            self.store.apply_run(self)
+            logging.info(
+                f"Bookmark committed: "
+                f"{sum(len(rows) for rows in self.new_rows)} new, "
+                f"{len(self.bucket_changes)} moved, "
+                f"{len(self.notified_cids)} notified certificates, "
+                f"{len(self.transition_changes)} rescheduled.")
+        else:
+            logging.info("No bookmark changes to commit.")
+        # Saved last, so a failed commit reprocesses every row again.
+        if self.schedule_changed:
+            self.store.save_schedule(self.schedule)
@@ -0,0 +1,396 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: bookmark_store
+# Description: Storage backends for the certificate bookmark.
+#       CsvBookmarkStore : bookmark.csv, every update rewrites the file.
+#       BinaryBookmarkStore : bookmark.records, the BookmarkRecords arrays
+#           in an uncompressed numpy archive, every update rewrites the
+#           file. The existing bookmark.csv is migrated once on first use
+#           and renamed to bookmark.csv.migrated.
+#       SqliteBookmarkStore : indexed SQLite database with row level
+#           updates. The existing bookmark.csv is migrated once on first
+#           use and renamed to bookmark.csv.migrated.
+#       The backend is selected with the bookmark_backend config parameter
+#       (csv, binary or sqlite) and its file with bookmark_path.
+#       Rows are loaded as BookmarkRecords.
+#       NextTransition holds the date (YYYY-MM-DD) on which a row next needs
+#       processing: its next bucket change, or the run date while a
+#       notification is pending. A run only loads the rows due on its run
+#       date. Bookmarks created without the column start with every row
+#       due. The notification thresholds, expired_cert_notify_only_once
+#       setting and disabled notification_duration buckets the dates were
+#       computed with are stored alongside (bookmark.csv.schedule or the
+#       bookmark_schedule table) so changing any of them makes every row
+#       due once.
+#
+###########################################################################
+"""BookmarkStore Classes"""
+
+import contextlib
+import logging
+import os
+import sqlite3
+import globalSetting
+from CustomPackage.bookmark_records import BookmarkRecords, \
+    BOOKMARK_FIELDNAMES
+
+DEFAULT_CSV_PATH = "bookmark.csv"
+DEFAULT_BINARY_PATH = "bookmark.records"
+DEFAULT_SQLITE_PATH = "bookmark.db"
+
+
+class BookmarkStore:
+    def exists(self):
+        raise NotImplementedError
+
+    def load_bookmark(self, cids=None):
+        """Return the bookmark rows, optionally only the given CIDs, as
+        BookmarkRecords sorted by ExpiryDate."""
+        raise NotImplementedError
+
+    def load_due(self, as_of):
+        """Return the rows whose NextTransition is on or before as_of."""
+        return self.load_bookmark().due(as_of)
+
+    def load_records(self, as_of=None):
+        """Return the bookmark, or only the rows due on as_of, as a dict
+        of CID to row dict."""
+        records = self.load_bookmark() if as_of is None else \
+            self.load_due(as_of)
+        return records.to_cert_infos()
+
+    def existing_cids(self):
+        return set(self.load_bookmark().values("CID"))
+
+    def insert_rows(self, rows):
+        """Insert new rows, given as BookmarkRecords."""
+        raise NotImplementedError
+
+    def update_buckets(self, changes):
+        """Apply (CID, Bucket, Notified) changes."""
+        raise NotImplementedError
+
+    def mark_notified(self, cids):
+        raise NotImplementedError
+
+    def update_transitions(self, changes):
+        """Apply (CID, NextTransition) changes."""
+        raise NotImplementedError
+
+    def apply_run(self, run_context):
+        """Persist the changes collected by a BookmarkRunContext."""
+        raise NotImplementedError
+
+    def load_schedule(self):
+        """Return the signature of the schedule settings the NextTransition
+        dates were computed with, None if unknown."""
+        raise NotImplementedError
+
+    def save_schedule(self, signature):
+        raise NotImplementedError
+
+
+class CsvBookmarkStore(BookmarkStore):
+    def __init__(self, path=DEFAULT_CSV_PATH):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def read_records(self):
+        with open(self.path, newline='') as file:
+            return BookmarkRecords.read_csv(file)
+
+    def write_records(self, records, path):
+        with open(path, 'w', newline='') as file:
+            records.write_csv(file)
+
+    def load_bookmark(self, cids=None):
+        if not self.exists():
+            return BookmarkRecords.empty()
+        records = self.read_records()
+        if cids is not None:
+            records = records.select(cids)
+        return records
+
+    def save_bookmark(self, records):
+        # Write to a temporary file and swap it in, so a crash never leaves
+        # a half written bookmark behind.
+        temp_path = self.path + ".tmp"
+        self.write_records(records, temp_path)
+        os.replace(temp_path, self.path)
+
+    def insert_rows(self, rows):
+        if len(rows) == 0:
+            return
+        self.save_bookmark(BookmarkRecords.concat(
+            [self.load_bookmark(), rows]).sorted())
+
+    def update_buckets(self, changes):
+        changes = list(changes)
+        if not changes:
+            return
+        records = self.load_bookmark()
+        apply_bucket_changes(records, changes)
+        self.save_bookmark(records)
+
+    def mark_notified(self, cids):
+        records = self.load_bookmark()
+        apply_notified(records, cids)
+        self.save_bookmark(records)
+
+    def update_transitions(self, changes):
+        changes = list(changes)
+        if not changes:
+            return
+        records = self.load_bookmark()
+        apply_transition_changes(records, changes)
+        self.save_bookmark(records)
+
+    def apply_run(self, run_context):
+        self.save_bookmark(run_context.records)
+
+    def load_schedule(self):
+        try:
+            with open(self.path + ".schedule", 'r') as file:
+                return file.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def save_schedule(self, signature):
+        with open(self.path + ".schedule", 'w') as file:
+            file.write(signature)
+
+
+class BinaryBookmarkStore(CsvBookmarkStore):
+    def __init__(self, path=DEFAULT_BINARY_PATH,
+                 csv_path=DEFAULT_CSV_PATH):
+        super().__init__(path)
+        if not self.exists() and os.path.exists(csv_path):
+            self.migrate_from_csv(csv_path)
+
+    def migrate_from_csv(self, csv_path):
+        records = CsvBookmarkStore(csv_path).load_bookmark()
+        self.save_bookmark(records)
+        os.replace(csv_path, csv_path + ".migrated")
+        logging.info(f"Migrated {len(records)} bookmark entries from "
+                     f"{csv_path} to {self.path}")
+
+    def read_records(self):
+        with open(self.path, 'rb') as file:
+            return BookmarkRecords.load(file)
+
+    def write_records(self, records, path):
+        with open(path, 'wb') as file:
+            records.save(file)
+
+
+class SqliteBookmarkStore(BookmarkStore):
+    def __init__(self, path=DEFAULT_SQLITE_PATH,
+                 csv_path=DEFAULT_CSV_PATH):
+        self.path = path
+        with self.connect() as connection:
+            # The schema and the rows migrated from the CSV bookmark are
+            # committed together; a failed migration leaves no bookmark
+            # table behind and is retried by the next run.
+            connection.execute("BEGIN")
+            migrate = os.path.exists(csv_path) and connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                "AND name = 'bookmark'").fetchone() is None
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS bookmark ("
+                "CID TEXT PRIMARY KEY, Status TEXT, ExpiryDate TEXT, "
+                "Bucket TEXT, CN TEXT, SAN TEXT, Notified TEXT, "
+                "NextTransition TEXT NOT NULL DEFAULT '')")
+            columns = {column for _, column, *_ in connection.execute(
+                "PRAGMA table_info(bookmark)")}
+            if "NextTransition" not in columns:
+                connection.execute(
+                    "ALTER TABLE bookmark ADD COLUMN "
+                    "NextTransition TEXT NOT NULL DEFAULT ''")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_bookmark_bucket "
+                "ON bookmark (Bucket)")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_bookmark_notified "
+                "ON bookmark (Notified)")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_bookmark_expiry "
+                "ON bookmark (ExpiryDate)")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_bookmark_next_transition "
+                "ON bookmark (NextTransition)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS bookmark_schedule "
+                "(signature TEXT)")
+            if migrate:
+                migrated = self.migrate_from_csv(connection, csv_path)
+        if migrate:
+            os.replace(csv_path, csv_path + ".migrated")
+            logging.info(f"Migrated {migrated} bookmark entries from "
+                         f"{csv_path} to {self.path}")
+
+    @contextlib.contextmanager
+    def connect(self):
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def migrate_from_csv(self, connection, csv_path):
+        """Insert the rows of the CSV bookmark in the transaction of
+        connection, return their number."""
+        records = CsvBookmarkStore(csv_path).load_bookmark()
+        self._insert_rows(connection, records)
+        return len(records)
+
+    def exists(self):
+        with self.connect() as connection:
+            return connection.execute(
+                "SELECT 1 FROM bookmark LIMIT 1").fetchone() is not None
+
+    def load_bookmark(self, cids=None):
+        columns = ", ".join(BOOKMARK_FIELDNAMES)
+        with self.connect() as connection:
+            if cids is None:
+                return BookmarkRecords.from_rows(connection.execute(
+                    f"SELECT {columns} FROM bookmark "
+                    "ORDER BY ExpiryDate, CID"))
+            cids = list(cids)
+            chunks = []
+            for start in range(0, len(cids), 500):
+                chunk = cids[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                chunks.append(BookmarkRecords.from_rows(connection.execute(
+                    f"SELECT {columns} FROM bookmark "
+                    f"WHERE CID IN ({placeholders})", chunk)))
+        return BookmarkRecords.concat(chunks)
+
+    def load_due(self, as_of):
+        columns = ", ".join(BOOKMARK_FIELDNAMES)
+        with self.connect() as connection:
+            return BookmarkRecords.from_rows(connection.execute(
+                f"SELECT {columns} FROM bookmark "
+                "WHERE NextTransition <= ? ORDER BY ExpiryDate, CID",
+                [as_of]))
+
+    def existing_cids(self):
+        with self.connect() as connection:
+            return {cid for (cid,) in connection.execute(
+                "SELECT CID FROM bookmark")}
+
+    @staticmethod
+    def _insert_rows(connection, rows):
+        connection.executemany(
+            "INSERT OR IGNORE INTO bookmark "
+            "(CID, Status, ExpiryDate, Bucket, CN, SAN, Notified, "
+            "NextTransition) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows.iter_rows())
+
+    @staticmethod
+    def _update_buckets(connection, changes):
+        connection.executemany(
+            "UPDATE bookmark SET Bucket = ?, Notified = ? "
+            "WHERE CID = ?",
+            ((bucket, notified, cid)
+             for cid, bucket, notified in changes))
+
+    @staticmethod
+    def _mark_notified(connection, cids):
+        connection.executemany(
+            "UPDATE bookmark SET Notified = 'Y' WHERE CID = ?",
+            ((cid,) for cid in cids))
+
+    @staticmethod
+    def _update_transitions(connection, changes):
+        connection.executemany(
+            "UPDATE bookmark SET NextTransition = ? WHERE CID = ?",
+            ((next_transition, cid) for cid, next_transition in changes))
+
+    def insert_rows(self, rows):
+        with self.connect() as connection:
+            self._insert_rows(connection, rows)
+
+    def update_buckets(self, changes):
+        with self.connect() as connection:
+            self._update_buckets(connection, changes)
+
+    def mark_notified(self, cids):
+        with self.connect() as connection:
+            self._mark_notified(connection, cids)
+
+    def update_transitions(self, changes):
+        with self.connect() as connection:
+            self._update_transitions(connection, changes)
+
+    def apply_run(self, run_context):
+        # One transaction for the whole run.
+        with self.connect() as connection:
+            for new_rows in run_context.new_rows:
+                self._insert_rows(connection, new_rows)
+            self._update_buckets(
+                connection,
+                ((cid, bucket, notified) for cid, (bucket, notified)
+                 in run_context.bucket_changes.items()))
+            self._mark_notified(connection, run_context.notified_cids)
+            self._update_transitions(
+                connection, run_context.transition_changes.items())
+
+    def load_schedule(self):
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT signature FROM bookmark_schedule").fetchone()
+        return row[0] if row else None
+
+    def save_schedule(self, signature):
+        with self.connect() as connection:
+            connection.execute("DELETE FROM bookmark_schedule")
+            connection.execute(
+                "INSERT INTO bookmark_schedule (signature) VALUES (?)",
+                (signature,))
+
+
+def apply_bucket_changes(records, changes):
+    """Apply (CID, Bucket, Notified) changes to records."""
+    cids, buckets, notified = zip(*changes)
+    indices = records.locate(cids)
+    found = indices >= 0
+    indices = indices[found]
+    records.assign("Bucket", indices,
+                   [bucket for bucket, keep in zip(buckets, found) if keep])
+    records.assign("Notified", indices,
+                   [value for value, keep in zip(notified, found) if keep])
+
+
+def apply_notified(records, cids):
+    indices = records.locate(cids)
+    indices = indices[indices >= 0]
+    records.assign("Notified", indices, ["Y"] * len(indices))
+
+
+def apply_transition_changes(records, changes):
+    """Apply (CID, NextTransition) changes to records."""
+    cids, next_transitions = zip(*changes)
+    indices = records.locate(cids)
+    found = indices >= 0
+    records.assign("NextTransition", indices[found],
+                   BookmarkRecords.encode_dates(next_transitions)[found])
+
+
+def get_bookmark_store():
+    backend = globalSetting.confData.get('bookmark_backend', 'csv')
+    if backend == 'sqlite':
+        return SqliteBookmarkStore(
+            globalSetting.confData.get('bookmark_path', DEFAULT_SQLITE_PATH))
+    if backend == 'binary':
+        return BinaryBookmarkStore(
+            globalSetting.confData.get('bookmark_path', DEFAULT_BINARY_PATH))
+    if backend != 'csv':
+        logging.error(f"Unsupported bookmark_backend {backend}, "
+                      "proceeding with csv.")
+    return CsvBookmarkStore(
+        globalSetting.confData.get('bookmark_path', DEFAULT_CSV_PATH)
+        if backend == 'csv' else DEFAULT_CSV_PATH)
@@ -0,0 +1,182 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: distinguished_name
+# Description: RFC 4514 parser for certificate subject distinguished
+#       names. Handles escaped characters (\, and \2C), quoted values,
+#       multi-valued RDNs (CN=a+OU=b), OID attribute types and the ", "
+#       separators used by the SSLAPI. Parsed subjects are kept in a
+#       bounded LRU cache, as many certificates share a subject across
+#       renewals.
+#
+###########################################################################
+"""DistinguishedName Class"""
+
+import functools
+import re
+
+DN_CACHE_SIZE = 262144
+
+ATTRIBUTE_TYPE_NAMES = {
+    "2.5.4.3": "CN",
+    "2.5.4.5": "SERIALNUMBER",
+    "2.5.4.6": "C",
+    "2.5.4.7": "L",
+    "2.5.4.8": "ST",
+    "2.5.4.9": "STREET",
+    "2.5.4.10": "O",
+    "2.5.4.11": "OU",
+    "0.9.2342.19200300.100.1.1": "UID",
+    "0.9.2342.19200300.100.1.25": "DC",
+    "1.2.840.113549.1.9.1": "EMAILADDRESS",
+}
+
+ATTRIBUTE_TYPE_PATTERN = re.compile(
+    r"(?:OID\.)?([A-Za-z][A-Za-z0-9-]*|[0-9]+(?:\.[0-9]+)*)\Z")
+HEX_DIGITS = "0123456789abcdefABCDEF"
+RDN_SEPARATORS = ",;"
+
+
+class DistinguishedName:
+    @staticmethod
+    @functools.lru_cache(maxsize=DN_CACHE_SIZE)
+    def parse(distinguished_name):
+        """Parse a DN string into a tuple of RDNs in string order, each a
+        tuple of (attribute type, value) pairs. Attribute types are upper
+        case, known OIDs are mapped to their short names. Raises
+        ValueError for a malformed DN."""
+        if '\\' not in distinguished_name and \
+                '"' not in distinguished_name and \
+                '#' not in distinguished_name:
+            return DistinguishedName._parse_unescaped(distinguished_name)
+        rdns = []
+        rdn = []
+        position = DistinguishedName._skip_spaces(distinguished_name, 0)
+        if position == len(distinguished_name):
+            return ()
+        while True:
+            separator = distinguished_name.find('=', position)
+            if separator < 0:
+                raise ValueError(
+                    "Missing '=' in distinguished name "
+                    f"{distinguished_name!r}")
+            attribute_type = DistinguishedName._attribute_type(
+                distinguished_name[position:separator].strip())
+            value, position = DistinguishedName._parse_value(
+                distinguished_name, separator + 1)
+            rdn.append((attribute_type, value))
+
+            position = DistinguishedName._skip_spaces(
+                distinguished_name, position)
+            if position == len(distinguished_name):
+                rdns.append(tuple(rdn))
+                return tuple(rdns)
+            if distinguished_name[position] in RDN_SEPARATORS:
+                rdns.append(tuple(rdn))
+                rdn = []
+            elif distinguished_name[position] != '+':
+                raise ValueError(
+                    "Unexpected character after value in distinguished "
+                    f"name {distinguished_name!r}")
+            position = DistinguishedName._skip_spaces(
+                distinguished_name, position + 1)
+
+    @staticmethod
+    def get_attribute(distinguished_name, attribute_type):
+        """Return the first value of attribute_type in string order, None
+        if the DN has no such attribute."""
+        for rdn in DistinguishedName.parse(distinguished_name):
+            for rdn_attribute_type, value in rdn:
+                if rdn_attribute_type == attribute_type:
+                    return value
+        return None
+
+    @staticmethod
+    def _parse_unescaped(distinguished_name):
+        """Fast path for DNs without escapes, quoted or BER values, where
+        every ",", ";" and "+" is a separator."""
+        if not distinguished_name.strip(' '):
+            return ()
+        rdns = []
+        for rdn_text in distinguished_name.replace(';', ',').split(','):
+            rdn = []
+            for attribute_text in rdn_text.split('+'):
+                attribute_type, equals, value = attribute_text.partition('=')
+                if not equals:
+                    raise ValueError(
+                        "Missing '=' in distinguished name "
+                        f"{distinguished_name!r}")
+                rdn.append((DistinguishedName._attribute_type(
+                    attribute_type.strip(' ')), value.strip(' ')))
+            rdns.append(tuple(rdn))
+        return tuple(rdns)
+
+    @staticmethod
+    def _skip_spaces(distinguished_name, position):
+        while position < len(distinguished_name) and \
+                distinguished_name[position] == ' ':
+            position += 1
+        return position
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _attribute_type(attribute_type):
+        match = ATTRIBUTE_TYPE_PATTERN.match(attribute_type)
+        if not match:
+            raise ValueError(f"Invalid attribute type {attribute_type!r}")
+        attribute_type = match.group(1)
+        return ATTRIBUTE_TYPE_NAMES.get(attribute_type,
+                                        attribute_type.upper())
+
+    @staticmethod
+    def _parse_value(distinguished_name, position):
+        """Parse one attribute value starting at position. Returns the
+        unescaped value and the position of the character ending it."""
+        length = len(distinguished_name)
+        position = DistinguishedName._skip_spaces(
+            distinguished_name, position)
+
+        if position < length and distinguished_name[position] == '#':
+            # BER encoded value, kept as its hex string.
+            end = position + 1
+            while end < length and distinguished_name[end] in HEX_DIGITS:
+                end += 1
+            return distinguished_name[position:end], end
+
+        quoted = position < length and distinguished_name[position] == '"'
+        if quoted:
+            position += 1
+        value = bytearray()
+        significant_length = 0
+        while position < length:
+            character = distinguished_name[position]
+            if quoted and character == '"':
+                return value.decode('utf-8', errors='replace'), position + 1
+            if not quoted and character in ",+;":
+                break
+            if character == '\\':
+                escaped = distinguished_name[position + 1:position + 3]
+                if len(escaped) == 2 and all(
+                        digit in HEX_DIGITS for digit in escaped):
+                    value.append(int(escaped, 16))
+                    position += 3
+                elif escaped:
+                    value.extend(escaped[0].encode('utf-8'))
+                    position += 2
+                else:
+                    raise ValueError(
+                        "Trailing '\\' in distinguished name "
+                        f"{distinguished_name!r}")
+                significant_length = len(value)
+                continue
+            value.extend(character.encode('utf-8'))
+            if character != ' ':
+                significant_length = len(value)
+            position += 1
+
+        if quoted:
+            raise ValueError(
+                f"Unterminated quoted value in {distinguished_name!r}")
+        # Unescaped trailing spaces are not part of the value.
+        return value[:significant_length].decode(
+            'utf-8', errors='replace'), position
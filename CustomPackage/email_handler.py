@@ -10,23 +10,74 @@
 """EmailHandler Class"""
 
 import smtplib
+import threading
 from email.mime.text import MIMEText
 import globalSetting
 import logging
-from datetime import datetime
-import os
 from CustomPackage.MessageDirectory import MessageDictionary
+from CustomPackage.ReadCertExpiryConfig import ReadCertExpiryConfig
+from CustomPackage.email_template import EmailTemplateRegistry, \
+    TemplateError, INTERNAL_TEMPLATE, NOTIFICATION_TEMPLATE, DIGEST_TEMPLATE
+from CustomPackage.notification_dispatcher import NotificationDispatcher
+from CustomPackage.run_clock import RunClock
+from CustomPackage.run_metrics import RunMetrics
+from CustomPackage.smtp_sender import SMTPSender
 
 
 class EmailHandler:
+    smtp_sender = None
+    # The fetch threads send internal emails concurrently.
+    _smtp_sender_lock = threading.Lock()
+
     @staticmethod
-    def load_email_template(template_file):
-        try:
-            with open(template_file, 'r') as file:
-                template = file.read()
-            return template
-        except FileNotFoundError:
-            return None
+    def get_smtp_sender():
+        """Return the SMTP sender shared by every email of the run."""
+        with EmailHandler._smtp_sender_lock:
+            if EmailHandler.smtp_sender is None:
+                EmailHandler.smtp_sender = EmailHandler.new_smtp_sender()
+            return EmailHandler.smtp_sender
+
+    @staticmethod
+    def new_smtp_sender():
+        return SMTPSender(
+            globalSetting.confData['smtp_server'],
+            globalSetting.confData['smtp_port'],
+            pool_size=max(
+                ReadCertExpiryConfig.get_numeric_setting(
+                    'smtp_pool_size', 1),
+                ReadCertExpiryConfig.get_numeric_setting(
+                    'smtp_workers', 1)),
+            timeout=ReadCertExpiryConfig.get_numeric_setting(
+                'smtp_timeout', 30, (int, float)),
+            max_messages_per_connection=ReadCertExpiryConfig.
+            get_numeric_setting('smtp_max_messages_per_connection', 100))
+
+    @staticmethod
+    def close_smtp_sender():
+        with EmailHandler._smtp_sender_lock:
+            smtp_sender = EmailHandler.smtp_sender
+            EmailHandler.smtp_sender = None
+        if smtp_sender is None:
+            return
+        statistics = smtp_sender.statistics()
+        smtp_sender.close()
+        EmailHandler.record_smtp_metrics(statistics)
+        logging.info(
+            f"SMTP: {statistics['messages_sent']} sent, "
+            f"{statistics['messages_failed']} failed over "
+            f"{statistics['connections_opened']} connections "
+            f"({statistics['reconnects']} reconnects), average "
+            f"{statistics['average_send_ms']} ms per message")
+        return statistics
+
+    @staticmethod
+    def record_smtp_metrics(statistics):
+        RunMetrics.increment("emails_sent", statistics['messages_sent'])
+        RunMetrics.increment("emails_failed", statistics['messages_failed'])
+        RunMetrics.increment("smtp_connections",
+                             statistics['connections_opened'])
+        RunMetrics.increment("smtp_reconnects", statistics['reconnects'])
+        RunMetrics.observe("smtp_send", statistics['send_seconds'])
 
     @staticmethod
     def trigger_internal_email(failure_reason):
@@ -38,24 +89,17 @@ class EmailHandler:
             globalSetting.confData['sender_email']
         receiver_email = \
             globalSetting.confData['internal_team_email']
-        smtp_server = \
-            globalSetting.confData['smtp_server']
-        smtp_port = \
-            globalSetting.confData['smtp_port']
-        template_file = \
-            "./EmailTemplates/Cert_Expiry_Internal_Email_Template.txt"
-        template = \
-            EmailHandler.load_email_template(template_file)
-
-        current_date = datetime.now().strftime('%Y-%m-%d')
+        template = EmailTemplateRegistry.get(INTERNAL_TEMPLATE)
+
+        current_date = RunClock.today_iso()
         subject = (
             "ACTION REQUIRED: WxCCE Certificate Expiry Notification"
             "job reported an issue on {DATE}".format(
                 DATE=current_date)
         )
-        message = template.replace(
-            '{DATE}', current_date).replace(
-            '{InternalEmailReason}', failure_reason)
+        message = template.render({
+            'DATE': current_date,
+            'InternalEmailReason': failure_reason})
 
         msg = MIMEText(message)
         msg["Subject"] = subject
@@ -63,29 +107,21 @@ class EmailHandler:
         msg["To"] = receiver_email
 
         try:
-            with smtplib.SMTP(smtp_server, smtp_port) as server:
-                server.sendmail(sender_email, receiver_email, msg.as_string())
-                logging.info(
-                    "Email triggered to internal "
-                    "certificate expiry job monitoring team. "
-                    f"Reason : {failure_reason}")
+            EmailHandler.get_smtp_sender().send(
+                sender_email, receiver_email, msg.as_string())
+            logging.info(
+                "Email triggered to internal "
+                "certificate expiry job monitoring team. "
+                f"Reason : {failure_reason}")
         except smtplib.SMTPException:
             logging.error(
                 "Exception during processing of send internal email for "
                 f"{failure_reason}.")
 
     @staticmethod
-    def trigger_email_for_cert_expiry(cert_info):
-
-        if globalSetting.external_email_template_missing:
-            return
+    def build_email_for_cert_expiry(cert_info, template):
         sender_email = globalSetting.confData['sender_email']
-        receiver_email = globalSetting.confData['receiver_email']
-        smtp_server = globalSetting.confData['smtp_server']
-        smtp_port = globalSetting.confData['smtp_port']
-        template_file = \
-            "./EmailTemplates/Cert_Expiry_Notification_Email_Template.txt"
-        template = EmailHandler.load_email_template(template_file)
+        receiver_email = EmailHandler.get_receiver_email(cert_info)
 
         subject = (
             "ACTION REQUIRED: SSL Certificate Request {CID} for {CN} "
@@ -96,48 +132,148 @@ class EmailHandler:
 
         if 'SAN' in cert_info and cert_info['SAN']:
             san_text = ''.join(cert_info['SAN']) + '\n'
-            message = template.replace(
-                '{CID}', cert_info['CID']
-            ).replace(
-                '{CN}', cert_info['CN']
-            ).replace(
-                '{X}', cert_info['Bucket']
-            ).replace(
-                '{SANs}', f"The SANs associated with this request are: "
-                f"{san_text}"
-            )
+            sans = f"The SANs associated with this request are: {san_text}"
         else:
-            message = template.replace(
-                '{CID}', cert_info['CID']
-            ).replace(
-                '{CN}', cert_info['CN']
-            ).replace(
-                '{X}', cert_info['Bucket']
-            ).replace(
-                '{SANs}', ''
-            )
+            sans = ''
+        message = template.render({
+            'CID': cert_info['CID'],
+            'CN': cert_info['CN'],
+            'X': cert_info['Bucket'],
+            'SANs': sans,
+            'ExpiryDate': cert_info.get('ExpiryDate', ''),
+            'Status': cert_info.get('Status', '')})
 
         msg = MIMEText(message)
         msg["Subject"] = subject
         msg["From"] = sender_email
         msg["To"] = receiver_email
+        return sender_email, receiver_email, msg.as_string()
 
-        try:
-            with smtplib.SMTP(smtp_server, smtp_port) as server:
-                server.sendmail(sender_email, receiver_email, msg.as_string())
+    @staticmethod
+    def get_receiver_email(cert_info):
+        return globalSetting.confData['receiver_email']
+
+    @staticmethod
+    def build_digest_email(receiver_email, bucket, cert_infos, template):
+        """Build one summary email listing every certificate of a bucket."""
+        sender_email = globalSetting.confData['sender_email']
+
+        subject = (
+            "ACTION REQUIRED: {COUNT} SSL Certificates "
+            "Expiring in {X} days".format(
+                COUNT=len(cert_infos), X=bucket))
+
+        certificate_list = '\n'.join(
+            "CID: {CID} | CN: {CN} | SAN: {SAN} | "
+            "Expiry Date: {ExpiryDate}".format(
+                CID=cert_info['CID'],
+                CN=cert_info['CN'],
+                SAN=''.join(cert_info.get('SAN') or '') or '-',
+                ExpiryDate=cert_info.get('ExpiryDate', ''))
+            for cert_info in cert_infos)
+        message = template.render({
+            'Count': len(cert_infos),
+            'X': bucket,
+            'CertificateList': certificate_list})
+
+        msg = MIMEText(message)
+        msg["Subject"] = subject
+        msg["From"] = sender_email
+        msg["To"] = receiver_email
+        return sender_email, receiver_email, msg.as_string()
+
+    @staticmethod
+    def dispatch_emails(items, build_email):
+        """Send one email per item through the pooled sender. Batches of
+        smtp_batch_size items are handed to smtp_workers parallel senders,
+        capped at smtp_max_messages_per_second. Returns (item, error)
+        pairs, error is None for every email accepted by the server."""
+        batch_size = ReadCertExpiryConfig.get_numeric_setting(
+            'smtp_batch_size', 50)
+        smtp_sender = EmailHandler.get_smtp_sender()
+
+        def send_batch(batch, rate_limiter):
+            return smtp_sender.send_batch(
+                (build_email(item) for item in batch), rate_limiter)
+
+        dispatcher = NotificationDispatcher(
+            send_batch,
+            workers=ReadCertExpiryConfig.get_numeric_setting(
+                'smtp_workers', 1),
+            max_messages_per_second=ReadCertExpiryConfig.
+            get_numeric_setting(
+                'smtp_max_messages_per_second', 0, (int, float)))
+        return dispatcher.dispatch(
+            items[start:start + batch_size]
+            for start in range(0, len(items), batch_size))
+
+    @staticmethod
+    def trigger_emails_for_cert_expiry(cert_infos):
+        """Send the expiry emails of several certificates, one per
+        certificate or, with email_delivery_mode digest, one per recipient
+        and bucket. Returns the cert_infos whose email was accepted by the
+        SMTP server."""
+        if globalSetting.external_email_template_missing or not cert_infos:
+            return []
+        if globalSetting.confData.get('email_delivery_mode') == 'digest':
+            if not globalSetting.digest_email_template_missing:
+                return EmailHandler.trigger_digest_emails(cert_infos)
+            logging.error("Digest Email Template Missing. Sending one "
+                          "email per certificate.")
+
+        template = EmailTemplateRegistry.get(NOTIFICATION_TEMPLATE)
+
+        delivered = []
+        for cert_info, error in EmailHandler.dispatch_emails(
+                cert_infos,
+                lambda cert_info: EmailHandler.build_email_for_cert_expiry(
+                    cert_info, template)):
+            if error is None:
                 logging.info(
                     "Email sent for certificate ID: {}".format(
                         cert_info['CID']))
-        except smtplib.SMTPException:
-            logging.error(
-                "Exception during processing of send external email for "
-                f"CID: {cert_info['CID']}.")
+                delivered.append(cert_info)
+            else:
+                logging.error(
+                    "Exception during processing of send external email"
+                    f" for CID: {cert_info['CID']}. Exception : {error}")
+        return delivered
+
+    @staticmethod
+    def trigger_digest_emails(cert_infos):
+        """Group the certificates by recipient and bucket and send one
+        digest email per group. Returns the cert_infos of every digest
+        accepted by the SMTP server."""
+        template = EmailTemplateRegistry.get(DIGEST_TEMPLATE)
+
+        groups = {}
+        for cert_info in cert_infos:
+            groups.setdefault(
+                (EmailHandler.get_receiver_email(cert_info),
+                 cert_info['Bucket']), []).append(cert_info)
+
+        delivered = []
+        for (receiver_email, bucket), error in EmailHandler.dispatch_emails(
+                list(groups),
+                lambda group: EmailHandler.build_digest_email(
+                    group[0], group[1], groups[group], template)):
+            group_cids = [cert_info['CID']
+                          for cert_info in groups[(receiver_email, bucket)]]
+            if error is None:
+                logging.info(
+                    f"Digest email sent to {receiver_email} for bucket "
+                    f"{bucket} with certificate IDs: {group_cids}")
+                delivered.extend(groups[(receiver_email, bucket)])
+            else:
+                logging.error(
+                    "Exception during processing of send digest email to "
+                    f"{receiver_email} for bucket {bucket}, certificate IDs:"
+                    f" {group_cids}. Exception : {error}")
+        return delivered
 
     def send_internal_email(message):
         sender_email = globalSetting.confData['sender_email']
         receiver_email = globalSetting.confData['internal_team_email']
-        smtp_server = globalSetting.confData['smtp_server']
-        smtp_port = globalSetting.confData['smtp_port']
 
         subject = ("ACTION REQUIRED: WxCCE Expiry notification Email "
                    "Template missing")
@@ -147,24 +283,31 @@ class EmailHandler:
         msg["To"] = receiver_email
 
         try:
-            with smtplib.SMTP(smtp_server, smtp_port) as server:
-                server.sendmail(sender_email, receiver_email, msg.as_string())
-                logging.info("Internal email triggered for missing "
-                             "template.")
+            EmailHandler.get_smtp_sender().send(
+                sender_email, receiver_email, msg.as_string())
+            logging.info("Internal email triggered for missing "
+                         "template.")
         except smtplib.SMTPException as e:
             logging.error(
                 "Exception while sending internal email for missing template."
                 f" Exception : {e}")
 
     @staticmethod
-    def check_for_email_template():
-        internal_template_path = \
-            "./EmailTemplates/Cert_Expiry_Internal_Email_Template.txt"
-        external_template_path = \
-            "./EmailTemplates/Cert_Expiry_Notification_Email_Template.txt"
+    def load_template(template_name):
+        """Load and compile a template for the run. Returns False if it is
+        missing or invalid."""
+        try:
+            return EmailTemplateRegistry.get(template_name) is not None
+        except TemplateError as e:
+            logging.error(f"{e}")
+            return False
 
-        internal_missing = not os.path.exists(internal_template_path)
-        external_missing = not os.path.exists(external_template_path)
+    @staticmethod
+    def check_for_email_template():
+        EmailTemplateRegistry.clear()
+        internal_missing = not EmailHandler.load_template(INTERNAL_TEMPLATE)
+        external_missing = not EmailHandler.load_template(
+            NOTIFICATION_TEMPLATE)
 
         if external_missing and internal_missing:
             logging.error("Both Email Templates Missing")
@@ -186,3 +329,9 @@ class EmailHandler:
         else:
             globalSetting.internal_email_template_missing = False
             globalSetting.external_email_template_missing = False
+
+        globalSetting.digest_email_template_missing = \
+            not EmailHandler.load_template(DIGEST_TEMPLATE)
+        if globalSetting.confData.get('email_delivery_mode') == 'digest' \
+                and globalSetting.digest_email_template_missing:
+            logging.error("Digest Email Template Missing")
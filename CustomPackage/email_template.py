@@ -0,0 +1,92 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: email_template
+# Description: Registry of the email templates of ./EmailTemplates/.
+#       Each template is read and compiled once per run into its literal
+#       text and placeholder names, and rendered with a single pass over
+#       the compiled parts instead of a chain of str.replace calls.
+#       Placeholders a template is not allowed to use are rejected when
+#       it is compiled, missing values are rejected when it is rendered.
+#
+###########################################################################
+"""EmailTemplateRegistry Class"""
+
+import logging
+import os
+import re
+
+TEMPLATE_DIRECTORY = "./EmailTemplates"
+INTERNAL_TEMPLATE = "Cert_Expiry_Internal_Email_Template.txt"
+NOTIFICATION_TEMPLATE = "Cert_Expiry_Notification_Email_Template.txt"
+DIGEST_TEMPLATE = "Cert_Expiry_Digest_Email_Template.txt"
+
+TEMPLATE_PLACEHOLDERS = {
+    INTERNAL_TEMPLATE: {"DATE", "InternalEmailReason"},
+    NOTIFICATION_TEMPLATE: {"CID", "CN", "X", "SANs", "ExpiryDate",
+                            "Status"},
+    DIGEST_TEMPLATE: {"Count", "X", "CertificateList"},
+}
+
+PLACEHOLDER_PATTERN = re.compile(r"\{(\w+)\}")
+
+
+class TemplateError(Exception):
+    """Raised for a template using an unknown placeholder or rendered
+    without one of its values."""
+
+
+class CompiledTemplate:
+    def __init__(self, name, text, allowed_placeholders):
+        self.name = name
+        parts = PLACEHOLDER_PATTERN.split(text)
+        self.literals = parts[0::2]
+        self.placeholders = parts[1::2]
+        unknown = set(self.placeholders) - set(allowed_placeholders)
+        if unknown:
+            raise TemplateError(
+                f"Email template {name} uses unknown placeholders: "
+                f"{sorted(unknown)}")
+
+    def render(self, values):
+        rendered = [self.literals[0]]
+        try:
+            for placeholder, literal in zip(self.placeholders,
+                                            self.literals[1:]):
+                rendered.append(str(values[placeholder]))
+                rendered.append(literal)
+        except KeyError as e:
+            raise TemplateError(
+                f"No value for placeholder {e} of email template "
+                f"{self.name}") from None
+        return ''.join(rendered)
+
+
+class EmailTemplateRegistry:
+    templates = {}
+
+    @staticmethod
+    def clear():
+        """Forget the compiled templates so the next run reloads them."""
+        EmailTemplateRegistry.templates = {}
+
+    @staticmethod
+    def get(template_name):
+        """Return the compiled template, None if its file is missing.
+        Raises TemplateError if the template uses unknown placeholders."""
+        if template_name in EmailTemplateRegistry.templates:
+            return EmailTemplateRegistry.templates[template_name]
+
+        template_file = os.path.join(TEMPLATE_DIRECTORY, template_name)
+        try:
+            with open(template_file, 'r') as file:
+                text = file.read()
+        except FileNotFoundError:
+            template = None
+        else:
+            template = CompiledTemplate(
+                template_name, text, TEMPLATE_PLACEHOLDERS[template_name])
+            logging.debug(f"Email template {template_name} compiled with "
+                          f"placeholders {template.placeholders}")
+        EmailTemplateRegistry.templates[template_name] = template
+        return template
@@ -10,127 +10,440 @@
 #
 ###########################################################################
 """GetCertificateData Class"""
-import requests
+import heapq
 import logging
+import queue
+import threading
 import time
-import sys
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
 import globalSetting
 from CustomPackage.email_handler import EmailHandler
+from CustomPackage.inventory_snapshot import InventorySnapshot
 from CustomPackage.ServerResponseHandler import ServerResponseHandler
+from CustomPackage.ReadCertExpiryConfig import ReadCertExpiryConfig
+from CustomPackage.retry_scheduler import RetryScheduler
+from CustomPackage.run_metrics import RunMetrics
+from CustomPackage.sslapi_client import SSLAPIClient
+from CustomPackage.sync_watermark import SyncWatermark
+
+
+_ENDPOINT_DONE = object()
+
+
+class FetchCancelled(Exception):
+    """Raised inside a fetch thread when the consumer stopped reading."""
 
 
 class GetCertificateData:
+    endpoint_statistics = {}
+    connection_statistics = {}
+    retry_statistics = {}
+
     @staticmethod
-    def get_cert_data_for_configured_endpoints():
-        all_certificate_data = []
-        max_retries = globalSetting.confData.get('max_retries', 3)
+    def fetch_certificate_page(client, url, page_number, delta_params=None,
+                               endpoint=None):
+        """Fetch a single page of certificates without retrying.
+
+        Returns a tuple (page_data, reason, response); page_data is the
+        decoded JSON body, or None when the request did not succeed.
+        """
+        params = {"pageNumber": page_number}
+        if delta_params:
+            params.update(delta_params)
+        with RunMetrics.phase("fetch_page", endpoint=endpoint or url):
+            response = client.get(url, params=params)
+
+        success, reason = \
+            ServerResponseHandler(
+            ).ServerResponseHandlerMethod(response)
+
+        if success:
+            return response.json(), reason, response
+        return None, reason, response
+
+    @staticmethod
+    def track_max_cert_id(statistics, certs, delta_params):
+        """Record the highest certId of the page in the statistics.
+
+        A delta response containing certIds at or below the watermark means
+        the endpoint ignored the delta filter, the run is then recorded as a
+        full sync.
+        """
+        cert_ids = []
+        for cert in certs:
+            try:
+                cert_ids.append(int(cert.get("certId")))
+            except (TypeError, ValueError):
+                continue
+        if not cert_ids:
+            return
+
+        if delta_params and statistics["sync_mode"] == "delta":
+            watermark = int(next(iter(delta_params.values())))
+            if min(cert_ids) <= watermark:
+                logging.info(f"Endpoint {statistics['url']} ignored the "
+                             "delta filter, recording as full sync")
+                statistics["sync_mode"] = "full"
+
+        page_max_cert_id = max(cert_ids)
+        if statistics["max_cert_id"] is None or \
+                page_max_cert_id > statistics["max_cert_id"]:
+            statistics["max_cert_id"] = page_max_cert_id
+
+    @staticmethod
+    def fetch_endpoint_certificates(client, scheduler, endpoint, url,
+                                    max_concurrent_requests, page_consumer,
+                                    delta_params=None):
+        """Fetch every page of a single endpoint.
+
+        Page requests run on a bounded worker pool and each page's certs
+        are handed to page_consumer in page order. At most twice
+        max_concurrent_requests pages ahead of the consumer are requested
+        or held, so a slow consumer or a failing early page pauses the
+        download instead of buffering the inventory. Failed pages are
+        re-queued with the delay given by the retry scheduler while the
+        other pages of the window keep downloading. delta_params are added
+        to every page request for an incremental sync. Returns the endpoint
+        statistics; pages which could not be fetched are reported through
+        the internal email and recorded in the statistics.
+        """
+        statistics = GetCertificateData.new_endpoint_statistics(
+            endpoint, url, delta_params)
+        truncated_url = statistics["url"]
+        start_time = time.monotonic()
+        window = max_concurrent_requests * 2
+        # Pages from next_page up to next_submit are in flight, waiting
+        # for their retry, completed or failed.
+        next_page = 0
+        next_submit = 0
+        logging.info(
+            "Fetching the certificates "
+            f"from endpoint {truncated_url}")
+
+        # pending maps in-flight futures to (page, attempt), delayed is a
+        # heap of (ready_time, page, attempt) waiting for their backoff.
+        pending = {}
+        delayed = []
+        completed = {}
+        failed_pages = {}
+
+        executor = ThreadPoolExecutor(max_workers=max_concurrent_requests)
+
+        def submit(page, attempt):
+            future = executor.submit(
+                GetCertificateData.fetch_certificate_page,
+                client, url, page, delta_params, endpoint)
+            pending[future] = (page, attempt)
+
+        def handle_failure(page, attempt, reason, retry_after=None):
+            delay = scheduler.next_delay(attempt, retry_after)
+            if delay is None:
+                logging.error("Max retries reached for "
+                              f"({truncated_url}), Page {page}, "
+                              "page will not be processed in this run")
+                failed_pages[page] = reason
+                return
+            logging.info("Retrying request for "
+                         f"({truncated_url}), Page "
+                         f"{page}, "
+                         f"Retry: {attempt + 1} in {delay:.1f}s")
+            statistics["retries"] += 1
+            heapq.heappush(
+                delayed, (time.monotonic() + delay, page, attempt + 1))
 
         try:
-            for endpoint, url in \
-                    globalSetting.confData['cert_endpoints'].items(
-                    ):
-                truncated_url = url.split(".com")[0] + ".com"
-                logging.info(
-                    "Fetching the certificates "
-                    f"from endpoint {truncated_url}")
-                page_number = 0
-
-                params = {"pageNumber": 0}
-                response = requests.get(
-                    url,
-                    headers={
-                        "Authorization": "SSLAPI api_key=\""
-                        f"{globalSetting.confData['api_key']}\""},
-                    params=params)
-                total_pages = response.json().get("totalPages")
-
-                while True:
-                    params["pageNumber"] = page_number
-
-                    response = requests.get(
-                        url,
-                        headers={
-                            "Authorization": "SSLAPI api_key=\""
-                            f"{globalSetting.confData['api_key']}\""},
-                        params=params)
-
-                    success, reason = \
-                        ServerResponseHandler(
-                        ).ServerResponseHandlerMethod(response)
-
-                    if success:
-                        certificate_data = response.json()
-                        current_page_data = certificate_data.get("certs", [])
-                        all_certificate_data.extend(current_page_data)
+            # Page 0 seeds the page count, every later response may still
+            # move it when the inventory changes during the run.
+            total_pages = 1
+
+            while next_page < total_pages:
+                while next_submit < min(next_page + window, total_pages):
+                    submit(next_submit, 0)
+                    next_submit += 1
 
+                if next_page in failed_pages:
+                    next_page += 1
+                    continue
+
+                if next_page in completed:
+                    page_data = completed.pop(next_page)
+                    reported_pages = max(
+                        page_data.get("totalPages") or total_pages,
+                        next_page + 1)
+                    if next_page and reported_pages != total_pages:
                         logging.info(
-                            f"Fetched page {page_number}"
-                            f" from {truncated_url}")
+                            f"Total pages for {truncated_url} changed "
+                            f"from {total_pages} to {reported_pages} "
+                            f"at page {next_page}")
+                    if reported_pages < total_pages:
+                        for future, (page, _) in list(pending.items()):
+                            if page >= reported_pages:
+                                future.cancel()
+                                del pending[future]
+                        delayed = [entry for entry in delayed
+                                   if entry[1] < reported_pages]
+                        heapq.heapify(delayed)
+                        for pages in (completed, failed_pages):
+                            for page in [page for page in pages
+                                         if page >= reported_pages]:
+                                del pages[page]
+                        next_submit = min(next_submit, reported_pages)
+                    total_pages = reported_pages
+                    statistics["total_pages"] = total_pages
 
-                        page_number += 1
+                    current_page_data = page_data.get("certs", [])
+                    GetCertificateData.track_max_cert_id(
+                        statistics, current_page_data, delta_params)
+                    page_consumer(current_page_data)
+                    statistics["certificates"] += len(current_page_data)
+                    statistics["pages_fetched"] += 1
+                    logging.info(
+                        f"Fetched page {next_page}"
+                        f" from {truncated_url}")
+                    next_page += 1
+                    continue
 
-                    elif response.status_code in [500, 502, 503, 504]:
-                        retries = 0
+                now = time.monotonic()
+                while delayed and delayed[0][0] <= now:
+                    _, page, attempt = heapq.heappop(delayed)
+                    submit(page, attempt)
+                timeout = delayed[0][0] - now if delayed else None
 
-                        while retries < max_retries:
-                            logging.info("Retrying request for "
-                                         f"({truncated_url}), Page "
-                                         f"{page_number}, "
-                                         f"Retry: {retries + 1}")
-                            time.sleep(300)
-                            response = requests.get(
-                                url,
-                                headers={
-                                    "Authorization": "SSLAPI api_key=\""
-                                    f"{globalSetting.confData['api_key']}\""},
-                                params=params)
-                            retry_success, retry_reason = \
-                                ServerResponseHandler(
-                                ).ServerResponseHandlerMethod(response)
-
-                            if retry_success:
-                                logging.info("Retry Succeeded for "
-                                             f"({truncated_url}), Page "
-                                             f"{page_number}, "
-                                             f"Retry: {retries + 1}")
-                                certificate_data = response.json()
-                                current_page_data = certificate_data.get(
-                                    "certs", [])
-                                all_certificate_data.extend(current_page_data)
-                                logging.info(
-                                    f"Fetched page {page_number} from "
-                                    f"{truncated_url}")
-                                page_number += 1
-                                break
-                            retries += 1
-                        else:
-                            logging.error("Max retries reached for "
-                                          f"({truncated_url}), stopping "
-                                          "further processing for this "
-                                          "endpoint")
-                            EmailHandler.trigger_internal_email(
-                                f'{retry_reason} received for '
-                                f'{truncated_url}.')
-                            break
+                if not pending:
+                    time.sleep(timeout)
+                    continue
+
+                done, _ = wait(pending, timeout=timeout,
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    page, attempt = pending.pop(future)
+                    try:
+                        page_data, reason, response = future.result()
+                    except requests.exceptions.RequestException as e:
+                        handle_failure(
+                            page, attempt,
+                            "Exception while processing response from "
+                            f"{truncated_url} for page number {page}. "
+                            f"Exception during processing : {e}")
+                        continue
 
+                    if page_data is not None:
+                        if attempt:
+                            logging.info("Retry Succeeded for "
+                                         f"({truncated_url}), Page "
+                                         f"{page}, "
+                                         f"Retry: {attempt}")
+                        completed[page] = page_data
+                    elif response.status_code in [500, 502, 503, 504]:
+                        handle_failure(
+                            page, attempt, reason,
+                            RetryScheduler.parse_retry_after(
+                                response.headers.get("Retry-After")))
                     else:
                         logging.error('Unexpected HTTP response from '
-                                      f'({truncated_url}), Response received'
-                                      f' is {response.status_code}')
-                        EmailHandler.trigger_internal_email(
-                            f"{reason} received for {truncated_url}.")
-                        break
-
-                    if page_number >= total_pages:
-                        break
+                                      f'({truncated_url}), Response '
+                                      f'received is {response.status_code}')
+                        failed_pages[page] = reason
 
-            return all_certificate_data
-
-        except requests.exceptions.RequestException as e:
+        except FetchCancelled:
+            logging.info(f"Fetching from {truncated_url} cancelled at page "
+                         f"{next_page}")
+        except Exception as e:
             reason = ("Exception while processing response from "
-                      f"{truncated_url} for page number {page_number}."
+                      f"{truncated_url} for page number {next_page}."
                       f" Exception during processing : {e}")
+            failed_pages.setdefault(next_page, reason)
             logging.error(reason)
-            EmailHandler.trigger_internal_email(reason)
-            logging.info('Certificate Expiry Notification tool ended')
-            sys.exit()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        return GetCertificateData.finish_endpoint_statistics(
+            statistics, failed_pages, start_time)
+
+    @staticmethod
+    def new_endpoint_statistics(endpoint, url, delta_params=None):
+        return {
+            "endpoint": endpoint,
+            "url": url.split(".com")[0] + ".com",
+            "total_pages": 0,
+            "pages_fetched": 0,
+            "certificates": 0,
+            "retries": 0,
+            "failed_pages": [],
+            "sync_mode": "delta" if delta_params else "full",
+            "max_cert_id": None,
+            "elapsed_seconds": 0.0,
+            "error": None,
+        }
+
+    @staticmethod
+    def finish_endpoint_statistics(statistics, failed_pages, start_time):
+        """Record the failed pages, report them through the internal email
+        and log the endpoint summary. failed_pages maps each page which
+        could not be fetched to the reason."""
+        truncated_url = statistics["url"]
+        if failed_pages:
+            statistics["failed_pages"] = sorted(failed_pages)
+            statistics["error"] = failed_pages[min(failed_pages)]
+            EmailHandler.trigger_internal_email(
+                f'{statistics["error"]} received for {truncated_url}. '
+                f'Pages not processed : {statistics["failed_pages"]}')
+
+        statistics["elapsed_seconds"] = round(
+            time.monotonic() - start_time, 3)
+        GetCertificateData.record_endpoint_metrics(statistics)
+        logging.info(
+            f"Endpoint {truncated_url} fetched "
+            f"{statistics['pages_fetched']}/{statistics['total_pages']} "
+            f"pages, {statistics['certificates']} certificates with "
+            f"{statistics['retries']} retries in "
+            f"{statistics['elapsed_seconds']}s")
+        return statistics
+
+    @staticmethod
+    def record_endpoint_metrics(statistics):
+        endpoint = statistics["endpoint"]
+        RunMetrics.observe("fetch_endpoint", statistics["elapsed_seconds"],
+                           endpoint=endpoint)
+        RunMetrics.increment("pages_fetched", statistics["pages_fetched"],
+                             endpoint=endpoint)
+        RunMetrics.increment("pages_failed",
+                             len(statistics["failed_pages"]),
+                             endpoint=endpoint)
+        RunMetrics.increment("page_retries", statistics["retries"],
+                             endpoint=endpoint)
+        RunMetrics.increment("certificates_fetched",
+                             statistics["certificates"], endpoint=endpoint)
+
+    @staticmethod
+    def new_retry_scheduler():
+        return RetryScheduler(
+            max_retries=ReadCertExpiryConfig.get_numeric_setting(
+                'max_retries', 3, allow_zero=True),
+            base_delay=ReadCertExpiryConfig.get_numeric_setting(
+                'retry_backoff_base', 5, (int, float)),
+            max_delay=ReadCertExpiryConfig.get_numeric_setting(
+                'retry_backoff_max', 300, (int, float)),
+            time_budget=ReadCertExpiryConfig.get_numeric_setting(
+                'retry_time_budget', 1800, (int, float)))
+
+    @staticmethod
+    def iter_certificates():
+        """Yield the certificates of every configured endpoint as their
+        pages arrive.
+
+        Endpoints are fetched concurrently on background threads which
+        start on the first iteration. Pages of one endpoint are yielded in
+        page order; a bounded queue keeps at most a few pages in memory
+        and pauses fetching while the consumer is busy. Closing the
+        generator early cancels the outstanding fetches.
+
+        Every page is also added to the inventory snapshot of the run,
+        which is written once all endpoints are fetched. With the
+        replay_snapshot config parameter the certificates of that snapshot
+        are yielded instead and no endpoint is fetched.
+        """
+        replay_snapshot = globalSetting.confData.get('replay_snapshot')
+        if replay_snapshot:
+            # No endpoint statistics, so the sync watermarks are unchanged.
+            GetCertificateData.endpoint_statistics = {}
+            yield from InventorySnapshot.iter_replay(replay_snapshot)
+            return
+
+        max_concurrent_requests = ReadCertExpiryConfig.get_numeric_setting(
+            'max_concurrent_requests', 4)
+
+        cert_endpoints = list(
+            globalSetting.confData['cert_endpoints'].items())
+        GetCertificateData.endpoint_statistics = {}
+        client = SSLAPIClient(
+            globalSetting.confData['api_key'],
+            pool_size=ReadCertExpiryConfig.get_numeric_setting(
+                'http_pool_size', max_concurrent_requests),
+            connect_timeout=ReadCertExpiryConfig.get_numeric_setting(
+                'connect_timeout', 10, (int, float)),
+            read_timeout=ReadCertExpiryConfig.get_numeric_setting(
+                'read_timeout', 60, (int, float)))
+        scheduler = GetCertificateData.new_retry_scheduler()
+
+        snapshot = InventorySnapshot.from_config()
+        page_queue = queue.Queue(
+            maxsize=max_concurrent_requests * max(len(cert_endpoints), 1))
+        cancelled = threading.Event()
+
+        def put_page(item):
+            while not cancelled.is_set():
+                try:
+                    page_queue.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+            raise FetchCancelled()
+
+        def fetch_endpoint(endpoint, url):
+            def consume_page(certs):
+                if snapshot is not None:
+                    snapshot.add_page(endpoint, certs)
+                put_page(certs)
+
+            try:
+                return GetCertificateData.fetch_endpoint_certificates(
+                    client, scheduler, endpoint, url,
+                    max_concurrent_requests, consume_page,
+                    SyncWatermark.get_delta_params(endpoint, url))
+            finally:
+                try:
+                    put_page(_ENDPOINT_DONE)
+                except FetchCancelled:
+                    pass
+
+        # Every endpoint is fetched on its own thread; a slow or failing
+        # endpoint neither delays nor discards the others.
+        executor = ThreadPoolExecutor(
+            max_workers=max(len(cert_endpoints), 1))
+        try:
+            futures = [
+                executor.submit(fetch_endpoint, endpoint, url)
+                for endpoint, url in cert_endpoints]
+
+            remaining_endpoints = len(futures)
+            while remaining_endpoints:
+                current_page_data = page_queue.get()
+                if current_page_data is _ENDPOINT_DONE:
+                    remaining_endpoints -= 1
+                    continue
+                yield from current_page_data
+
+        finally:
+            cancelled.set()
+            executor.shutdown(wait=True)
+            GetCertificateData.connection_statistics = \
+                client.connection_statistics()
+            client.close()
+
+        for (endpoint, url), future in zip(cert_endpoints, futures):
+            GetCertificateData.endpoint_statistics[endpoint] = \
+                future.result()
+
+        if snapshot is not None:
+            snapshot.write(GetCertificateData.endpoint_statistics)
+
+        GetCertificateData.retry_statistics = scheduler.statistics()
+        logging.info(
+            "SSLAPI retries: "
+            f"{GetCertificateData.retry_statistics['retry_attempts']} "
+            "attempts, "
+            f"{GetCertificateData.retry_statistics['backoff_seconds']}s "
+            "total backoff")
+        for host, counters in \
+                GetCertificateData.connection_statistics.items():
+            logging.info(
+                f"SSLAPI connections to {host}: "
+                f"{counters['handshakes']} handshakes, "
+                f"{counters['requests']} requests, "
+                f"{counters['reused']} reused")
+
+    @staticmethod
+    def get_cert_data_for_configured_endpoints():
+        return list(GetCertificateData.iter_certificates())
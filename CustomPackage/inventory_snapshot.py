@@ -0,0 +1,333 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: inventory_snapshot
+# Description: Columnar snapshot of the raw SSLAPI inventory fetched by a
+#       run. Every endpoint's certificates are written with all their
+#       fields to a compressed Arrow IPC (Feather v2) file page by page as
+#       they are fetched, so the snapshot does not hold the inventory in
+#       memory. The manifest.json with the endpoint statistics is written
+#       at the end of the run and marks the snapshot complete:
+#           <inventory_snapshot_directory>/<YYYYmmddTHHMMSS>/
+#               manifest.json
+#               <endpoint>.arrow
+#               <endpoint>.1.arrow ... when later pages add fields
+#       Snapshots can be memory-mapped with only the needed columns read
+#       through load_table, and a past snapshot can be replayed in place
+#       of the SSLAPI with the replay_snapshot config parameter.
+#       pyarrow is optional; without it no snapshot is written.
+#
+###########################################################################
+"""InventorySnapshot Class"""
+
+import datetime
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import globalSetting
+from CustomPackage.ReadCertExpiryConfig import ReadCertExpiryConfig
+from CustomPackage.run_clock import RunClock
+
+# pyarrow is imported on first use by import_pyarrow.
+pa = None
+feather = None
+
+SNAPSHOT_MANIFEST = "manifest.json"
+SNAPSHOT_SUFFIX = ".arrow"
+SNAPSHOT_COMPRESSIONS = ("zstd", "lz4", "uncompressed")
+SNAPSHOT_NAME_PATTERN = re.compile(r"\d{8}T\d{6}\Z")
+REPLAY_BATCH_SIZE = 10000
+
+
+class SnapshotError(Exception):
+    """Raised for a snapshot which cannot be replayed or loaded."""
+
+
+class EndpointWriter:
+    """Arrow IPC files of one endpoint of a snapshot. A page whose fields
+    do not fit the schema of the current file starts a new file."""
+
+    def __init__(self, path, endpoint, options):
+        self.path = path
+        self.endpoint = endpoint
+        self.options = options
+        self.files = []
+        self.rows = 0
+        self.writer = None
+        self.schema = None
+
+    def write_page(self, table):
+        if self.writer is not None and \
+                not table.schema.equals(self.schema):
+            fitted = self.fit(table)
+            if fitted is None:
+                self.close()
+            else:
+                table = fitted
+        if self.writer is None:
+            name = self.endpoint + (
+                f".{len(self.files)}" if self.files else "") + \
+                SNAPSHOT_SUFFIX
+            self.writer = pa.ipc.new_file(
+                os.path.join(self.path, name), table.schema,
+                options=self.options)
+            self.schema = table.schema
+            self.files.append(name)
+        self.writer.write_table(table)
+        self.rows += table.num_rows
+
+    def fit(self, table):
+        """Return the page cast to the schema of the current file, with
+        nulls for the fields it lacks. None when it has other fields or
+        types."""
+        schema = self.schema
+        try:
+            if not pa.unify_schemas(
+                    [schema, table.schema],
+                    promote_options="permissive").equals(schema):
+                return None
+            return pa.Table.from_arrays([
+                table.column(field.name).cast(field.type)
+                if field.name in table.column_names
+                else pa.nulls(table.num_rows, field.type)
+                for field in schema], schema=schema)
+        except (pa.ArrowException, TypeError, ValueError):
+            return None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def remove(self):
+        self.close()
+        for name in self.files:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+        self.files = []
+
+
+class InventorySnapshot:
+    def __init__(self, directory, compression="zstd", retention=7):
+        self.directory = directory
+        self.compression = compression
+        self.retention = retention
+        self.path = None
+        self.writers = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def import_pyarrow():
+        """Import pyarrow, return None when it is not installed."""
+        global pa, feather
+        if pa is None:
+            try:
+                import pyarrow
+                import pyarrow.feather
+                import pyarrow.ipc
+            except ImportError:
+                return None
+            pa, feather = pyarrow, pyarrow.feather
+        return pa
+
+    @staticmethod
+    def from_config():
+        """Return the snapshot writer of this run, None when snapshots are
+        disabled or pyarrow is not installed."""
+        if not globalSetting.confData.get('inventory_snapshot', True):
+            return None
+        if InventorySnapshot.import_pyarrow() is None:
+            logging.info("pyarrow is not installed, the inventory snapshot "
+                         "will not be written.")
+            return None
+        compression = globalSetting.confData.get(
+            'inventory_snapshot_compression', 'zstd')
+        if compression not in SNAPSHOT_COMPRESSIONS:
+            compression = 'zstd'
+        return InventorySnapshot(
+            globalSetting.confData.get(
+                'inventory_snapshot_directory') or 'snapshots',
+            compression,
+            ReadCertExpiryConfig.get_numeric_setting(
+                'inventory_snapshot_retention', 7))
+
+    def open_directory(self):
+        """Create the directory of the snapshot on the first page."""
+        if self.path is None:
+            self.path = os.path.join(
+                self.directory,
+                datetime.datetime.now().strftime("%Y%m%dT%H%M%S"))
+            os.makedirs(self.path, exist_ok=True)
+        return self.path
+
+    def add_page(self, endpoint, certs):
+        """Convert one page of raw certificates to Arrow and append it to
+        the endpoint's file. Called from the endpoint's fetch thread, so
+        the conversion overlaps the fetch."""
+        if not certs or endpoint in self.errors:
+            return
+        try:
+            table = pa.Table.from_struct_array(pa.array(certs))
+            with self._lock:
+                writer = self.writers.get(endpoint)
+                if writer is None:
+                    writer = self.writers[endpoint] = EndpointWriter(
+                        self.open_directory(), endpoint,
+                        pa.ipc.IpcWriteOptions(
+                            compression=None
+                            if self.compression == "uncompressed"
+                            else self.compression))
+            writer.write_page(table)
+        except (OSError, pa.ArrowException, TypeError, ValueError) as e:
+            self.discard(endpoint, e)
+
+    def discard(self, endpoint, error):
+        logging.error(f"Inventory snapshot of {endpoint} discarded, the "
+                      f"certificates could not be written: {error}")
+        with self._lock:
+            self.errors[endpoint] = str(error)
+            writer = self.writers.pop(endpoint, None)
+        if writer is not None:
+            writer.remove()
+
+    def write(self, endpoint_statistics):
+        """Close the endpoint files, write the manifest of the run and
+        prune the snapshots beyond the retention. A failure is logged and
+        never fails the run."""
+        try:
+            path = self.open_directory()
+            manifest = {
+                "run_date": RunClock.today_iso(),
+                "compression": self.compression,
+                "endpoints": {},
+            }
+            for endpoint, statistics in endpoint_statistics.items():
+                entry = {
+                    "url": statistics.get("url"),
+                    "sync_mode": statistics.get("sync_mode"),
+                    "pages_fetched": statistics.get("pages_fetched"),
+                    "failed_pages": statistics.get("failed_pages"),
+                    "certificates": 0,
+                    "file": None,
+                    "files": [],
+                }
+                writer = self.writers.get(endpoint)
+                if endpoint in self.errors:
+                    entry["error"] = self.errors[endpoint]
+                elif writer is not None and writer.files:
+                    writer.close()
+                    entry["file"] = writer.files[0]
+                    entry["files"] = writer.files
+                    entry["certificates"] = writer.rows
+                manifest["endpoints"][endpoint] = entry
+
+            # The manifest is written last, a snapshot without one is
+            # incomplete and is never replayed.
+            with open(os.path.join(path, SNAPSHOT_MANIFEST), 'w') as f:
+                json.dump(manifest, f, indent=2)
+        except (OSError, pa.ArrowException, TypeError, ValueError) as e:
+            logging.error("Error while writing the inventory snapshot. "
+                          f"Exception : {e}")
+            return None
+        finally:
+            for writer in self.writers.values():
+                writer.close()
+            self.writers = {}
+
+        logging.info(f"Inventory snapshot written to {path}")
+        InventorySnapshot.prune(self.directory, self.retention)
+        return path
+
+    @staticmethod
+    def list_snapshots(directory):
+        """Return the complete snapshots of the directory, oldest first."""
+        if not os.path.isdir(directory):
+            return []
+        return [os.path.join(directory, name)
+                for name in sorted(os.listdir(directory))
+                if SNAPSHOT_NAME_PATTERN.match(name) and os.path.exists(
+                    os.path.join(directory, name, SNAPSHOT_MANIFEST))]
+
+    @staticmethod
+    def list_incomplete_snapshots(directory):
+        """Return the snapshots left without a manifest by a failed run."""
+        if not os.path.isdir(directory):
+            return []
+        return [os.path.join(directory, name)
+                for name in sorted(os.listdir(directory))
+                if SNAPSHOT_NAME_PATTERN.match(name) and not os.path.exists(
+                    os.path.join(directory, name, SNAPSHOT_MANIFEST))]
+
+    @staticmethod
+    def prune(directory, retention):
+        """Remove the complete snapshots beyond the retention and the
+        incomplete ones. Called once the snapshot of the run is
+        complete."""
+        for path in InventorySnapshot.list_snapshots(directory)[
+                :-retention] + \
+                InventorySnapshot.list_incomplete_snapshots(directory):
+            try:
+                shutil.rmtree(path)
+                logging.info(f"Removed inventory snapshot {path}")
+            except OSError as e:
+                logging.error(f"Error while removing inventory snapshot "
+                              f"{path}. Exception : {e}")
+
+    @staticmethod
+    def load_manifest(path):
+        try:
+            with open(os.path.join(path, SNAPSHOT_MANIFEST)) as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise SnapshotError(
+                f"Inventory snapshot {path} could not be read: {e}") \
+                from None
+
+    @staticmethod
+    def load_table(file_path, columns=None):
+        """Memory-map one endpoint file of a snapshot, reading only the
+        given columns. Uncompressed snapshots are read without a copy."""
+        if InventorySnapshot.import_pyarrow() is None:
+            raise SnapshotError("pyarrow is required to read the inventory "
+                                "snapshot.")
+        try:
+            return feather.read_table(file_path, columns=columns,
+                                      memory_map=True)
+        except (OSError, pa.ArrowException) as e:
+            raise SnapshotError(
+                f"Inventory snapshot {file_path} could not be read: {e}") \
+                from None
+
+    @staticmethod
+    def iter_replay(path):
+        """Yield the certificates of a snapshot the way the SSLAPI returned
+        them. Fields the certificate did not carry are left out."""
+        manifest = InventorySnapshot.load_manifest(path)
+        logging.info(f"Replaying inventory snapshot {path} of "
+                     f"{manifest.get('run_date')} instead of fetching from "
+                     "the SSLAPI.")
+        for endpoint, entry in manifest.get("endpoints", {}).items():
+            if entry.get("error"):
+                logging.error(f"Inventory snapshot {path} has no "
+                              f"certificates for {endpoint}: "
+                              f"{entry['error']}")
+                continue
+            files = entry.get("files") or \
+                ([entry["file"]] if entry.get("file") else [])
+            if files:
+                logging.info(f"Replaying {entry.get('certificates')} "
+                             f"certificates of {endpoint}")
+            for file_name in files:
+                table = InventorySnapshot.load_table(
+                    os.path.join(path, file_name))
+                for batch in table.to_batches(REPLAY_BATCH_SIZE):
+                    for cert in batch.to_pylist():
+                        yield {field: value
+                               for field, value in cert.items()
+                               if value is not None}
@@ -0,0 +1,92 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: notification_dispatcher
+# Description: Hands notification batches to a bounded queue drained by a
+#              configurable number of SMTP worker threads. A shared token
+#              bucket caps the messages sent per second across all workers
+#              so the relay does not throttle the job.
+#
+###########################################################################
+"""NotificationDispatcher Class"""
+
+import logging
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class RateLimiter:
+    def __init__(self, max_per_second):
+        self.max_per_second = max_per_second
+        self._tokens = float(max_per_second or 0)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until one message may be sent."""
+        if not self.max_per_second:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self._tokens + (now - self._updated) *
+                    self.max_per_second,
+                    float(self.max_per_second))
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = (1 - self._tokens) / self.max_per_second
+            time.sleep(wait_time)
+
+
+class NotificationDispatcher:
+    def __init__(self, send_batch, workers=1, max_messages_per_second=0):
+        """send_batch(batch, rate_limiter) sends one batch and returns a
+        result per item of the batch."""
+        self.send_batch = send_batch
+        self.workers = max(workers, 1)
+        self.rate_limiter = RateLimiter(max_messages_per_second)
+
+    def dispatch(self, batches):
+        """Send every batch and return a list of (item, result) pairs in
+        batch order."""
+        batches = list(batches)
+        results = [None] * len(batches)
+        work_queue = queue.Queue(maxsize=self.workers * 2)
+
+        def worker():
+            while True:
+                work = work_queue.get()
+                if work is _STOP:
+                    return
+                index, batch = work
+                try:
+                    results[index] = self.send_batch(
+                        batch, self.rate_limiter)
+                except Exception as e:
+                    logging.error(
+                        f"Notification worker failed to send a batch of "
+                        f"{len(batch)} emails. Exception : {e}")
+                    results[index] = [e] * len(batch)
+
+        threads = [threading.Thread(target=worker, daemon=True)
+                   for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            for index, batch in enumerate(batches):
+                work_queue.put((index, batch))
+        finally:
+            for _ in threads:
+                work_queue.put(_STOP)
+            for thread in threads:
+                thread.join()
+
+        return [(item, result)
+                for batch, batch_results in zip(batches, results)
+                for item, result in zip(batch, batch_results)]
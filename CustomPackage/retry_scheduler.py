@@ -0,0 +1,79 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: retry_scheduler
+# Description: Computes retry delays for failed SSLAPI page requests using
+#              exponential backoff with jitter, honours Retry-After headers
+#              and enforces a per-run retry time budget. Retry attempts and
+#              total backoff time are tracked for the run statistics.
+#
+###########################################################################
+"""RetryScheduler Class"""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+
+class RetryScheduler:
+    def __init__(self, max_retries=3, base_delay=5, max_delay=300,
+                 time_budget=1800):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = time.monotonic() + time_budget
+        self.retry_attempts = 0
+        self.backoff_seconds = 0.0
+        self.budget_exhausted = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parse_retry_after(value):
+        """Return the Retry-After header value in seconds, or None."""
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(
+            (retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+    def next_delay(self, attempt, retry_after=None):
+        """Return the delay before retry number attempt + 1.
+
+        Returns None when the retries for the request are exhausted or the
+        retry would not complete within the run time budget.
+        """
+        if attempt >= self.max_retries:
+            return None
+
+        if retry_after is not None:
+            delay = retry_after
+        else:
+            backoff = min(self.base_delay * (2 ** attempt), self.max_delay)
+            delay = backoff / 2 + random.uniform(0, backoff / 2)
+
+        with self._lock:
+            if time.monotonic() + delay > self.deadline:
+                self.budget_exhausted = True
+                return None
+            self.retry_attempts += 1
+            self.backoff_seconds += delay
+        return delay
+
+    def statistics(self):
+        with self._lock:
+            return {
+                "retry_attempts": self.retry_attempts,
+                "backoff_seconds": round(self.backoff_seconds, 3),
+                "budget_exhausted": self.budget_exhausted,
+            }
@@ -0,0 +1,56 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: run_clock
+# Description: Run-wide "today" reference. The run date is pinned once at
+#       job start so every step of a run computes days until expiry
+#       against the same date, even when the run crosses midnight.
+#       It can be overridden for testing and backfills with the
+#       CERT_EXPIRY_RUN_DATE environment variable or the run_date config
+#       parameter (YYYY-MM-DD), the environment variable taking precedence.
+#
+###########################################################################
+"""RunClock Class"""
+
+import datetime
+import logging
+import os
+import globalSetting
+
+RUN_DATE_ENVIRONMENT_VARIABLE = "CERT_EXPIRY_RUN_DATE"
+
+
+class RunClock:
+    run_date = None
+
+    @staticmethod
+    def start():
+        """Pin the run date. Raises ValueError for an invalid override."""
+        override = os.environ.get(RUN_DATE_ENVIRONMENT_VARIABLE)
+        source = RUN_DATE_ENVIRONMENT_VARIABLE
+        if not override:
+            override = globalSetting.confData.get('run_date')
+            source = "run_date config parameter"
+        if override:
+            try:
+                RunClock.run_date = datetime.date.fromisoformat(override)
+            except (TypeError, ValueError):
+                raise ValueError(
+                    f"Invalid run date {override!r} in {source}, "
+                    "expected YYYY-MM-DD.") from None
+            logging.info(f"Run date overridden to {RunClock.run_date} "
+                         f"by {source}.")
+        else:
+            RunClock.run_date = datetime.date.today()
+            logging.info(f"Run date pinned to {RunClock.run_date}.")
+        return RunClock.run_date
+
+    @staticmethod
+    def today():
+        if RunClock.run_date is None:
+            RunClock.start()
+        return RunClock.run_date
+
+    @staticmethod
+    def today_iso():
+        return RunClock.today().isoformat()
@@ -0,0 +1,259 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: run_metrics
+# Description: Structured metrics of a run, recorded next to the log.
+#   a)Phase timings: count, total and longest duration of every phase of
+#       the run (config load, template check, fetch of every endpoint and
+#       page, populate, rebucket, notify, bookmark write ...).
+#   b)Counters: pages fetched and failed, retries, certificates ingested,
+#       bucket moves, emails sent and failed ...
+#       At the end of the run, including a run ending on an error, they
+#       are written to a JSON run report (run_report_path config parameter)
+#       and in the Prometheus text format for the node_exporter textfile
+#       collector (metrics_textfile_path config parameter). An empty path
+#       disables the output.
+#
+###########################################################################
+"""RunMetrics Class"""
+
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+import globalSetting
+
+RUN_REPORT_PATH = "run_report.json"
+METRICS_TEXTFILE_PATH = "cert_expiry_notification.prom"
+METRICS_PREFIX = "cert_expiry"
+# Reported as 0 when the run never reached them, so alerts on them do not
+# go stale.
+RUN_COUNTERS = ("certificates_ingested", "bucket_moves", "emails_sent",
+                "emails_failed")
+
+
+class PhaseTimer:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.start_time = None
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        RunMetrics.observe(self.name, time.perf_counter() - self.start_time,
+                           **self.labels)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        return self.__exit__(exc_type, exc_value, traceback)
+
+
+class RunMetrics:
+    started_at = None
+    start_time = None
+    succeeded = False
+    execution_mode = "sync"
+    # (name, labels) -> [count, total seconds, max seconds]
+    phases = {}
+    # (name, labels) -> value
+    counters = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def start():
+        """Reset the metrics for a new run."""
+        with RunMetrics._lock:
+            RunMetrics.started_at = datetime.datetime.now(
+                datetime.timezone.utc)
+            RunMetrics.start_time = time.monotonic()
+            RunMetrics.succeeded = False
+            RunMetrics.execution_mode = "sync"
+            RunMetrics.phases = {}
+            RunMetrics.counters = {
+                RunMetrics.key(name, {}): 0 for name in RUN_COUNTERS}
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted(
+            (label, str(value)) for label, value in labels.items()))
+
+    @staticmethod
+    def phase(name, **labels):
+        """Return a context manager timing the enclosed block as one run of
+        the phase, also when it raises or exits. It can be used with
+        'async with' as well."""
+        return PhaseTimer(name, labels)
+
+    @staticmethod
+    def observe(name, seconds, **labels):
+        """Record one run of the phase which took seconds."""
+        key = RunMetrics.key(name, labels)
+        with RunMetrics._lock:
+            timing = RunMetrics.phases.get(key)
+            if timing is None:
+                RunMetrics.phases[key] = [1, seconds, seconds]
+            else:
+                timing[0] += 1
+                timing[1] += seconds
+                timing[2] = max(timing[2], seconds)
+
+    @staticmethod
+    def increment(name, value=1, **labels):
+        key = RunMetrics.key(name, labels)
+        with RunMetrics._lock:
+            RunMetrics.counters[key] = \
+                RunMetrics.counters.get(key, 0) + value
+
+    @staticmethod
+    def set_execution_mode(execution_mode):
+        RunMetrics.execution_mode = execution_mode
+
+    @staticmethod
+    def mark_succeeded():
+        RunMetrics.succeeded = True
+
+    @staticmethod
+    def duration():
+        if RunMetrics.start_time is None:
+            return 0.0
+        return time.monotonic() - RunMetrics.start_time
+
+    @staticmethod
+    def report():
+        """Return the run report as a JSON serializable dict."""
+        with RunMetrics._lock:
+            phases = sorted(RunMetrics.phases.items())
+            counters = sorted(RunMetrics.counters.items())
+        return {
+            "version": getattr(globalSetting, "version", None),
+            "started_at": RunMetrics.started_at.isoformat()
+            if RunMetrics.started_at else None,
+            "duration_seconds": round(RunMetrics.duration(), 3),
+            "status": "succeeded" if RunMetrics.succeeded else "failed",
+            "execution_mode": RunMetrics.execution_mode,
+            "phases": [
+                {"phase": name, "labels": dict(labels), "count": count,
+                 "total_seconds": round(total, 6),
+                 "max_seconds": round(longest, 6)}
+                for (name, labels), (count, total, longest) in phases],
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in counters],
+        }
+
+    @staticmethod
+    def format_labels(labels):
+        if not labels:
+            return ""
+        escaped = (
+            (label, value.replace("\\", "\\\\").replace("\n", "\\n")
+             .replace('"', '\\"'))
+            for label, value in labels)
+        return "{" + ",".join(
+            f'{label}="{value}"' for label, value in escaped) + "}"
+
+    @staticmethod
+    def textfile():
+        """Return the metrics in the Prometheus text exposition format."""
+        report_time = time.time()
+        with RunMetrics._lock:
+            phases = sorted(RunMetrics.phases.items())
+            counters = sorted(RunMetrics.counters.items())
+        lines = [
+            f"# HELP {METRICS_PREFIX}_run_success Whether the last run "
+            "succeeded.",
+            f"# TYPE {METRICS_PREFIX}_run_success gauge",
+            f"{METRICS_PREFIX}_run_success {int(RunMetrics.succeeded)}",
+            f"# HELP {METRICS_PREFIX}_run_duration_seconds Duration of the "
+            "last run.",
+            f"# TYPE {METRICS_PREFIX}_run_duration_seconds gauge",
+            f"{METRICS_PREFIX}_run_duration_seconds "
+            f"{RunMetrics.duration():.6f}",
+            f"# HELP {METRICS_PREFIX}_run_timestamp_seconds End time of the "
+            "last run.",
+            f"# TYPE {METRICS_PREFIX}_run_timestamp_seconds gauge",
+            f"{METRICS_PREFIX}_run_timestamp_seconds {report_time:.3f}",
+        ]
+
+        phase_metrics = (
+            ("phase_seconds", "Total duration of the phase in the last "
+             "run.", lambda timing: f"{timing[1]:.6f}"),
+            ("phase_max_seconds", "Longest single run of the phase in the "
+             "last run.", lambda timing: f"{timing[2]:.6f}"),
+            ("phase_count", "Runs of the phase in the last run.",
+             lambda timing: str(timing[0])),
+        )
+        for metric, description, value in phase_metrics:
+            if not phases:
+                break
+            metric = f"{METRICS_PREFIX}_{metric}"
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} gauge")
+            for (name, labels), timing in phases:
+                lines.append(
+                    f"{metric}"
+                    f"{RunMetrics.format_labels((('phase', name),) + labels)}"
+                    f" {value(timing)}")
+
+        # Every run starts its counters from zero, so they are exposed as
+        # gauges of the last run.
+        names = sorted({name for (name, _), _ in counters})
+        for name in names:
+            metric = f"{METRICS_PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {name.replace('_', ' ')} in "
+                         "the last run.")
+            lines.append(f"# TYPE {metric} gauge")
+            for (counter, labels), value in counters:
+                if counter == name:
+                    lines.append(f"{metric}"
+                                 f"{RunMetrics.format_labels(labels)}"
+                                 f" {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def write_file(path, content):
+        # The textfile collector may read the file at any time, so it is
+        # replaced in one step.
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "w") as f:
+            f.write(content)
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def get_path(name, default):
+        # The config may not be loaded when the run ended early.
+        config_data = getattr(globalSetting, "confData", None)
+        path = config_data.get(name, default) \
+            if isinstance(config_data, dict) else default
+        return path if isinstance(path, str) else default
+
+    @staticmethod
+    def write_reports():
+        """Write the JSON run report and the Prometheus textfile. A failure
+        is logged and never fails the run."""
+        outputs = (
+            ("run_report_path", RUN_REPORT_PATH,
+             lambda: json.dumps(RunMetrics.report(), indent=2) + "\n"),
+            ("metrics_textfile_path", METRICS_TEXTFILE_PATH,
+             RunMetrics.textfile),
+        )
+        for name, default, render in outputs:
+            path = RunMetrics.get_path(name, default)
+            if not path:
+                continue
+            try:
+                RunMetrics.write_file(path, render())
+            except OSError as e:
+                logging.error(f"Error while writing the run metrics to "
+                              f"{path}. Exception : {e}")
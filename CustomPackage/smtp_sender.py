@@ -0,0 +1,192 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: smtp_sender
+# Description: Pooled SMTP sender used for all email notifications of a
+#              run. Keeps up to pool_size SMTP connections open for the
+#              whole run instead of connecting once per email, recycles a
+#              connection after max_messages_per_connection messages,
+#              reconnects transparently when the server drops a connection
+#              and records per-message timing and failure metrics.
+#
+###########################################################################
+"""SMTPSender Class"""
+
+import logging
+import queue
+import smtplib
+import threading
+import time
+
+
+class SMTPSender:
+    def __init__(self, smtp_server, smtp_port, pool_size=1, timeout=30,
+                 max_messages_per_connection=100):
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.timeout = timeout
+        self.max_messages_per_connection = max_messages_per_connection
+        self._idle_connections = queue.LifoQueue()
+        self._connection_slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+        self.reconnects = 0
+        self.messages_sent = 0
+        self.messages_failed = 0
+        self.send_seconds = 0.0
+        self.max_send_seconds = 0.0
+
+    def _open_connection(self):
+        connection = smtplib.SMTP(
+            self.smtp_server, self.smtp_port, timeout=self.timeout)
+        connection.messages_sent = 0
+        with self._lock:
+            self.connections_opened += 1
+        return connection
+
+    def _acquire_slot(self):
+        """Take a connection slot, return an idle connection or None."""
+        self._connection_slots.acquire()
+        try:
+            return self._idle_connections.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _acquire_connection(self):
+        connection = self._acquire_slot()
+        if connection is not None:
+            return connection
+        try:
+            return self._open_connection()
+        except BaseException:
+            self._connection_slots.release()
+            raise
+
+    def _release_connection(self, connection):
+        if connection is not None:
+            if connection.messages_sent < self.max_messages_per_connection:
+                self._idle_connections.put(connection)
+            else:
+                self._quit(connection)
+        self._connection_slots.release()
+
+    @staticmethod
+    def _quit(connection):
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+
+    def _send_on(self, connection, sender_email, receiver_email, message):
+        """Send one message on the given connection, reconnecting once if
+        the server dropped it. Returns the connection to keep using."""
+        start_time = time.perf_counter()
+        try:
+            try:
+                connection.sendmail(sender_email, receiver_email, message)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                connection.close()
+                connection = self._open_connection()
+                with self._lock:
+                    self.reconnects += 1
+                try:
+                    connection.sendmail(
+                        sender_email, receiver_email, message)
+                except BaseException:
+                    connection.close()
+                    raise
+        except (smtplib.SMTPException, OSError):
+            with self._lock:
+                self.messages_failed += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start_time
+            with self._lock:
+                self.send_seconds += elapsed
+                self.max_send_seconds = max(self.max_send_seconds, elapsed)
+            logging.debug(f"SMTP send to {receiver_email} took "
+                          f"{elapsed * 1000:.1f} ms")
+
+        connection.messages_sent += 1
+        with self._lock:
+            self.messages_sent += 1
+        return connection
+
+    def send(self, sender_email, receiver_email, message):
+        """Send one message. Raises smtplib.SMTPException on failure."""
+        connection = self._acquire_connection()
+        try:
+            connection = self._send_on(
+                connection, sender_email, receiver_email, message)
+        except BaseException:
+            connection.close()
+            connection = None
+            raise
+        finally:
+            self._release_connection(connection)
+
+    def send_batch(self, messages, rate_limiter=None):
+        """Send (sender_email, receiver_email, message) tuples over one
+        connection, waiting on the optional rate_limiter before each
+        message. Returns a list of exceptions, None for every message that
+        was accepted by the server. A failure, including one to connect,
+        only fails its own message; the next message opens a new
+        connection."""
+        results = []
+        connection = self._acquire_slot()
+        try:
+            for sender_email, receiver_email, message in messages:
+                if rate_limiter is not None:
+                    rate_limiter.acquire()
+                try:
+                    if connection is not None and \
+                            connection.messages_sent >= \
+                            self.max_messages_per_connection:
+                        self._quit(connection)
+                        connection = None
+                    if connection is None:
+                        connection = self._connect_for_message()
+                    connection = self._send_on(
+                        connection, sender_email, receiver_email, message)
+                    results.append(None)
+                except (smtplib.SMTPException, OSError) as e:
+                    results.append(e)
+                    if connection is not None:
+                        connection.close()
+                        connection = None
+        finally:
+            self._release_connection(connection)
+        return results
+
+    def _connect_for_message(self):
+        """Open a connection for the next message of a batch, counting the
+        message as failed when the connection cannot be opened."""
+        try:
+            return self._open_connection()
+        except (smtplib.SMTPException, OSError):
+            with self._lock:
+                self.messages_failed += 1
+            raise
+
+    def statistics(self):
+        with self._lock:
+            attempted = self.messages_sent + self.messages_failed
+            return {
+                "connections_opened": self.connections_opened,
+                "reconnects": self.reconnects,
+                "messages_sent": self.messages_sent,
+                "messages_failed": self.messages_failed,
+                "send_seconds": round(self.send_seconds, 3),
+                "average_send_ms": round(
+                    self.send_seconds * 1000 / attempted, 3)
+                if attempted else 0.0,
+                "max_send_ms": round(self.max_send_seconds * 1000, 3),
+            }
+
+    def close(self):
+        while True:
+            try:
+                connection = self._idle_connections.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(connection)
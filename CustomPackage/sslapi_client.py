@@ -0,0 +1,78 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: sslapi_client
+# Description: Reusable SSLAPI HTTP client. Holds one pooled, keep-alive
+#              requests.Session per endpoint host, applies connect/read
+#              timeouts to every request and exposes connection counters
+#              so the handshakes saved by connection reuse are visible.
+#
+###########################################################################
+"""SSLAPIClient Class"""
+
+import threading
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class SSLAPIClient:
+    def __init__(self, api_key, pool_size=10, connect_timeout=10,
+                 read_timeout=60):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.headers = {"Authorization": f"SSLAPI api_key=\"{api_key}\""}
+        self.sessions = {}
+        self._lock = threading.Lock()
+
+    def get_session(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            session = self.sessions.get(host)
+            if session is None:
+                adapter = HTTPAdapter(pool_connections=1,
+                                      pool_maxsize=self.pool_size,
+                                      pool_block=True)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update(self.headers)
+                self.sessions[host] = session
+            return session
+
+    def get(self, url, params=None):
+        return self.get_session(url).get(
+            url, params=params, timeout=self.timeout)
+
+    def connection_statistics(self):
+        """Return per-host counts of opened connections and requests.
+
+        Every opened connection costs a TCP+TLS handshake, the remaining
+        requests were served over a reused keep-alive connection.
+        """
+        statistics = {}
+        with self._lock:
+            sessions = list(self.sessions.items())
+        for host, session in sessions:
+            connections = 0
+            requests_sent = 0
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is None:
+                        continue
+                    connections += pool.num_connections
+                    requests_sent += pool.num_requests
+            statistics[host] = {
+                "handshakes": connections,
+                "requests": requests_sent,
+                "reused": max(requests_sent - connections, 0),
+            }
+        return statistics
+
+    def close(self):
+        with self._lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
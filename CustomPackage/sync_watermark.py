@@ -0,0 +1,121 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: sync_watermark
+# Description: Keeps the per-endpoint incremental sync watermark (highest
+#              certId seen) and decides whether an endpoint can be fetched
+#              as a delta or needs a full sync.
+#       A delta is only trusted when the previous sync of the endpoint
+#       completed without failed pages, the endpoint URL is unchanged and
+#       the last full sync is within full_sync_interval_days.
+#
+###########################################################################
+"""SyncWatermark Class"""
+
+import datetime
+import json
+import logging
+import os
+import globalSetting
+from CustomPackage.ReadCertExpiryConfig import ReadCertExpiryConfig
+from CustomPackage.run_clock import RunClock
+
+WATERMARK_PATH = "sync_watermark.json"
+
+
+class SyncWatermark:
+    @staticmethod
+    def load_watermarks():
+        if not os.path.exists(WATERMARK_PATH):
+            return {}
+        try:
+            with open(WATERMARK_PATH) as f:
+                watermarks = json.load(f)
+            return watermarks if isinstance(watermarks, dict) else {}
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error(f"Sync watermark file could not be read, full sync"
+                          f" will be performed. Exception : {e}")
+            return {}
+
+    @staticmethod
+    def get_delta_params(endpoint, url):
+        """Return the query parameters for a delta fetch of the endpoint, or
+        None when a full sync is required."""
+        if not globalSetting.confData.get('incremental_sync', False):
+            return None
+
+        delta_param = globalSetting.confData.get('incremental_sync_param')
+        if not delta_param or not isinstance(delta_param, str):
+            logging.info("Incremental sync enabled but "
+                         "incremental_sync_param is not configured. "
+                         "Performing full sync.")
+            return None
+
+        watermark = SyncWatermark.load_watermarks().get(endpoint)
+        if not watermark or watermark.get('url') != url or \
+                watermark.get('max_cert_id') is None:
+            logging.info(f"No usable sync watermark for {endpoint}. "
+                         "Performing full sync.")
+            return None
+
+        if watermark.get('needs_full_sync'):
+            logging.info(f"Previous sync of {endpoint} was incomplete. "
+                         "Performing full sync.")
+            return None
+
+        full_sync_interval = ReadCertExpiryConfig.get_numeric_setting(
+            'full_sync_interval_days', 7)
+        try:
+            last_full_sync = datetime.date.fromisoformat(
+                watermark.get('last_full_sync', ''))
+        except (TypeError, ValueError):
+            last_full_sync = None
+        if last_full_sync is None or \
+                (RunClock.today() - last_full_sync).days >= \
+                full_sync_interval:
+            logging.info(f"Scheduled full sync for {endpoint}.")
+            return None
+
+        logging.info(f"Delta sync for {endpoint} from certId "
+                     f"{watermark['max_cert_id']}.")
+        return {delta_param: watermark['max_cert_id']}
+
+    @staticmethod
+    def update_watermarks(endpoint_statistics):
+        """Persist the watermarks after the fetched certificates have been
+        committed to the bookmark."""
+        if not globalSetting.confData.get('incremental_sync', False):
+            return
+
+        watermarks = SyncWatermark.load_watermarks()
+        today = RunClock.today_iso()
+        cert_endpoints = globalSetting.confData.get('cert_endpoints', {})
+
+        for endpoint, statistics in endpoint_statistics.items():
+            watermark = watermarks.get(endpoint, {})
+            url = cert_endpoints.get(endpoint)
+            if watermark.get('url') != url:
+                watermark = {'url': url}
+
+            if statistics.get('failed_pages'):
+                watermark['needs_full_sync'] = True
+                watermarks[endpoint] = watermark
+                continue
+
+            max_cert_ids = [value for value in (
+                watermark.get('max_cert_id'),
+                statistics.get('max_cert_id')) if value is not None]
+            watermark['max_cert_id'] = max(max_cert_ids) \
+                if max_cert_ids else None
+            watermark['last_sync'] = today
+            watermark['needs_full_sync'] = False
+            if statistics.get('sync_mode') == 'full':
+                watermark['last_full_sync'] = today
+            watermarks[endpoint] = watermark
+
+        try:
+            with open(WATERMARK_PATH, 'w') as f:
+                json.dump(watermarks, f, indent=2)
+        except OSError as e:
+            logging.error("Error while saving the sync watermark. "
+                          f"Exception : {e}")
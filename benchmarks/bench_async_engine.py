@@ -0,0 +1,102 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: bench_async_engine
+# Description: Benchmarks a full job run in the sync execution mode
+#              against the async execution mode, with both endpoints
+#              served by local stub SSLAPI servers and the emails sent to
+#              the local stub SMTP server. Both modes start from an empty
+#              bookmark and must end with the same bookmark.
+#
+#   Usage: python benchmarks/bench_async_engine.py [--pages N]
+#              [--page-size N] [--latency SECONDS]
+#              [--message-latency SECONDS] [--concurrency N] [--workers N]
+#
+###########################################################################
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import globalSetting  # noqa: E402
+from stub_smtp_server import StubSMTPServer  # noqa: E402
+from stub_sslapi_server import StubSSLAPIServer  # noqa: E402
+
+
+def run_job(execution_mode, args):
+    import certexpirynotify
+
+    # certexpirynotify binds its logger when run as a script.
+    certexpirynotify.logging = logging
+    os.chdir(tempfile.mkdtemp(prefix="cert_expiry_bench_"))
+    shutil.copytree(os.path.join(REPO_ROOT, "EmailTemplates"),
+                    "EmailTemplates")
+
+    with StubSSLAPIServer(total_pages=args.pages, page_size=args.page_size,
+                          latency=args.latency) as previous, \
+            StubSSLAPIServer(total_pages=args.pages,
+                             page_size=args.page_size, latency=args.latency,
+                             cert_id_offset=10 ** 7) as current, \
+            StubSMTPServer(message_latency=args.message_latency) as smtp:
+        globalSetting.init()
+        globalSetting.confData = {
+            "api_key": "benchmark",
+            "cert_endpoints": {
+                "previous_cert_endpoint": previous.url,
+                "current_cert_endpoint": current.url,
+            },
+            "max_retries": 0,
+            "max_concurrent_requests": args.concurrency,
+            "sender_email": "sender@example.com",
+            "receiver_email": "receiver@example.com",
+            "internal_team_email": "team@example.com",
+            "smtp_server": smtp.host,
+            "smtp_port": smtp.port,
+            "smtp_workers": args.workers,
+            "inventory_snapshot": False,
+        }
+
+        start = time.perf_counter()
+        certexpirynotify.CertExpiryNotification(execution_mode)
+        elapsed = time.perf_counter() - start
+        emails = smtp.message_count
+
+    with open("bookmark.csv") as f:
+        bookmark = sorted(f.readlines()[1:])
+    return elapsed, emails, bookmark
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the sync and async execution modes.")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--message-latency", type=float, default=0.005)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    print(f"pages={args.pages} x 2 endpoints page_size={args.page_size} "
+          f"latency={args.latency}s message_latency="
+          f"{args.message_latency}s workers={args.workers}")
+    results = {}
+    for execution_mode in ("sync", "async"):
+        elapsed, emails, bookmark = run_job(execution_mode, args)
+        results[execution_mode] = bookmark
+        print(f"{execution_mode:5}: {elapsed:.3f}s emails={emails} "
+              f"bookmark rows={len(bookmark)}")
+    assert results["sync"] == results["async"], "bookmarks differ"
+
+
+if __name__ == "__main__":
+    main()
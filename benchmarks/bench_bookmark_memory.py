@@ -0,0 +1,172 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: bench_bookmark_memory
+# Description: Memory and load time of a large bookmark held as
+#              BookmarkRecords, read from bookmark CSV and from the binary
+#              bookmark backend, against the pandas DataFrame the bookmark
+#              store used to load (object columns, and pandas' str columns,
+#              which are Arrow backed when pyarrow is installed) and the
+#              dict per row load_records built from it. Every variant runs
+#              in its own process and reports the size of its columns and
+#              how much its resident set grew, which includes the memory
+#              the allocator keeps from the transient objects of the load.
+#
+#   Usage: python benchmarks/bench_bookmark_memory.py [--certs 1000000]
+#
+###########################################################################
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+VARIANTS = ("dataframe object", "dataframe str", "object+dicts",
+            "records csv", "records binary")
+
+
+def resident_bytes():
+    """Current resident set size, None where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_resident_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def build_bookmark(certs, directory):
+    """Write a bookmark of certs rows as CSV and as binary records."""
+    import numpy as np
+    from CustomPackage.bookmark_records import BookmarkRecords
+
+    rng = np.random.default_rng(5)
+    today = datetime.date.today().toordinal()
+    expiry_dates = today + rng.integers(-30, 800, size=certs)
+    buckets = np.array(["Queued", "90", "60", "30", "7", "1", "0"])
+    hosts = rng.integers(0, certs, size=certs).tolist()
+    records = BookmarkRecords.from_columns({
+        "CID": [str(10000000 + cid) for cid in range(certs)],
+        "Status": rng.choice(["Active"] * 8 + ["Revoked", "Renewed"],
+                             size=certs).tolist(),
+        "ExpiryDate": expiry_dates,
+        "Bucket": buckets[rng.integers(0, len(buckets),
+                                       size=certs)].tolist(),
+        "CN": [f"host{host}.service.example.com" for host in hosts],
+        "SAN": [f"[host{host}.service.example.com;"
+                f"alt{host}.example.com]" if host % 3 else ""
+                for host in hosts],
+        "Notified": rng.choice(["N", "Y"], size=certs).tolist(),
+        "NextTransition": expiry_dates - 30,
+    }).sorted()
+    csv_path = os.path.join(directory, "bookmark.csv")
+    with open(csv_path, "w", newline="") as f:
+        records.write_csv(f)
+    binary_path = os.path.join(directory, "bookmark.records")
+    with open(binary_path, "wb") as f:
+        records.save(f)
+    return csv_path, binary_path
+
+
+def measure(variant, csv_path, binary_path):
+    """Load the bookmark the way variant does, in this process."""
+    import pandas as pd
+    from CustomPackage.bookmark_store import CsvBookmarkStore, \
+        BinaryBookmarkStore
+
+    gc.collect()
+    resident = resident_bytes()
+    start = time.perf_counter()
+    if not variant.startswith("records"):
+        data = pd.read_csv(
+            csv_path, dtype=str if variant == "dataframe str" else object,
+            keep_default_na=False)
+        columns = int(data.memory_usage(deep=True).sum())
+        if variant == "object+dicts":
+            data = (data, {row["CID"]: row
+                           for row in data.to_dict("records")})
+    else:
+        store = CsvBookmarkStore(csv_path) if variant == "records csv" \
+            else BinaryBookmarkStore(binary_path)
+        data = store.load_bookmark()
+        columns = data.nbytes
+    load_seconds = time.perf_counter() - start
+    gc.collect()
+    after = resident_bytes()
+    return {
+        "variant": variant,
+        "load_seconds": load_seconds,
+        "columns_bytes": columns,
+        "resident_growth_bytes":
+            after - resident if resident is not None else None,
+        "peak_resident_bytes": peak_resident_bytes(),
+    }
+
+
+def megabytes(value):
+    return "n/a" if value is None else f"{value / 2 ** 20:.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the memory of a loaded bookmark.")
+    parser.add_argument("--certs", type=int, default=1000000)
+    parser.add_argument("--build", metavar="DIRECTORY",
+                        help=argparse.SUPPRESS)
+    parser.add_argument("--measure", nargs=3,
+                        metavar=("VARIANT", "CSV", "BINARY"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.build:
+        print(json.dumps(build_bookmark(args.certs, args.build)))
+        return
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return
+
+    # The bookmark is built in a child process as well, a process started
+    # from a large parent inherits its peak resident set.
+    directory = tempfile.mkdtemp(prefix="cert_expiry_bench_")
+    start = time.perf_counter()
+    csv_path, binary_path = json.loads(subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--certs",
+         str(args.certs), "--build", directory],
+        capture_output=True, text=True, check=True).stdout)
+    print(f"certs={args.certs} csv={megabytes(os.path.getsize(csv_path))}"
+          f" MB binary={megabytes(os.path.getsize(binary_path))} MB "
+          f"(built in {time.perf_counter() - start:.1f}s)")
+    print(f"{'variant':16} {'load s':>7} {'columns MB':>11} "
+          f"{'RSS growth MB':>14} {'peak RSS MB':>12} {'bytes/cert':>11}")
+    for variant in VARIANTS:
+        result = json.loads(subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--measure",
+             variant, csv_path, binary_path],
+            capture_output=True, text=True, check=True).stdout)
+        growth = result["resident_growth_bytes"]
+        per_cert = "n/a" if growth is None else \
+            f"{growth / args.certs:.0f}"
+        print(f"{variant:16} {result['load_seconds']:7.2f} "
+              f"{megabytes(result['columns_bytes']):>11} "
+              f"{megabytes(growth):>14} "
+              f"{megabytes(result['peak_resident_bytes']):>12} "
+              f"{per_cert:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: bench_page_fetch
+# Description: Benchmarks GetCertificateData page fetching against the
+#              local stub SSLAPI server for several values of
+#              max_concurrent_requests.
+#
+#   Usage: python benchmarks/bench_page_fetch.py [--pages N]
+#              [--page-size N] [--latency SECONDS]
+#              [--concurrency 1 4 8]
+#
+###########################################################################
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import globalSetting  # noqa: E402
+from stub_sslapi_server import StubSSLAPIServer  # noqa: E402
+
+
+def run_fetch(url, concurrency):
+    from CustomPackage import GetCertificateData
+
+    globalSetting.init()
+    globalSetting.confData = {
+        "api_key": "benchmark",
+        "cert_endpoints": {"current_cert_endpoint": url},
+        "max_retries": 0,
+        "max_concurrent_requests": concurrency,
+        "sender_email": "",
+        "internal_team_email": "",
+        "smtp_server": "",
+        "smtp_port": 25,
+    }
+    globalSetting.internal_email_template_missing = True
+
+    start = time.perf_counter()
+    certs = GetCertificateData.get_cert_data_for_configured_endpoints()
+    elapsed = time.perf_counter() - start
+    for host, counters in GetCertificateData.connection_statistics.items():
+        print(f"  {host}: {counters['handshakes']} handshakes, "
+              f"{counters['reused']} reused connections")
+    return elapsed, certs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark concurrent SSLAPI page fetching.")
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, nargs="+",
+                        default=[1, 4, 8])
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="cert_expiry_bench_"))
+
+    results = {}
+    with StubSSLAPIServer(total_pages=args.pages, page_size=args.page_size,
+                          latency=args.latency) as server:
+        for concurrency in args.concurrency:
+            elapsed, certs = run_fetch(server.url, concurrency)
+            cert_ids = [cert["certId"] for cert in certs]
+            assert cert_ids == sorted(cert_ids), "pages out of order"
+            results[concurrency] = elapsed
+            print(f"max_concurrent_requests={concurrency:<3} "
+                  f"pages={args.pages} certs={len(certs)} "
+                  f"elapsed={elapsed:.3f}s")
+
+    baseline = results.get(min(results))
+    for concurrency, elapsed in results.items():
+        print(f"speedup at {concurrency}: {baseline / elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: bench_populate
+# Description: Benchmarks the columnar new-certificate ingestion of
+#              BookmarkHandler.populate_bookmark against the previous
+#              per-certificate loop on a synthetic SSLAPI payload.
+#
+#   Usage: python benchmarks/bench_populate.py [--certs 500000]
+#              [--existing 100000] [--legacy-max-certs 500000]
+#
+###########################################################################
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import globalSetting  # noqa: E402
+
+
+def build_payload(certs, seed=11):
+    """Raw certificates as returned by the SSLAPI: ISO timestamps, a few
+    unparsable expiry dates, subjects shared across renewals and SANs."""
+    rng = np.random.default_rng(seed)
+    today = datetime.date.today()
+    offsets = rng.integers(-30, 800, size=certs)
+    hosts = rng.integers(0, max(certs // 4, 1), size=certs)
+    payload = []
+    for cid, offset, host in zip(range(certs), offsets, hosts):
+        payload.append({
+            "certId": 1000000 + cid,
+            "notAfter": (today + datetime.timedelta(days=int(offset))).
+            isoformat() + "T12:00:00Z" if cid % 5000 else "not-a-date",
+            "status": "Active",
+            "subject": f"CN=host{host}.example.com, O=Cisco Systems, "
+                       f"C=US",
+            "sans": [f"host{host}.example.com", f"alt{host}.example.com"]
+            if cid % 3 else [],
+        })
+    return payload
+
+
+def legacy_new_certificates(all_certificate_data, existing_cids):
+    from cert_expiry_utility import CertExpiryUtility
+
+    new_certificates = []
+    error_certificates = []
+    for cert in all_certificate_data:
+        cid = str(cert.get('certId', ''))
+        if cid not in existing_cids:
+            not_after = cert.get('notAfter', '')
+            expiry_date_str = not_after.split('T')[0]
+            days_until_expiry = CertExpiryUtility.get_days_until_expiry(
+                expiry_date_str)
+            if days_until_expiry is not None:
+                bucket = CertExpiryUtility.get_bucket_for_expiry(
+                    days_until_expiry)
+                if bucket != "Error":
+                    existing_cids.add(cid)
+                    san_entries = cert.get('sans', [])
+                    san_str = "[" + ";".join(san_entries) + \
+                        "]" if san_entries else ""
+                    new_certificates.append({
+                        "CID": cid,
+                        "Status": cert.get("status", ""),
+                        "ExpiryDate": expiry_date_str,
+                        "Bucket": bucket,
+                        "CN": CertExpiryUtility.get_cn_from_subject(
+                            cert.get('subject', '')),
+                        "SAN": san_str,
+                        "Notified": "N",
+                        "NextTransition": ""
+                    })
+                else:
+                    error_certificates.append(cid)
+            else:
+                error_certificates.append(cid)
+    return pd.DataFrame(new_certificates), error_certificates
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark new-certificate ingestion.")
+    parser.add_argument("--certs", type=int, default=500000)
+    parser.add_argument("--existing", type=int, default=100000)
+    parser.add_argument("--legacy-max-certs", type=int, default=500000)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="cert_expiry_bench_"))
+    globalSetting.init()
+    from CustomPackage import BookmarkHandler
+    from CustomPackage.bookmark_handler import INGEST_CHUNK_SIZE
+    from CustomPackage.bookmark_records import BookmarkRecords, \
+        BOOKMARK_FIELDNAMES
+
+    payload = build_payload(args.certs)
+    existing_cids = {str(1000000 + cid) for cid in range(args.existing)}
+    print(f"certs={args.certs} existing={args.existing}")
+
+    start = time.perf_counter()
+    chunks = []
+    errors = []
+    known_cids = set(existing_cids)
+    for offset in range(0, len(payload), INGEST_CHUNK_SIZE):
+        new_rows, chunk_errors = BookmarkHandler.normalize_certificates(
+            payload[offset:offset + INGEST_CHUNK_SIZE], known_cids)
+        known_cids.update(new_rows.values('CID'))
+        chunks.append(new_rows)
+        errors.extend(chunk_errors)
+    columnar = BookmarkRecords.concat(chunks)
+    columnar_seconds = time.perf_counter() - start
+    print(f"columnar: {columnar_seconds:.3f}s new={len(columnar)} "
+          f"errors={len(errors)}")
+
+    if args.certs <= args.legacy_max_certs:
+        start = time.perf_counter()
+        legacy, legacy_errors = legacy_new_certificates(
+            payload, set(existing_cids))
+        legacy_seconds = time.perf_counter() - start
+        pd.testing.assert_frame_equal(
+            pd.DataFrame(list(columnar.iter_rows()),
+                         columns=BOOKMARK_FIELDNAMES).astype(object),
+            legacy.astype(object))
+        assert errors == legacy_errors
+        print(f"per-cert loop: {legacy_seconds:.3f}s "
+              f"speedup={legacy_seconds / columnar_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: bench_rebucket
+# Description: Benchmarks the vectorized bucket reassignment of
+#              BookmarkHandler.get_bucket_changes against the previous
+#              row-by-row iterrows implementation on synthetic bookmarks.
+#
+#   Usage: python benchmarks/bench_rebucket.py [--rows 100000 1000000]
+#              [--legacy-max-rows 100000]
+#
+###########################################################################
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import globalSetting  # noqa: E402
+
+
+def build_bookmark(rows, seed=7):
+    from CustomPackage.bookmark_records import BookmarkRecords
+
+    rng = np.random.default_rng(seed)
+    today = datetime.date.today()
+    offsets = rng.integers(-30, 400, size=rows)
+    expiry_dates = [
+        (today + datetime.timedelta(days=int(offset))).isoformat()
+        for offset in offsets]
+    buckets = rng.choice(
+        ["Queued", "90", "60", "30", "7", "1", "0"], size=rows)
+    return BookmarkRecords.from_columns({
+        "CID": [str(cid) for cid in range(rows)],
+        "Status": "Active",
+        "ExpiryDate": expiry_dates,
+        "Bucket": buckets.tolist(),
+        "CN": [f"host{cid}.example.com" for cid in range(rows)],
+        "SAN": "",
+        "Notified": "N",
+        "NextTransition": "",
+    })
+
+
+def legacy_bucket_changes(bookmark):
+    from cert_expiry_utility import CertExpiryUtility
+    from CustomPackage.bookmark_records import BOOKMARK_FIELDNAMES
+
+    existing_data = pd.DataFrame(list(bookmark.iter_rows()),
+                                 columns=BOOKMARK_FIELDNAMES)
+    existing_data['ExpiryDate'] = pd.to_datetime(existing_data['ExpiryDate'])
+    changes = []
+    for index, row in existing_data.iterrows():
+        expiry_date_str = row['ExpiryDate'].strftime("%Y-%m-%d")
+        days_until_expiry = CertExpiryUtility.get_days_until_expiry(
+            expiry_date_str)
+        if days_until_expiry is None:
+            continue
+        new_bucket = CertExpiryUtility.get_bucket_for_expiry(
+            days_until_expiry)
+        if new_bucket != "Error" and new_bucket != row["Bucket"]:
+            changes.append((row['CID'], row['Bucket'], new_bucket))
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark bookmark bucket reassignment.")
+    parser.add_argument("--rows", type=int, nargs="+",
+                        default=[100000, 1000000])
+    parser.add_argument("--legacy-max-rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="cert_expiry_bench_"))
+    globalSetting.init()
+    from CustomPackage import BookmarkHandler
+
+    for rows in args.rows:
+        bookmark = build_bookmark(rows)
+
+        start = time.perf_counter()
+        moved = BookmarkHandler.get_bucket_changes(bookmark)
+        vectorized = time.perf_counter() - start
+        print(f"rows={rows:<8} vectorized={vectorized:.3f}s "
+              f"moved={len(moved)}")
+
+        if rows <= args.legacy_max_rows:
+            start = time.perf_counter()
+            changes = legacy_bucket_changes(bookmark)
+            legacy = time.perf_counter() - start
+            assert changes == moved
+            print(f"rows={rows:<8} iterrows={legacy:.3f}s "
+                  f"speedup={legacy / vectorized:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
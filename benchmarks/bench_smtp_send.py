@@ -0,0 +1,99 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: bench_smtp_send
+# Description: Benchmarks certificate expiry email sending against the
+#              local stub SMTP server: one SMTP connection per email (the
+#              previous behaviour) versus the pooled, batched SMTPSender
+#              dispatched over --workers parallel senders.
+#
+#   Usage: python benchmarks/bench_smtp_send.py [--emails N]
+#              [--connect-latency SECONDS] [--drop-after N] [--workers N]
+#              [--max-per-second N]
+#
+###########################################################################
+
+import argparse
+import os
+import shutil
+import smtplib
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import globalSetting  # noqa: E402
+from stub_smtp_server import StubSMTPServer  # noqa: E402
+
+
+def build_cert_infos(count):
+    return [{
+        "CID": str(cid),
+        "Status": "Active",
+        "ExpiryDate": "2030-01-01",
+        "Bucket": "30",
+        "CN": f"host{cid}.example.com",
+        "SAN": f"[host{cid}.example.com]",
+        "Notified": "N",
+    } for cid in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark pooled SMTP sending.")
+    parser.add_argument("--emails", type=int, default=500)
+    parser.add_argument("--connect-latency", type=float, default=0.01)
+    parser.add_argument("--drop-after", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--max-per-second", type=float, default=0)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="cert_expiry_bench_"))
+    shutil.copytree(os.path.join(REPO_ROOT, "EmailTemplates"),
+                    "EmailTemplates")
+    from CustomPackage import EmailHandler
+    from CustomPackage.email_template import EmailTemplateRegistry, \
+        NOTIFICATION_TEMPLATE
+
+    cert_infos = build_cert_infos(args.emails)
+    template = EmailTemplateRegistry.get(NOTIFICATION_TEMPLATE)
+
+    with StubSMTPServer(connect_latency=args.connect_latency,
+                        drop_after=args.drop_after) as server:
+        globalSetting.init()
+        globalSetting.confData = {
+            "sender_email": "sender@example.com",
+            "receiver_email": "receiver@example.com",
+            "internal_team_email": "team@example.com",
+            "smtp_server": server.host,
+            "smtp_port": server.port,
+            "smtp_workers": args.workers,
+            "smtp_max_messages_per_second": args.max_per_second,
+        }
+
+        start = time.perf_counter()
+        for cert_info in cert_infos:
+            with smtplib.SMTP(server.host, server.port) as connection:
+                connection.sendmail(*EmailHandler.build_email_for_cert_expiry(
+                    cert_info, template))
+        per_email = time.perf_counter() - start
+        print(f"connection per email: {per_email:.3f}s "
+              f"connections={server.connections}")
+
+        connections_before = server.connections
+        start = time.perf_counter()
+        delivered = EmailHandler.trigger_emails_for_cert_expiry(cert_infos)
+        pooled = time.perf_counter() - start
+        statistics = EmailHandler.close_smtp_sender()
+        print(f"pooled sender:        {pooled:.3f}s "
+              f"connections={server.connections - connections_before} "
+              f"delivered={len(delivered)}")
+        print(f"metrics: {statistics}")
+        print(f"speedup: {per_email / pooled:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
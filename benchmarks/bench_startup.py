@@ -0,0 +1,116 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: bench_startup
+# Description: Startup profile of the job.
+#   a)-X importtime profile of importing certexpirynotify, the modules
+#       with the largest cumulative import time and the import time when
+#       every handler singleton is created up front as the package used to.
+#   b)Time to the first log line and to exit of a run ending early on a
+#       missing config file, for the script and for PyInstaller builds
+#       given with --executable (e.g. the one-file build of
+#       certexpirynotify.spec and the onedir build of
+#       certexpirynotify_onedir.spec).
+#
+#   Usage: python benchmarks/bench_startup.py [--repeat 5] [--top 15]
+#              [--executable dist/certexpirynotify/certexpirynotify ...]
+#
+###########################################################################
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOG_FILE = os.path.join("log", "cert_expiry_notification.log")
+
+EAGER_IMPORT = ("import certexpirynotify, CustomPackage\n"
+                "for name in CustomPackage._SINGLETONS:\n"
+                "    getattr(CustomPackage, name)\n")
+
+
+def import_profile(code):
+    """Return the -X importtime entries of running code as (cumulative
+    microseconds, module, nesting level), and the total import time."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=tempfile.mkdtemp(prefix="cert_expiry_bench_"),
+        env=dict(os.environ, PYTHONPATH=REPO_ROOT),
+        capture_output=True, text=True, check=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        level = (len(name) - len(name.lstrip())) // 2
+        entries.append((int(cumulative), name.strip(), level))
+    total = sum(cumulative for cumulative, _, level in entries
+                if level == 0)
+    return entries, total
+
+
+def time_to_first_log_line(command):
+    """Run command in an empty directory, so the job ends on the missing
+    config file. Returns the seconds to the first log line and to exit."""
+    directory = tempfile.mkdtemp(prefix="cert_expiry_bench_")
+    log_file = os.path.join(directory, LOG_FILE)
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=directory,
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    first_line = None
+    while first_line is None:
+        if os.path.exists(log_file) and os.path.getsize(log_file):
+            first_line = time.perf_counter() - start
+        elif process.poll() is not None:
+            break
+        else:
+            time.sleep(0.001)
+    process.wait()
+    return first_line, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Profile the startup of the job.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--executable", action="append", default=[],
+                        help="PyInstaller build to time, repeatable")
+    args = parser.parse_args()
+
+    entries, lazy_total = import_profile("import certexpirynotify")
+    _, eager_total = import_profile(EAGER_IMPORT)
+    print(f"import certexpirynotify: {lazy_total / 1000:.1f} ms "
+          f"(every handler created up front: {eager_total / 1000:.1f} ms)")
+    print("largest cumulative import times:")
+    for cumulative, name, level in sorted(entries, reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {'  ' * level}{name}")
+
+    commands = [("script", [sys.executable,
+                            os.path.join(REPO_ROOT, "certexpirynotify.py")])]
+    commands += [(executable, [os.path.abspath(executable)])
+                 for executable in args.executable]
+    for label, command in commands:
+        first_lines = []
+        exits = []
+        for _ in range(args.repeat):
+            first_line, exit_time = time_to_first_log_line(command)
+            if first_line is None:
+                print(f"{label}: no log line written")
+                break
+            first_lines.append(first_line)
+            exits.append(exit_time)
+        else:
+            print(f"{label}: first log line "
+                  f"{statistics.median(first_lines) * 1000:.1f} ms, exit "
+                  f"{statistics.median(exits) * 1000:.1f} ms "
+                  f"(median of {args.repeat})")
+
+
+if __name__ == "__main__":
+    main()
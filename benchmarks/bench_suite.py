@@ -0,0 +1,394 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: bench_suite
+# Description: Benchmark suite of the job at several inventory sizes, with
+#              both endpoints served by local stub SSLAPI servers (page
+#              size, latency, error rate and totalPages configurable) and
+#              the emails sent to the local sink SMTP server.
+#   a)end_to_end: certexpirynotify.py run as the scheduler runs it, in its
+#       own process, on an empty bookmark (first day) and again
+#       --advance-days later (later day), when certificates have moved
+#       bucket and are due again. Wall time, peak resident set, emails and
+#       the phase timings and counters of its run report are recorded.
+#   b)phases: the steps of the sync execution mode timed one by one in
+#       this process: GetCertificateData.iter_certificates,
+#       BookmarkHandler.populate_bookmark, move_certificates_to_new_bucket,
+#       check_expiry_and_send_email and the bookmark commit on the first
+#       day, then the bookmark load, rebucket and notify of the later day.
+#       The results are written as JSON; with --baseline, the timings are
+#       compared with those of an earlier result file and the suite exits
+#       with 1 when one of them is more than --threshold slower.
+#
+#   Usage: python benchmarks/bench_suite.py [--sizes 1000,10000,100000]
+#              [--page-size 500] [--latency 0.01] [--error-rate 0.0]
+#              [--message-latency 0.0] [--concurrency 4]
+#              [--backend csv] [--execution-mode sync] [--repeat 1]
+#              [--advance-days 7] [--output bench_suite.json]
+#              [--baseline BASELINE.json] [--threshold 0.1]
+#
+###########################################################################
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import globalSetting  # noqa: E402
+from stub_smtp_server import StubSMTPServer  # noqa: E402
+from stub_sslapi_server import StubSSLAPIServer  # noqa: E402
+
+RESULTS_VERSION = 1
+ENDPOINTS = ("previous_cert_endpoint", "current_cert_endpoint")
+DAYS = ("first_day", "later_day")
+
+
+class Environment:
+    """Stub SSLAPI servers of both endpoints, the sink SMTP server and the
+    job config of one inventory size."""
+
+    def __init__(self, size, args):
+        # The inventory is split over both endpoints, certIds of the
+        # second endpoint start after those of the first.
+        per_endpoint = -(-size // len(ENDPOINTS))
+        self.total_pages = max(-(-per_endpoint // args.page_size), 1)
+        self.args = args
+        self.servers = [
+            StubSSLAPIServer(
+                total_pages=self.total_pages, page_size=args.page_size,
+                latency=args.latency, cert_id_offset=index * 10 ** 8,
+                error_rate=args.error_rate, seed=index)
+            for index in range(len(ENDPOINTS))]
+        self.smtp = StubSMTPServer(message_latency=args.message_latency,
+                                   keep_messages=False)
+
+    def __enter__(self):
+        for server in self.servers:
+            server.start()
+        self.smtp.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        for server in self.servers:
+            server.stop()
+        self.smtp.stop()
+
+    @property
+    def certificates(self):
+        return len(self.servers) * self.total_pages * self.args.page_size
+
+    def config(self):
+        return {
+            "sender_email": "sender@example.com",
+            "receiver_email": "receiver@example.com",
+            "internal_team_email": "team@example.com",
+            "smtp_server": self.smtp.host,
+            "smtp_port": self.smtp.port,
+            "cert_endpoints": {
+                endpoint: server.url
+                for endpoint, server in zip(ENDPOINTS, self.servers)},
+            "api_key": "benchmark",
+            # Failed requests are retried quickly, an injected error costs
+            # a retry and not a backoff of seconds.
+            "max_retries": 10,
+            "retry_backoff_base": 0.01,
+            "retry_backoff_max": 0.1,
+            "max_concurrent_requests": self.args.concurrency,
+            "bookmark_backend": self.args.backend,
+            "execution_mode": self.args.execution_mode,
+            "inventory_snapshot": False,
+        }
+
+
+def new_run_directory():
+    directory = tempfile.mkdtemp(prefix="cert_expiry_bench_")
+    shutil.copytree(os.path.join(REPO_ROOT, "EmailTemplates"),
+                    os.path.join(directory, "EmailTemplates"))
+    return directory
+
+
+def run_process(command, directory, environment):
+    """Run command to completion, return its exit code, wall seconds and
+    peak resident set in bytes (None where it is not available)."""
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=directory, env=environment,
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    if not hasattr(os, "wait4"):
+        return process.wait(), time.perf_counter() - start, None
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    peak = usage.ru_maxrss if sys.platform == "darwin" else \
+        usage.ru_maxrss * 1024
+    return process.returncode, elapsed, peak
+
+
+def run_report_summary(path):
+    """Phase totals and counters of a run report, summed over labels."""
+    with open(path) as f:
+        report = json.load(f)
+    phases = {}
+    for phase in report["phases"]:
+        phases[phase["phase"]] = \
+            phases.get(phase["phase"], 0.0) + phase["total_seconds"]
+    counters = {}
+    for counter in report["counters"]:
+        counters[counter["name"]] = \
+            counters.get(counter["name"], 0) + counter["value"]
+    return report["status"], phases, counters
+
+
+def bench_end_to_end(environment, run_dates):
+    directory = new_run_directory()
+    with open(os.path.join(directory, "cert_expiry_config.json"), "w") as f:
+        json.dump(environment.config(), f, indent=2)
+
+    results = {}
+    for day, run_date in zip(DAYS, run_dates):
+        sent = environment.smtp.message_count
+        returncode, elapsed, peak = run_process(
+            [sys.executable, os.path.join(REPO_ROOT, "certexpirynotify.py")],
+            directory,
+            dict(os.environ, CERT_EXPIRY_RUN_DATE=run_date.isoformat()))
+        status, phases, counters = run_report_summary(
+            os.path.join(directory, "run_report.json"))
+        if returncode or status != "succeeded":
+            raise RuntimeError(f"{day} run failed, see the log in "
+                               f"{directory}")
+        results[day] = {
+            "wall_seconds": elapsed,
+            "peak_resident_bytes": peak,
+            "emails": environment.smtp.message_count - sent,
+            "phase_seconds": phases,
+            "counters": counters,
+        }
+    shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def bench_phases(environment, run_dates):
+    """Time the steps of a sync run one by one, in this process."""
+    from CustomPackage import BookmarkHandler, EmailHandler
+    from CustomPackage.get_certificate_data import GetCertificateData
+    from CustomPackage.run_clock import RunClock
+    from CustomPackage.run_metrics import RunMetrics
+    from cert_expiry_utility import CertExpiryUtility
+
+    directory = new_run_directory()
+    working_directory = os.getcwd()
+    os.chdir(directory)
+    globalSetting.init()
+    globalSetting.confData = environment.config()
+    results = {}
+
+    def timed(phases, name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        phases[name] = time.perf_counter() - start
+        return result
+
+    try:
+        for day, run_date in zip(DAYS, run_dates):
+            RunMetrics.start()
+            RunClock.run_date = run_date
+            EmailHandler.check_for_email_template()
+            phases = {}
+            sent = environment.smtp.message_count
+            bookmark = timed(phases, "bookmark_load",
+                             BookmarkHandler.open_run_context)
+            if day == "first_day":
+                certificates = timed(
+                    phases, "fetch", list,
+                    GetCertificateData.iter_certificates())
+                timed(phases, "populate", BookmarkHandler.populate_bookmark,
+                      certificates, bookmark)
+                del certificates
+            timed(phases, "rebucket",
+                  BookmarkHandler.move_certificates_to_new_bucket, bookmark)
+            notified = timed(phases, "notify",
+                             CertExpiryUtility.check_expiry_and_send_email,
+                             bookmark)
+            EmailHandler.close_smtp_sender()
+            BookmarkHandler.update_notified_cert_entry(
+                [cert['CID'] for cert in notified or []], bookmark)
+            BookmarkHandler.update_next_transitions(bookmark)
+            timed(phases, "bookmark_write",
+                  BookmarkHandler.commit_run_context, bookmark)
+            results[day] = {
+                "phase_seconds": phases,
+                "emails": environment.smtp.message_count - sent,
+                "counters": {name: value for (name, labels), value
+                             in RunMetrics.counters.items() if not labels},
+            }
+    finally:
+        RunClock.run_date = None
+        os.chdir(working_directory)
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def median_result(samples):
+    """Element-wise median of the numbers of several runs' results."""
+    first = samples[0]
+    if isinstance(first, dict):
+        return {key: median_result([sample[key] for sample in samples])
+                for key in first}
+    if isinstance(first, (int, float)) and not isinstance(first, bool):
+        return statistics.median(samples)
+    return first
+
+
+def flatten(result, prefix=""):
+    """Map the path of every number of a result to the number."""
+    values = {}
+    for key, value in result.items():
+        path = f"{prefix}/{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            values.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and \
+                not isinstance(value, bool):
+            values[path] = value
+    return values
+
+
+def compare(results, baseline, threshold):
+    """Print the timings and peak resident sets against those of the
+    baseline results, return the paths of those more than threshold
+    higher. Different email counts are flagged too, the runs did not do
+    the same work."""
+    current = flatten(results["sizes"])
+    previous = flatten(baseline["sizes"])
+    regressions = []
+    print(f"\ncompared with {baseline.get('created')} "
+          f"({baseline.get('git_commit') or 'unknown commit'}):")
+    for path in sorted(set(current) & set(previous)):
+        value, baseline_value = current[path], previous[path]
+        if path.endswith("/emails") and value != baseline_value:
+            print(f"  {path}: {baseline_value} -> {value} emails, the runs "
+                  "are not comparable")
+            regressions.append(path)
+        # Differences of a few milliseconds or a megabyte are noise.
+        if path.endswith("bytes"):
+            scale, unit, noise = 2 ** 20, "MB", 2 ** 20
+        elif any(part.endswith("seconds") for part in path.split("/")):
+            scale, unit, noise = 1, "s", 0.005
+        else:
+            continue
+        if not baseline_value:
+            continue
+        change = value / baseline_value - 1
+        flag = ""
+        if change > threshold and value - baseline_value > noise:
+            flag = "  REGRESSION"
+            regressions.append(path)
+        print(f"  {path:60} {baseline_value / scale:9.4f} -> "
+              f"{value / scale:9.4f} {unit:2} {change:+7.1%}{flag}")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(size, result):
+    for day in DAYS:
+        end_to_end = result["end_to_end"][day]
+        phases = result["phases"][day]
+        peak = end_to_end["peak_resident_bytes"]
+        print(f"{size:>9} {day:9} end to end "
+              f"{end_to_end['wall_seconds']:8.3f}s "
+              f"peak {'n/a' if peak is None else f'{peak / 2 ** 20:.0f}'} "
+              f"MB, {end_to_end['emails']} emails | phases " + " ".join(
+                  f"{name} {seconds:.3f}s"
+                  for name, seconds in phases["phase_seconds"].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the job end to end and per phase.")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma separated inventory sizes")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.01,
+                        help="SSLAPI seconds per page request")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="share of SSLAPI requests answered with 503")
+    parser.add_argument("--message-latency", type=float, default=0.0,
+                        help="SMTP seconds per accepted message")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--backend", default="csv",
+                        choices=("csv", "binary", "sqlite"))
+    parser.add_argument("--execution-mode", default="sync",
+                        choices=("sync", "async"),
+                        help="execution mode of the end to end runs")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="runs per size, the median is kept")
+    parser.add_argument("--advance-days", type=int, default=7)
+    parser.add_argument("--output", default="bench_suite.json")
+    parser.add_argument("--baseline", help="result file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="slowdown reported as a regression")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    first_day = datetime.date.today()
+    run_dates = (first_day,
+                 first_day + datetime.timedelta(days=args.advance_days))
+    results = {
+        "version": RESULTS_VERSION,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "parameters": {key: value for key, value in vars(args).items()
+                       if key not in ("output", "baseline", "threshold")},
+        "sizes": {},
+    }
+
+    for size in (int(size) for size in args.sizes.split(",")):
+        samples = []
+        for _ in range(args.repeat):
+            with Environment(size, args) as environment:
+                samples.append({
+                    "certificates": environment.certificates,
+                    "end_to_end": bench_end_to_end(environment, run_dates),
+                    "phases": bench_phases(environment, run_dates),
+                })
+        results["sizes"][str(size)] = median_result(samples)
+        print_result(size, results["sizes"][str(size)])
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions beyond "
+                  f"{args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
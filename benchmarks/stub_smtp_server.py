@@ -0,0 +1,113 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: stub_smtp_server
+# Description: Local sink SMTP server used by the benchmarks. Accepts and
+#              counts every message without delivering it, can add a
+#              per-connection greeting latency to model relay connect and
+#              EHLO cost, a per-message latency to model the relay
+#              accepting DATA, and can drop a connection after a number of
+#              messages to exercise reconnects. With keep_messages unset
+#              the messages are only counted, for runs sending many.
+#
+###########################################################################
+"""StubSMTPServer Class"""
+
+import socketserver
+import threading
+import time
+
+
+class StubSMTPServer:
+    def __init__(self, connect_latency=0.0, drop_after=None,
+                 message_latency=0.0, keep_messages=True):
+        self.connect_latency = connect_latency
+        self.message_latency = message_latency
+        self.drop_after = drop_after
+        self.keep_messages = keep_messages
+        self.connections = 0
+        self.received = 0
+        self.messages = []
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer(
+            ("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True)
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def message_count(self):
+        with self._lock:
+            return self.received
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(f"{line}\r\n".encode())
+
+            def handle(self):
+                with stub._lock:
+                    stub.connections += 1
+                time.sleep(stub.connect_latency)
+                self.reply("220 stub SMTP ready")
+                received = 0
+                data_lines = None
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    if data_lines is not None:
+                        if line.rstrip(b"\r\n") == b".":
+                            time.sleep(stub.message_latency)
+                            with stub._lock:
+                                stub.received += 1
+                                if stub.keep_messages:
+                                    stub.messages.append(
+                                        b"".join(data_lines))
+                            data_lines = None
+                            received += 1
+                            self.reply("250 OK queued")
+                            if stub.drop_after and \
+                                    received >= stub.drop_after:
+                                return
+                        else:
+                            data_lines.append(line)
+                        continue
+
+                    command = line.decode(errors="replace").strip().upper()
+                    if command.startswith(("EHLO", "HELO")):
+                        self.reply("250 stub")
+                    elif command.startswith("DATA"):
+                        data_lines = []
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                    elif command.startswith("QUIT"):
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("250 OK")
+
+        return Handler
@@ -0,0 +1,130 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: stub_sslapi_server
+# Description: Local stand-in for the SSLAPI certificate endpoint used by
+#              the benchmarks. Serves synthetic certificate pages with a
+#              configurable page size, page count and per-request latency,
+#              can answer selected pages, or a random share of the requests
+#              (error_rate), with 503 responses and can serve only
+#              certificates above a certId watermark (delta_param).
+#
+###########################################################################
+"""StubSSLAPIServer Class"""
+
+import datetime
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class StubSSLAPIServer:
+    def __init__(self, total_pages=10, page_size=100, latency=0.05,
+                 cert_id_offset=0, fail_pages=None, retry_after=None,
+                 delta_param=None, error_rate=0.0, seed=0):
+        self.total_pages = total_pages
+        self.page_size = page_size
+        self.latency = latency
+        self.cert_id_offset = cert_id_offset
+        self.fail_pages = dict(fail_pages or {})
+        self.retry_after = retry_after
+        self.delta_param = delta_param
+        self.error_rate = error_rate
+        self.request_count = 0
+        self.error_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(
+            ("127.0.0.1", 0), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}/sslapi/v1/certs"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def build_page(self, page_number, min_cert_id=None):
+        today = datetime.date.today()
+        certs = []
+        last_id = self.cert_id_offset + self.total_pages * self.page_size
+        start_id = self.cert_id_offset
+        if min_cert_id is not None:
+            start_id = max(start_id, min_cert_id + 1)
+        total_pages = max(-(-(last_id - start_id) // self.page_size), 1)
+        first_id = start_id + page_number * self.page_size
+        for cert_id in range(first_id,
+                             min(first_id + self.page_size, last_id)):
+            not_after = today + datetime.timedelta(days=cert_id % 400 - 10)
+            certs.append({
+                "certId": cert_id,
+                "status": "Active",
+                "notAfter": f"{not_after.isoformat()}T23:59:59Z",
+                "subject": f"CN=host{cert_id}.example.com, O=Example, C=US",
+                "sans": [f"host{cert_id}.example.com",
+                         f"alt{cert_id}.example.com"],
+            })
+        return {"totalPages": total_pages, "certs": certs}
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.request_count += 1
+                query = parse_qs(urlparse(self.path).query)
+                page_number = int(query.get("pageNumber", ["0"])[0])
+                time.sleep(stub.latency)
+                with stub._lock:
+                    failures_left = stub.fail_pages.get(page_number, 0)
+                    if failures_left:
+                        stub.fail_pages[page_number] = failures_left - 1
+                    elif stub.error_rate and \
+                            stub._random.random() < stub.error_rate:
+                        failures_left = 1
+                    if failures_left:
+                        stub.error_count += 1
+                if failures_left:
+                    self.send_response(503)
+                    if stub.retry_after is not None:
+                        self.send_header(
+                            "Retry-After", str(stub.retry_after))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                min_cert_id = None
+                if stub.delta_param and stub.delta_param in query:
+                    min_cert_id = int(query[stub.delta_param][0])
+                body = json.dumps(
+                    stub.build_page(page_number, min_cert_id)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
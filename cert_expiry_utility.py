@@ -8,71 +8,213 @@
 ###########################################################################
 """CertExpiryUtility Class"""
 
+import bisect
 import datetime
+import functools
+import numpy as np
 import globalSetting
 from CustomPackage.email_handler import EmailHandler
-import csv
-import os
+from CustomPackage.bookmark_records import BookmarkRecords, NO_DATE, \
+    date_to_ordinal
+from CustomPackage.bookmark_store import get_bookmark_store
+from CustomPackage.distinguished_name import DistinguishedName
+from CustomPackage.run_clock import RunClock
 import logging
 
+# A certificate is in bucket "T" for the smallest threshold T with
+# days until expiry <= T, in "Queued" above the largest threshold. The
+# "0" bucket (expired) is always present.
+DEFAULT_NOTIFICATION_THRESHOLDS = [90, 60, 30, 7, 1]
+NO_TRANSITION = "9999-12-31"
+
 
 class CertExpiryUtility:
     @staticmethod
     def get_cn_from_subject(subject):
-        parts = subject.split(', ')
-        for part in parts:
-            if part.startswith("CN="):
-                return part[3:]
-        return "Unknown"
+        try:
+            common_name = DistinguishedName.get_attribute(subject, "CN")
+        except ValueError:
+            # Not a valid DN, look for a CN the way it was done before.
+            common_name = next((part[3:] for part in subject.split(', ')
+                                if part.startswith("CN=")), None)
+        return "Unknown" if common_name is None else common_name
+
+    @staticmethod
+    @functools.lru_cache(maxsize=8)
+    def compile_notification_thresholds(thresholds):
+        """Return the sorted thresholds, the bucket label of every bisect
+        position and the lower bound (smallest days until expiry) of every
+        bucket a certificate can still leave."""
+        thresholds = sorted({0} | set(thresholds))
+        labels = [str(threshold) for threshold in thresholds] + ["Queued"]
+        lower_bounds = {label: lower + 1 for label, lower
+                        in zip(labels[1:], thresholds)}
+        return thresholds, np.array(labels, dtype=object), lower_bounds
+
+    @staticmethod
+    def get_notification_thresholds():
+        thresholds = globalSetting.confData.get('notification_thresholds')
+        thresholds = [threshold for threshold in thresholds
+                      if isinstance(threshold, int) and
+                      not isinstance(threshold, bool) and threshold >= 0] \
+            if isinstance(thresholds, list) else None
+        if not thresholds:
+            thresholds = DEFAULT_NOTIFICATION_THRESHOLDS
+        return CertExpiryUtility.compile_notification_thresholds(
+            tuple(thresholds))
 
     @staticmethod
     def get_bucket_for_expiry(days_until_expiry):
-        if days_until_expiry >= 91:
-            return "Queued"
-        elif days_until_expiry >= 61:
-            return "90"
-        elif days_until_expiry >= 31:
-            return "60"
-        elif days_until_expiry >= 8:
-            return "30"
-        elif days_until_expiry >= 2:
-            return "7"
-        elif days_until_expiry == 1:
-            return "1"
-        elif days_until_expiry <= 0:
-            return "0"
-        else:
+        if not isinstance(days_until_expiry, (int, float)) or \
+                days_until_expiry != days_until_expiry:
             return "Error"
+        thresholds, labels, _ = \
+            CertExpiryUtility.get_notification_thresholds()
+        return labels[bisect.bisect_left(thresholds, days_until_expiry)]
 
     @staticmethod
-    def is_notification_enabled(bucket):
+    def get_buckets_for_expiry(days_until_expiry):
+        """Vectorized get_bucket_for_expiry for a column of days; missing
+        days map to "Error"."""
+        thresholds, labels, _ = \
+            CertExpiryUtility.get_notification_thresholds()
+        days = np.asarray(days_until_expiry, dtype=float)
+        buckets = labels[np.searchsorted(thresholds, days, side='left')]
+        buckets[np.isnan(days)] = "Error"
+        return buckets
+
+    @staticmethod
+    def get_bucket_lower_bounds():
+        return CertExpiryUtility.get_notification_thresholds()[2]
+
+    @staticmethod
+    def get_disabled_buckets():
+        """Buckets whose notification is turned off in
+        notification_duration."""
         notification_durations = globalSetting.confData.get(
             'notification_duration', {})
-        return notification_durations.get(bucket, True)
+        return sorted(bucket for bucket, enabled
+                      in notification_durations.items() if not enabled)
+
+    @staticmethod
+    def get_schedule_signature():
+        """Identifies the thresholds, the expired_cert_notify_only_once
+        setting and the disabled buckets NextTransition dates were computed
+        with; expired certificates are only due again on every run with
+        "no", certificates in a disabled bucket only on their next bucket
+        change."""
+        thresholds = CertExpiryUtility.get_notification_thresholds()[0]
+        notify_only_once = globalSetting.confData.get(
+            'expired_cert_notify_only_once', 'yes')
+        return ",".join(str(threshold) for threshold in thresholds) + \
+            f";expired_cert_notify_only_once={notify_only_once}" + \
+            ";disabled_buckets=" + \
+            ",".join(CertExpiryUtility.get_disabled_buckets())
+
+    @staticmethod
+    def get_days_until_expiry_for_ordinals(expiry_ordinals):
+        """Vectorized get_days_until_expiry for a column of expiry day
+        ordinals; NO_DATE gives NaN."""
+        days = np.asarray(expiry_ordinals, dtype=float) - \
+            RunClock.today().toordinal()
+        days[np.asarray(expiry_ordinals) == NO_DATE] = np.nan
+        return days
+
+    @staticmethod
+    def get_run_date():
+        return RunClock.today_iso()
+
+    @staticmethod
+    def is_notification_pending(bookmark_data,
+                                expired_cert_notify_only_once):
+        """Mask of the rows of the BookmarkRecords still waiting for an
+        expiry email, the rows get_due_certs returns."""
+        active = ~bookmark_data.is_in('Status', ['Revoked', 'Renewed'])
+        silent = bookmark_data.is_in(
+            'Bucket', ['Queued'] + CertExpiryUtility.get_disabled_buckets())
+        notify_again = bookmark_data.is_in('Bucket', ['0']) if \
+            expired_cert_notify_only_once == "no" else False
+        return active & ~silent & \
+            (bookmark_data.is_in('Notified', ['N']) | notify_again)
+
+    @staticmethod
+    def get_next_transitions(bookmark_data, run_date):
+        """Next date, as a day ordinal, on which each row of the
+        BookmarkRecords needs processing: the run date while its
+        notification is pending, otherwise the first date it can enter its
+        next bucket, the day its days until expiry drop below the lower
+        bound of its bucket. Rows with an unparsable expiry date stay
+        due."""
+        expiry_dates = bookmark_data.dates['ExpiryDate'].astype(np.int64)
+        lower_bounds = CertExpiryUtility.get_bucket_lower_bounds()
+        bucket_codes = bookmark_data.codes['Bucket']
+        # Lower bound of every bucket code, 0 for a bucket it never
+        # leaves.
+        code_bounds = np.zeros(
+            int(bucket_codes.max()) + 1 if len(bucket_codes) else 0,
+            dtype=np.int64)
+        for bucket, lower_bound in lower_bounds.items():
+            code = BookmarkRecords.vocabularies['Bucket'].codes.get(bucket)
+            if code is not None and code < len(code_bounds):
+                code_bounds[code] = lower_bound
+        row_bounds = code_bounds[bucket_codes]
+        next_transitions = np.where(
+            row_bounds > 0, np.maximum(expiry_dates - (row_bounds - 1), 1),
+            date_to_ordinal(NO_TRANSITION))
+        next_transitions[expiry_dates == NO_DATE] = NO_DATE
+        pending = CertExpiryUtility.is_notification_pending(
+            bookmark_data, globalSetting.confData.get(
+                'expired_cert_notify_only_once', 'yes'))
+        next_transitions[pending] = date_to_ordinal(run_date)
+        return next_transitions.astype(np.int32)
 
     @staticmethod
     def get_days_until_expiry(expiry_date_str):
+        """Calendar days between the run date and the expiry date of an
+        ISO-8601 date or timestamp, None if it cannot be parsed."""
         if not expiry_date_str:
             return None
         try:
-            expiry_date = datetime.datetime.strptime(
-                expiry_date_str.split('T')[0], "%Y-%m-%d")
-            current_date = datetime.datetime.now()
-            time_difference = expiry_date - current_date
-            days_until_expiry = time_difference.days
-            return days_until_expiry
+            expiry_date = CertExpiryUtility.parse_expiry_date(
+                expiry_date_str.split('T')[0])
         except ValueError:
             return None
+        return (expiry_date - RunClock.today()).days
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def parse_expiry_date(expiry_date_str):
+        try:
+            return datetime.date.fromisoformat(expiry_date_str)
+        except ValueError:
+            return datetime.datetime.strptime(
+                expiry_date_str, "%Y-%m-%d").date()
 
     @staticmethod
-    def check_expiry_and_send_email():
+    def check_expiry_and_send_email(bookmark_store=None):
         bookmark_notified_certs = []
-        bookmark_data = CertExpiryUtility.load_bookmark_data()
+        bookmark_data = CertExpiryUtility.load_bookmark_data(bookmark_store)
         if bookmark_data is None:
             return
+        due_certs = CertExpiryUtility.get_due_certs(bookmark_data)
+
+        # Only certificates whose email was accepted by the SMTP server are
+        # bookmarked as notified, the others are retried on the next run.
+        for cert_info in EmailHandler.trigger_emails_for_cert_expiry(
+                due_certs):
+            bookmark_notified_certs.append(cert_info)
+            cert_info["Notified"] = "Y"
+        return bookmark_notified_certs
+
+    @staticmethod
+    def get_due_certs(bookmark_data):
+        """Return the cert_infos of bookmark_data, a dict of CID to
+        cert_info, waiting for an expiry email."""
         expired_cert_notify_only_once = globalSetting.confData.get(
             'expired_cert_notify_only_once', 'yes')
+        disabled_buckets = set(CertExpiryUtility.get_disabled_buckets())
 
+        due_certs = []
         for cid, cert_info in bookmark_data.items():
             status = cert_info.get('Status')
             bucket = cert_info.get('Bucket')
@@ -81,27 +223,22 @@ class CertExpiryUtility:
             elif bucket == "Queued":
                 continue
 
-            if CertExpiryUtility.is_notification_enabled(bucket):
+            if bucket not in disabled_buckets:
                 if cert_info["Notified"] == "N":
-                    EmailHandler.trigger_email_for_cert_expiry(cert_info)
-                    bookmark_notified_certs.append(cert_info)
-                    cert_info["Notified"] = "Y"
+                    due_certs.append(cert_info)
                 elif cert_info["Notified"] == "Y" and bucket == "0" and \
                         expired_cert_notify_only_once == "no":
-                    EmailHandler.trigger_email_for_cert_expiry(cert_info)
-                    bookmark_notified_certs.append(cert_info)
-        return bookmark_notified_certs
+                    due_certs.append(cert_info)
+        return due_certs
 
     @staticmethod
-    def load_bookmark_data():
-        bookmark_data = {}
-        bookmark_path = "bookmark.csv"
-        if os.path.exists(bookmark_path):
-            with open(bookmark_path, mode='r') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    bookmark_data[row["CID"]] = row
-            return bookmark_data
+    def load_bookmark_data(bookmark_store=None):
+        if bookmark_store is None:
+            bookmark_store = get_bookmark_store()
+        if bookmark_store.exists():
+            # Only the certificates due on the run date can need an email.
+            return bookmark_store.load_records(
+                CertExpiryUtility.get_run_date())
         else:
             logging.info(
                 "Bookmark not available, email notification for cert expiry"
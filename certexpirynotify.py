@@ -18,32 +18,71 @@
 ###########################################################################
 
 
+import argparse
 import globalSetting
 import logging as Logging
-from CustomPackage import GetCertificateData, BookmarkHandler
-from CustomPackage import config_reader, cert_expiry_logger
-from CustomPackage import EmailHandler
-from cert_expiry_utility import CertExpiryUtility
+from CustomPackage import config_reader, cert_expiry_logger, RunMetrics
 import sys
 
 
-def CertExpiryNotification():
+def CertExpiryNotification(execution_mode=None):
+    # Imported on first use, so a run ending on an invalid config does not
+    # load numpy and requests.
+    from CustomPackage import GetCertificateData, BookmarkHandler
+    from CustomPackage import EmailHandler, SyncWatermark, RunClock
+    from CustomPackage import AsyncCertExpiryEngine
+    from cert_expiry_utility import CertExpiryUtility
+
     try:
-        EmailHandler.check_for_email_template()
-        all_certificate_data = GetCertificateData.\
-            get_cert_data_for_configured_endpoints()
-        BookmarkHandler.populate_bookmark(all_certificate_data)
-        BookmarkHandler.move_certificates_to_new_bucket()
+        # Every step of the run computes days until expiry against the
+        # same date.
+        RunClock.start()
+        with RunMetrics.phase("template_check"):
+            EmailHandler.check_for_email_template()
+        # The bookmark is loaded once, updated in memory by every step and
+        # committed once at the end of the run.
+        with RunMetrics.phase("bookmark_load"):
+            bookmark = BookmarkHandler.open_run_context()
 
         internal_email_template_missing = \
             globalSetting.internal_email_template_missing
         external_email_template_missing = \
             globalSetting.external_email_template_missing
+        notify = not (internal_email_template_missing or
+                      external_email_template_missing)
+
+        if AsyncCertExpiryEngine.is_selected(execution_mode):
+            RunMetrics.set_execution_mode("async")
+            # Rebucketing only concerns the certificates already
+            # bookmarked, so it runs first and their emails are sent while
+            # the pages are still arriving.
+            if bookmark.exists():
+                with RunMetrics.phase("rebucket"):
+                    BookmarkHandler.move_certificates_to_new_bucket(
+                        bookmark)
+            # Fetch, populate and notify overlap on the event loop.
+            with RunMetrics.phase("fetch_populate_notify"):
+                bookmark_notified_certs = AsyncCertExpiryEngine.run(
+                    bookmark, notify)
+        else:
+            # Certificates are streamed into the bookmark while the
+            # remaining pages are still being fetched, so populate
+            # includes the fetch.
+            all_certificate_data = GetCertificateData.iter_certificates()
+            try:
+                with RunMetrics.phase("populate"):
+                    BookmarkHandler.populate_bookmark(
+                        all_certificate_data, bookmark)
+            finally:
+                all_certificate_data.close()
+            with RunMetrics.phase("rebucket"):
+                BookmarkHandler.move_certificates_to_new_bucket(bookmark)
+            with RunMetrics.phase("notify"):
+                bookmark_notified_certs = \
+                    CertExpiryUtility.check_expiry_and_send_email(
+                        bookmark) if notify else None
 
-        if not (internal_email_template_missing or
-                external_email_template_missing):
-            bookmark_notified_certs = \
-                CertExpiryUtility.check_expiry_and_send_email()
+        if notify:
             if not bookmark_notified_certs:
                 logging.info("No certificates to notify.")
             else:
@@ -51,54 +90,82 @@ def CertExpiryNotification():
                              " been notified successfully.")
                 cids_to_update = [cert['CID']
                                   for cert in bookmark_notified_certs]
-                BookmarkHandler.update_notified_cert_entry(cids_to_update)
+                BookmarkHandler.update_notified_cert_entry(
+                    cids_to_update, bookmark)
+
+        with RunMetrics.phase("reschedule"):
+            BookmarkHandler.update_next_transitions(bookmark)
+        with RunMetrics.phase("bookmark_write"):
+            BookmarkHandler.commit_run_context(bookmark)
+        SyncWatermark.update_watermarks(
+            GetCertificateData.endpoint_statistics)
+        RunMetrics.mark_succeeded()
 
     except Exception as e:
         logging.error("Exception during Cert Expiry Notification "
                       f"processing. Exception : {e}")
         logging.info('Certificate Expiry Notification tool ended')
         sys.exit()
+    finally:
+        EmailHandler.close_smtp_sender()
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Certificate Expiry Notification Job")
+    parser.add_argument(
+        "--async", dest="execution_mode", action="store_const",
+        const="async", help="fetch and notify on an asyncio event loop "
+        "instead of the execution_mode config parameter")
+    arguments = parser.parse_args()
+
     globalSetting.init()
     logging = cert_expiry_logger.configure_logging(Logging.INFO)
     logging.info(
         'Certificate Expiry Notification Job backend process has started')
     logging.info('Logging started for Certificate Expiry Notification tool'
                  f' {globalSetting.version} ')
+    RunMetrics.start()
 
+    # The run report is written on every exit, a run ending on an error
+    # reports a failed status.
     try:
-        config_data = config_reader.config_load_json()
-        if not config_data:
-            logging.error("Failed to load configuration data.")
-            logging.info('Certificate Expiry Notification tool ended')
-            sys.exit()
-    except Exception as e:
-        logging.error("An error occurred. "
-                      f"Exception during loading configuration file: {e}")
-        logging.info('Certificate Expiry Notification tool ended')
-        sys.exit()
+        with RunMetrics.phase("config_load"):
+            try:
+                config_data = config_reader.config_load_json()
+                if not config_data:
+                    logging.error("Failed to load configuration data.")
+                    logging.info('Certificate Expiry Notification tool '
+                                 'ended')
+                    sys.exit()
+            except Exception as e:
+                logging.error("An error occurred. Exception during loading "
+                              f"configuration file: {e}")
+                logging.info('Certificate Expiry Notification tool ended')
+                sys.exit()
 
-    try:
-        config_data = config_reader.processing_json_load()
-        if not config_data:
-            logging.error("Failed to process configuration data. "
-                          "Exiting the Cert Expiry processing.")
-            logging.info('Certificate Expiry Notification tool ended')
-            sys.exit()
-    except Exception as e:
-        logging.error(
-            "An error occurred, Exception during processing"
-            f"configuration file: " f"{e}")
-        logging.info('Certificate Expiry Notification tool ended')
-        sys.exit()
+            try:
+                config_data = config_reader.processing_json_load()
+                if not config_data:
+                    logging.error("Failed to process configuration data. "
+                                  "Exiting the Cert Expiry processing.")
+                    logging.info('Certificate Expiry Notification tool '
+                                 'ended')
+                    sys.exit()
+            except Exception as e:
+                logging.error(
+                    "An error occurred, Exception during processing"
+                    f"configuration file: " f"{e}")
+                logging.info('Certificate Expiry Notification tool ended')
+                sys.exit()
 
-    debug_log_level = globalSetting.confData.get('debugLogLevel', 0)
-    if debug_log_level == 1:
-        logging = cert_expiry_logger.configure_logging(Logging.DEBUG)
-    else:
-        logging = cert_expiry_logger.configure_logging(Logging.INFO)
+        debug_log_level = globalSetting.confData.get('debugLogLevel', 0)
+        if debug_log_level == 1:
+            logging = cert_expiry_logger.configure_logging(Logging.DEBUG)
+        else:
+            logging = cert_expiry_logger.configure_logging(Logging.INFO)
 
-    CertExpiryNotification()
-    logging.info('Certificate Expiry Notification tool ended')
+        CertExpiryNotification(arguments.execution_mode)
+        logging.info('Certificate Expiry Notification tool ended')
+    finally:
+        RunMetrics.write_reports()
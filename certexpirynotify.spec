@@ -1,12 +1,21 @@
 # -*- mode: python ; coding: utf-8 -*-
 
+# The handler singletons of CustomPackage are imported by name on first
+# access (CustomPackage._SINGLETONS), which the analysis cannot follow.
+hiddenimports = [
+    'CustomPackage.get_certificate_data', 'CustomPackage.bookmark_handler',
+    'CustomPackage.ReadCertExpiryConfig', 'CustomPackage.email_handler',
+    'CustomPackage.MessageDirectory', 'CustomPackage.sync_watermark',
+    'CustomPackage.run_clock', 'CustomPackage.async_engine',
+    'CustomPackage.run_metrics', 'CertExpiryLogger',
+]
 
 a = Analysis(
     ['certexpirynotify.py'],
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    hiddenimports=hiddenimports,
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,75 @@
+# -*- mode: python ; coding: utf-8 -*-
+# Startup-optimized variant of certexpirynotify.spec: a onedir bundle, so
+# a run does not unpack the archive into a temporary directory first, and
+# without pandas, the test suites and the pyarrow components no run
+# imports. Build with:
+#   pyinstaller certexpirynotify_onedir.spec
+# and deploy the whole dist/certexpirynotify directory.
+
+# The handler singletons of CustomPackage are imported by name on first
+# access (CustomPackage._SINGLETONS), which the analysis cannot follow.
+hiddenimports = [
+    'CustomPackage.get_certificate_data', 'CustomPackage.bookmark_handler',
+    'CustomPackage.ReadCertExpiryConfig', 'CustomPackage.email_handler',
+    'CustomPackage.MessageDirectory', 'CustomPackage.sync_watermark',
+    'CustomPackage.run_clock', 'CustomPackage.async_engine',
+    'CustomPackage.run_metrics', 'CertExpiryLogger',
+]
+
+excludes = [
+    # Test suites and build tooling shipped inside the packages.
+    'numpy.tests', 'numpy.f2py', 'numpy.distutils', 'pyarrow.tests',
+    'pytest', 'setuptools',
+    # Optional dependencies the job never uses. pandas is only referenced
+    # by pyarrow, which works without it.
+    'pandas', 'matplotlib', 'scipy', 'jinja2', 'openpyxl', 'xlrd',
+    'sqlalchemy', 'IPython', 'tkinter',
+    # pyarrow components beyond the Arrow IPC files of the inventory
+    # snapshot.
+    'pyarrow.parquet', 'pyarrow._parquet', 'pyarrow.dataset',
+    'pyarrow._dataset', 'pyarrow.flight', 'pyarrow._flight',
+    'pyarrow.orc', 'pyarrow._orc', 'pyarrow.substrait', 'pyarrow.cuda',
+    'pyarrow._s3fs', 'pyarrow._gcsfs', 'pyarrow._hdfs', 'pyarrow._azurefs',
+]
+
+a = Analysis(
+    ['certexpirynotify.py'],
+    pathex=[],
+    binaries=[],
+    datas=[],
+    hiddenimports=hiddenimports,
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=excludes,
+    noarchive=False,
+)
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='certexpirynotify',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=False,
+    console=True,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
+
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='certexpirynotify',
+)
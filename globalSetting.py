@@ -11,8 +11,22 @@ def init():
     global smtp_server, smtp_port
     global api_key, debugLogLevel, expired_cert_notify_only_once
     global cert_endpoints, notification_duration, max_retries, version
+    global notification_thresholds, run_date
+    global max_concurrent_requests, http_pool_size
+    global connect_timeout, read_timeout
+    global retry_backoff_base, retry_backoff_max, retry_time_budget
+    global incremental_sync, incremental_sync_param, full_sync_interval_days
+    global bookmark_backend
+    global smtp_pool_size, smtp_timeout, smtp_max_messages_per_connection
+    global smtp_batch_size, smtp_workers, smtp_max_messages_per_second
+    global email_delivery_mode
+    global inventory_snapshot, inventory_snapshot_directory
+    global inventory_snapshot_retention, inventory_snapshot_compression
+    global replay_snapshot, execution_mode
+    global run_report_path, metrics_textfile_path
     global confData
     global internal_email_template_missing, external_email_template_missing
+    global digest_email_template_missing
 
     sender_email = ""
     receiver_email = ""
@@ -34,8 +48,37 @@ def init():
         "60": True,
         "90": True
     }
+    notification_thresholds = [90, 60, 30, 7, 1]
+    run_date = ""
     confData = {}
     max_retries = 3
+    max_concurrent_requests = 4
+    http_pool_size = 4
+    connect_timeout = 10
+    read_timeout = 60
+    retry_backoff_base = 5
+    retry_backoff_max = 300
+    retry_time_budget = 1800
+    incremental_sync = False
+    incremental_sync_param = ""
+    full_sync_interval_days = 7
+    bookmark_backend = "csv"
+    smtp_pool_size = 1
+    smtp_timeout = 30
+    smtp_max_messages_per_connection = 100
+    smtp_batch_size = 50
+    smtp_workers = 1
+    smtp_max_messages_per_second = 0
+    email_delivery_mode = "per_cert"
+    inventory_snapshot = True
+    inventory_snapshot_directory = "snapshots"
+    inventory_snapshot_retention = 7
+    inventory_snapshot_compression = "zstd"
+    replay_snapshot = ""
+    execution_mode = "sync"
+    run_report_path = "run_report.json"
+    metrics_textfile_path = "cert_expiry_notification.prom"
     version = "[v1.0]"
     internal_email_template_missing = False
     external_email_template_missing = False
+    digest_email_template_missing = False
@@ -0,0 +1,74 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: test_async_certificate_fetcher
+# Description: Tests of AsyncCertificateFetcher against the local stub
+#              SSLAPI server of the benchmarks.
+#
+#   Usage: python -m unittest discover tests
+#
+###########################################################################
+
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, "benchmarks"))
+
+import globalSetting  # noqa: E402
+from CustomPackage.async_certificate_fetcher import \
+    AsyncCertificateFetcher, aiohttp  # noqa: E402
+from CustomPackage.email_handler import EmailHandler  # noqa: E402
+from stub_sslapi_server import StubSSLAPIServer  # noqa: E402
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class AsyncCertificateFetcherTest(unittest.TestCase):
+    def setUp(self):
+        self.working_directory = os.getcwd()
+        os.chdir(tempfile.mkdtemp(prefix="cert_expiry_test_"))
+        self.previous_server = StubSSLAPIServer(
+            total_pages=3, page_size=10, latency=0.01).start()
+        self.current_server = StubSSLAPIServer(
+            total_pages=50, page_size=10, latency=0.2,
+            cert_id_offset=5000).start()
+        globalSetting.init()
+        globalSetting.confData = {
+            "api_key": "test",
+            "cert_endpoints": {
+                "previous_cert_endpoint": self.previous_server.url,
+                "current_cert_endpoint": self.current_server.url},
+            "max_retries": 2,
+            "retry_backoff_base": 0.01,
+            "max_concurrent_requests": 4,
+            "inventory_snapshot": False,
+        }
+
+    def tearDown(self):
+        self.previous_server.stop()
+        self.current_server.stop()
+        os.chdir(self.working_directory)
+
+    def test_consumer_error_stops_every_endpoint(self):
+        async def consume_page(certs):
+            if certs and certs[0]["certId"] < 5000:
+                raise ValueError("ingest failed")
+
+        async def run():
+            try:
+                await AsyncCertificateFetcher().fetch_all(consume_page)
+            finally:
+                # The engine keeps the event loop running after the error
+                # while its email senders shut down.
+                await asyncio.sleep(1)
+
+        with mock.patch.object(
+                EmailHandler, "trigger_internal_email") as internal_email:
+            with self.assertRaisesRegex(ValueError, "ingest failed"):
+                asyncio.run(run())
+        internal_email.assert_not_called()
@@ -0,0 +1,68 @@
+##########################################################################
+#
+# Copyright (c) 2024 by Cisco Systems, Inc.
+# FileName: test_get_certificate_data
+# Description: Tests of GetCertificateData page fetching against the local
+#              stub SSLAPI server of the benchmarks.
+#
+#   Usage: python -m unittest discover tests
+#
+###########################################################################
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, "benchmarks"))
+
+import globalSetting  # noqa: E402
+from CustomPackage.get_certificate_data import GetCertificateData  # noqa
+from stub_sslapi_server import StubSSLAPIServer  # noqa: E402
+
+
+class GetCertificateDataTest(unittest.TestCase):
+    def setUp(self):
+        self.working_directory = os.getcwd()
+        os.chdir(tempfile.mkdtemp(prefix="cert_expiry_test_"))
+        self.server = StubSSLAPIServer(
+            total_pages=200, page_size=10, latency=0.005).start()
+        globalSetting.init()
+        globalSetting.confData = {
+            "api_key": "test",
+            "cert_endpoints": {"current_cert_endpoint": self.server.url},
+            "max_retries": 0,
+            "max_concurrent_requests": 4,
+            "inventory_snapshot": False,
+            "sender_email": "",
+            "internal_team_email": "",
+            "smtp_server": "",
+            "smtp_port": 25,
+        }
+        globalSetting.internal_email_template_missing = True
+
+    def tearDown(self):
+        self.server.stop()
+        os.chdir(self.working_directory)
+
+    def test_pages_in_order(self):
+        certs = GetCertificateData.get_cert_data_for_configured_endpoints()
+        cert_ids = [cert["certId"] for cert in certs]
+        self.assertEqual(cert_ids, list(range(2000)))
+        self.assertEqual(self.server.request_count, 200)
+
+    def test_stalled_consumer_pauses_fetching(self):
+        certificates = GetCertificateData.iter_certificates()
+        try:
+            next(certificates)
+            # Long enough for the stub to serve every page if fetching
+            # did not pause.
+            time.sleep(2)
+            served = self.server.request_count
+        finally:
+            certificates.close()
+        # The page window of the endpoint plus the pages of the queue.
+        self.assertLess(served, 20)